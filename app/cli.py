@@ -0,0 +1,68 @@
+"""
+Maintenance commands
+
+Usage:
+    python -m app.cli migrate
+    python -m app.cli backfill-items [--batch-size 500] [--rebuild]
+    python -m app.cli rebuild-rollups
+    python -m app.cli verify-rollups
+"""
+import argparse
+import sys
+from app.database import SessionLocal
+from app.schema import migrate as migrate_schema
+from app.services.item_service import ItemService
+from app.services.rollup_service import RollupService
+
+def migrate(args):
+    changes = migrate_schema()
+    for change in changes:
+        print(change)
+    print(f"Schema up to date ({len(changes)} changes)")
+
+def backfill_items(args):
+    with SessionLocal() as db:
+        count = ItemService.backfill(db, batch_size=args.batch_size, rebuild=args.rebuild)
+    print(f"Wrote line items for {count} invoices")
+
+def rebuild_rollups(args):
+    with SessionLocal() as db:
+        stores, products = RollupService.rebuild(db)
+    print(f"Rebuilt {stores} store/day rows and {products} product/month rows")
+
+def verify_rollups(args):
+    with SessionLocal() as db:
+        problems = RollupService.verify(db)
+    for problem in problems:
+        print(problem)
+    if problems:
+        print(f"{len(problems)} rollup rows out of date; run rebuild-rollups")
+        sys.exit(1)
+    print("Rollups match invoices")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_command = commands.add_parser("migrate", help="create missing tables, columns and indexes")
+    migrate_command.set_defaults(handler=migrate)
+
+    backfill = commands.add_parser("backfill-items", help="populate invoice_items from invoice details JSON")
+    backfill.add_argument("--batch-size", type=int, default=500)
+    backfill.add_argument("--rebuild", action="store_true", help="rebuild items for every invoice, not just missing ones")
+    backfill.set_defaults(handler=backfill_items)
+
+    rebuild = commands.add_parser("rebuild-rollups", help="recompute the summary rollup tables from scratch")
+    rebuild.set_defaults(handler=rebuild_rollups)
+
+    verify = commands.add_parser("verify-rollups", help="check the rollup tables against the invoices")
+    verify.set_defaults(handler=verify_rollups)
+
+    args = parser.parse_args()
+    # The other commands need an up-to-date schema too, e.g. invoice_items on an older database
+    if args.handler is not migrate:
+        migrate_schema()
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,120 @@
 from pydantic_settings import BaseSettings
+from typing import Optional
 
 class Settings(BaseSettings):
-    database_url: str
+    database_url: str = "sqlite:///./test.db"
     gemini_api_key: str
     gemini_flash_3: str
     upload_dir: str = "./uploads"
+    max_upload_bytes: int = 25 * 1024 * 1024
+    # Whole request body limit for POST /invoices/upload/batch; other requests get max_upload_bytes
+    max_batch_upload_bytes: int = 200 * 1024 * 1024
     report_dir: str = "./reports"
+
+    # Connection pool per engine (not used for in-memory SQLite). Recycle is in seconds, -1 to never
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    # URL for get_async_db; by default DATABASE_URL with the aiosqlite or asyncpg driver
+    database_async_url: Optional[str] = None
+    # SQLite runs in WAL mode; these apply to every connection
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_busy_timeout_ms: int = 5000
+    # Bring the schema up to date on startup; disable when migrating at deploy time instead
+    auto_migrate: bool = True
+
+    # Extraction backend: "gemini", or "fake" for load tests without the API.
+    # The fake returns realistic invoices after a lognormal delay with the given median
+    extraction_backend: str = "gemini"
+    fake_latency_ms: float = 1500.0
+    fake_latency_sigma: float = 0.5  # 0 for a constant delay
+    fake_error_rate: float = 0.0
+    fake_seed: int = 0
+
+    # Maximum number of Gemini calls in flight per worker process
+    gemini_max_concurrency: int = 16
+    # Quota per worker process (0 disables a limit); tokens are estimated per call, then corrected
+    gemini_rpm_limit: int = 1000
+    gemini_tpm_limit: int = 1_000_000
+    gemini_tokens_per_call: int = 2000
+    # Per-attempt deadline and retries of transient errors (429, 5xx, timeouts)
+    gemini_timeout_seconds: float = 60.0
+    gemini_max_retries: int = 3
+    gemini_retry_base_delay: float = 1.0
+    gemini_retry_max_delay: float = 30.0
+    # Consecutive transient failures that open the circuit (0 disables), and how long it stays open
+    gemini_breaker_failures: int = 5
+    gemini_breaker_reset_seconds: float = 30.0
+    # Race a second request against calls still running after this many seconds (unset disables)
+    gemini_hedge_after_seconds: Optional[float] = None
+    # Micro-batching: uploads arriving within this window share one multi-image request
+    # (0 disables). A batch is sent early once it reaches max images or max estimated
+    # tokens; PDFs and images over max bytes always get a request of their own.
+    gemini_batch_window_ms: float = 0.0
+    gemini_batch_max_images: int = 8
+    gemini_batch_max_tokens: int = 16_000
+    gemini_batch_max_image_bytes: int = 512 * 1024
+
+    # Near-duplicate cache: max Hamming distance between 64-bit perceptual hashes
+    # for an upload to be served from an existing invoice (0 disables it). Off by
+    # default: different receipts printed from the same store template often come
+    # within a few bits of each other, and a match serves the other invoice's data.
+    near_duplicate_threshold: int = 0
+
+    # In-memory file_hash lookups. A counting Bloom filter of stored hashes (about
+    # 10 bytes per invoice at 1% false positives) answers most misses without a query;
+    # it picks up invoices stored by other processes at most every refresh interval.
+    hash_filter_capacity: int = 1_000_000
+    hash_filter_error_rate: float = 0.01
+    hash_filter_refresh_seconds: float = 1.0
+    # Recently looked-up invoices (0 disables); the TTL bounds staleness across processes
+    response_cache_size: int = 2048
+    response_cache_ttl_seconds: float = 60.0
+
+    # GET /invoices/search: share of a query's trigrams (0-1) a store or product name must
+    # contain to match. The index is held in memory and picks up invoices stored by
+    # other processes at most every refresh interval.
+    search_min_score: float = 0.6
+    search_refresh_seconds: float = 1.0
+
+    # Concurrent uploads of the same new file across worker processes: the worker extracting
+    # it holds a lease in upload_claims and the others poll until it is released. The lease
+    # only expires if its worker dies mid-extraction, so keep it above the slowest extraction.
+    # 0 disables the leases (a single worker process still coalesces in memory).
+    upload_claim_lease_seconds: float = 300.0
+    upload_claim_poll_seconds: float = 0.25
+
+    # Image pre-processing before extraction: off, quality, balanced or compact.
+    # The optional overrides replace individual values of the chosen preset.
+    preprocess_preset: str = "balanced"
+    preprocess_max_edge: Optional[int] = None
+    preprocess_grayscale: Optional[bool] = None
+    preprocess_autocrop: Optional[bool] = None
+    preprocess_quality: Optional[int] = None
+    preprocess_target_bytes: Optional[int] = None
+
+    # PDF ingestion: pages extracted in parallel per document, and the page limit
+    pdf_page_concurrency: int = 4
+    pdf_max_pages: int = 200
+
+    # Disk budget for cached reports under report_dir/cache (0 disables the cache)
+    report_cache_max_bytes: int = 512 * 1024 * 1024
+    # Worker processes rendering PDF reports
+    report_workers: int = 2
+
+    # Rows fetched per round trip by GET /invoices/export; also the Parquet row group size
+    export_batch_size: int = 10000
+
+    # Extraction job queue (POST /jobs/upload)
+    job_workers: int = 4
+    job_poll_interval: float = 1.0
+    job_timeout_seconds: int = 600  # Running jobs older than this are requeued (or failed)
+    job_max_attempts: int = 3
+
+    # Add a Server-Timing header with per-stage durations to every response
+    server_timing_header: bool = False
     
     class Config:
         env_file = ".env"
@@ -1,15 +1,59 @@
-import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url, URL
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
 
-# Get the URL from the environment (defaulting to SQLite for local dev)
-DATABASE_URL = os.getenv(settings.database_url, "sqlite:///./test.db")
+# Async drivers used for get_async_db when DATABASE_ASYNC_URL isn't set
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg"
+}
 
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+DATABASE_URL = settings.database_url
 
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+def _is_sqlite(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite"
+
+def _engine_options(url: URL) -> dict:
+    if _is_sqlite(url):
+        options = {"connect_args": {"check_same_thread": False}}
+        if url.database in (None, "", ":memory:"):
+            # In-memory databases live in a single connection; there is no pool to size
+            return options
+    else:
+        options = {}
+    return {
+        **options,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping
+    }
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Per-connection SQLite settings
+
+    WAL lets readers keep reading while the ingest path writes, and
+    synchronous=NORMAL is durable across application crashes in WAL mode.
+    busy_timeout makes a second writer wait for the lock instead of failing.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+def _configure(sync_engine):
+    if _is_sqlite(sync_engine.url):
+        event.listen(sync_engine, "connect", _set_sqlite_pragmas)
+
+engine = create_engine(DATABASE_URL, **_engine_options(make_url(DATABASE_URL)))
+_configure(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -18,4 +62,39 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def async_database_url() -> URL:
+    """DATABASE_ASYNC_URL, or DATABASE_URL with its driver swapped for an async one"""
+    if settings.database_async_url:
+        return make_url(settings.database_async_url)
+    url = make_url(DATABASE_URL)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for {backend}; set DATABASE_ASYNC_URL")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+_async_engine = None
+_async_session = None
+
+def get_async_engine():
+    """Engine for async routes, created on first use so the async driver is only needed if used"""
+    global _async_engine, _async_session
+    if _async_engine is None:
+        url = async_database_url()
+        _async_engine = create_async_engine(url, **_engine_options(url))
+        _configure(_async_engine.sync_engine)
+        _async_session = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_engine
+
+async def get_async_db():
+    """Async counterpart of get_db: queries are awaited on the event loop, no threadpool hop"""
+    get_async_engine()
+    async with _async_session() as db:
+        yield db
+
+async def dispose_engines():
+    """Close pooled connections on shutdown"""
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    engine.dispose()
@@ -1,21 +1,55 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine, Base
-from app.routers import invoice, report
+from fastapi.responses import PlainTextResponse
+from app.database import SessionLocal, dispose_engines
+from app.routers import invoice, job, report
+from app.schema import migrate
+from app.utils.file_handler import MULTIPART_OVERHEAD_BYTES, UploadLimitMiddleware
+from app.utils.metrics import (
+    HTTP_IN_FLIGHT, HTTP_REQUESTS, HTTP_REQUEST_SECONDS, collect_timings, render as render_metrics, server_timing
+)
+import asyncio
 import os
+import time
 from app.config import settings
 
-# Create tables
-Base.metadata.create_all(bind=engine)
-
-# Create directories
-os.makedirs(settings.upload_dir, exist_ok=True)
-os.makedirs(settings.report_dir, exist_ok=True)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create directories
+    os.makedirs(settings.upload_dir, exist_ok=True)
+    os.makedirs(settings.report_dir, exist_ok=True)
+    # Create missing tables, columns and indexes (or run `python -m app.cli migrate` at deploy time)
+    if settings.auto_migrate:
+        await run_in_threadpool(migrate)
+    # Load file hashes for cache lookups and perceptual hashes for near-duplicate detection
+    await run_in_threadpool(invoice.invoice_service.warm_indexes)
+    # Searches wait for this; nothing else needs it, so it doesn't hold up startup
+    search_warmup = asyncio.create_task(run_in_threadpool(invoice.invoice_service.warm_search_index))
+    # Start extraction job workers
+    job.job_queue.start()
+    # Report jobs abandoned by a previous process will never finish
+    with SessionLocal() as db:
+        await run_in_threadpool(report.report_jobs.fail_stale_jobs, db)
+    yield
+    await job.job_queue.stop()
+    await search_warmup
+    report.report_jobs.shutdown()
+    await dispose_engines()
 
 app = FastAPI(
     title="Invoice Processing API",
     description="AI-powered invoice processing using Gemini Vision API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
+)
+
+# Refuse oversized uploads before the multipart parser spools them
+app.add_middleware(
+    UploadLimitMiddleware,
+    max_bytes=settings.max_upload_bytes + MULTIPART_OVERHEAD_BYTES,
+    path_limits={"/invoices/upload/batch": settings.max_batch_upload_bytes}
 )
 
 # CORS
@@ -27,8 +61,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    with HTTP_IN_FLIGHT.track(), collect_timings() as timings:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - started
+
+    # Label by route template, not raw path, to keep the number of series bounded
+    route = request.scope.get("route")
+    path = route.path if route is not None else "unmatched"
+    HTTP_REQUESTS.inc(method=request.method, route=path, status=response.status_code)
+    HTTP_REQUEST_SECONDS.observe(elapsed, method=request.method, route=path)
+
+    if settings.server_timing_header:
+        response.headers["Server-Timing"] = server_timing({**timings, "total": elapsed})
+    return response
+
 # Include routers
 app.include_router(invoice.router)
+app.include_router(job.router)
 app.include_router(report.router)
 
 @app.get("/")
@@ -39,11 +91,18 @@ def root():
         "endpoints": {
             "docs": "/docs",
             "upload_invoice": "POST /invoices/upload",
+            "upload_invoice_job": "POST /jobs/upload",
             "list_invoices": "GET /invoices/",
-            "generate_report": "POST /reports/generate"
+            "generate_report": "POST /reports/generate",
+            "metrics": "GET /metrics"
         }
     }
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, Date, JSON, DateTime, Index
+from sqlalchemy import Column, Integer, String, Float, Date, JSON, DateTime, Index, ForeignKey
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -12,10 +13,46 @@ class Invoice(Base):
     details = Column(JSON) 
     file_path = Column(String)
     file_hash = Column(String(64), unique=True, index=True)  # For detecting duplicates
+    perceptual_hash = Column(String(16))  # For detecting near-duplicates (re-scans, re-compressions)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # Normalized copy of details, rebuilt whenever details change
+    items = relationship(
+        "InvoiceItem",
+        back_populates="invoice",
+        cascade="all, delete-orphan",
+        order_by="InvoiceItem.line_no"
+    )
+
     # Create index for faster duplicate checking
     __table_args__ = (
         Index('idx_file_hash', 'file_hash'),
-    )
\ No newline at end of file
+        # Keyset pagination of GET /invoices/, newest first, optionally within one store
+        Index('idx_invoice_date_id', 'invoice_date', 'id'),
+        Index('idx_invoice_store_date_id', 'store_name', 'invoice_date', 'id'),
+    )
+
+class InvoiceItem(Base):
+    """One line of an invoice's details, stored as columns so reports can aggregate in SQL"""
+    __tablename__ = "invoice_items"
+
+    id = Column(Integer, primary_key=True)
+    invoice_id = Column(Integer, ForeignKey("invoices.id", ondelete="CASCADE"), nullable=False)
+    line_no = Column(Integer, nullable=False)
+    product_name = Column(String)
+    quantity = Column(Float)
+    unit = Column(String)
+    amount = Column(Float)
+    discount = Column(Float)
+    # Copied from the invoice so period/store aggregates don't need a join
+    invoice_date = Column(Date)
+    store_name = Column(String)
+
+    invoice = relationship("Invoice", back_populates="items")
+
+    __table_args__ = (
+        Index('idx_item_invoice', 'invoice_id'),
+        Index('idx_item_date_store', 'invoice_date', 'store_name'),
+        Index('idx_item_product_date', 'product_name', 'invoice_date'),
+    )
@@ -0,0 +1,46 @@
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, Index
+from app.database import Base
+from datetime import datetime, timezone
+import uuid
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+class ExtractionJob(Base):
+    __tablename__ = "extraction_jobs"
+
+    id = Column(String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    status = Column(String(16), nullable=False, default="queued")  # queued, running, done, failed
+    filename = Column(String)
+    content_type = Column(String)
+    file_path = Column(String)
+    file_hash = Column(String(64))
+    force_reprocess = Column(Boolean, default=False)
+    invoice_id = Column(Integer)
+    is_cached = Column(Boolean)
+    error = Column(String)
+    attempts = Column(Integer, default=0)
+    # Timestamps are set from Python so sub-second timings survive on SQLite
+    created_at = Column(DateTime(timezone=True), default=_utcnow)
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+
+    # Workers claim the oldest queued job first
+    __table_args__ = (
+        Index('idx_job_status_created', 'status', 'created_at'),
+    )
+
+class ReportJob(Base):
+    __tablename__ = "report_jobs"
+
+    id = Column(String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    status = Column(String(16), nullable=False, default="queued")  # queued, running, done, failed
+    start_date = Column(Date)
+    end_date = Column(Date)
+    report_type = Column(String(16))
+    file_path = Column(String)  # Cached PDF, set once the job is done
+    is_cached = Column(Boolean)  # Served from an earlier render of the same data
+    error = Column(String)
+    created_at = Column(DateTime(timezone=True), default=_utcnow)
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
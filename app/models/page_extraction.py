@@ -0,0 +1,11 @@
+from sqlalchemy import Column, String, JSON, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+class PageExtraction(Base):
+    """Extraction result for a single PDF page, reused when the same page is seen again"""
+    __tablename__ = "page_extractions"
+
+    page_hash = Column(String(64), primary_key=True)
+    result = Column(JSON)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
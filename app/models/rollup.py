@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, Float, Date
+from app.database import Base
+
+class StoreDailyRollup(Base):
+    """Running totals per store per day, updated as invoices are saved and deleted"""
+    __tablename__ = "store_daily_rollups"
+
+    # Invoices without a store name are counted under ''
+    store_name = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True, index=True)
+    invoices = Column(Integer, nullable=False, default=0)
+    items = Column(Integer, nullable=False, default=0)
+    amount = Column(Float, nullable=False, default=0)
+    discount = Column(Float, nullable=False, default=0)
+    total = Column(Float, nullable=False, default=0)
+
+class ProductMonthlyRollup(Base):
+    """Running totals per product per month (keyed by the first day of the month)"""
+    __tablename__ = "product_monthly_rollups"
+
+    product_name = Column(String, primary_key=True)
+    month = Column(Date, primary_key=True, index=True)
+    lines = Column(Integer, nullable=False, default=0)
+    quantity = Column(Float, nullable=False, default=0)
+    amount = Column(Float, nullable=False, default=0)
+    discount = Column(Float, nullable=False, default=0)
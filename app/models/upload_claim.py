@@ -0,0 +1,10 @@
+from sqlalchemy import Column, String, DateTime
+from app.database import Base
+
+class UploadClaim(Base):
+    """Lease on a file hash, held by the worker process extracting that file"""
+    __tablename__ = "upload_claims"
+
+    file_hash = Column(String(64), primary_key=True)
+    owner = Column(String(64), nullable=False)  # Claiming process: host, pid and instance
+    expires_at = Column(DateTime(timezone=True), nullable=False)  # Other workers may take over after this
@@ -1,17 +1,36 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import get_db
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Header, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, load_only
+from app.database import get_db, get_async_db
 from app.models.invoice import Invoice
-from app.schemas.invoice import InvoiceResponse
-from app.services.gemini_service import GeminiService
-from app.utils.file_handler import convert_to_supported_format, calculate_file_hash
-from datetime import datetime
-import os
+from app.schemas.invoice import InvoiceResponse, InvoiceSearchResponse, BatchUploadResult
+from app.services.gemini_client import GeminiUnavailableError
+from app.services.export_service import ExportService, EXPORT_FORMATS
+from app.services.extraction_backend import get_extraction_backend
+from app.services.invoice_service import InvoiceService
+from app.services.job_service import remove_if_unreferenced
+from app.services.rollup_service import RollupService
+from app.utils.file_handler import spool_upload, UploadTooLargeError
+from app.utils.metrics import UPLOADS
+from app.utils.pagination import encode_cursor, decode_cursor, etag, etag_matches
 from app.config import settings
-import shutil
+from datetime import date
+from typing import List, Optional
+import json
+import math
 
 router = APIRouter(prefix="/invoices", tags=["invoices"])
-gemini = GeminiService()
+extractor = get_extraction_backend()
+invoice_service = InvoiceService(extractor)
+
+ALLOWED_TYPES = ['image/png', 'image/jpeg', 'image/jpg', 'image/webp', 'application/pdf']
+
+# Invoice columns that GET /invoices/?fields= can select
+LIST_FIELDS = ['id', 'store_name', 'invoice_date', 'total', 'details', 'file_path', 'file_hash']
 
 @router.post("/upload", response_model=InvoiceResponse)
 async def upload_invoice(
@@ -30,78 +49,247 @@ async def upload_invoice(
     Supported formats: PNG, JPEG, JPG, WEBP, PDF
     """
     # Validate file type
-    allowed_types = ['image/png', 'image/jpeg', 'image/jpg', 'image/webp', 'application/pdf']
-    if file.content_type not in allowed_types:
+    if file.content_type not in ALLOWED_TYPES:
         raise HTTPException(
             status_code=400, 
-            detail=f"Unsupported file type. Allowed: {', '.join(allowed_types)}"
+            detail=f"Unsupported file type. Allowed: {', '.join(ALLOWED_TYPES)}"
         )
     
     try:
-        # Read file
-        content = await file.read()
-        
-        # Calculate file hash for duplicate detection
-        file_hash = calculate_file_hash(content)
-        
-        # Check if invoice already exists in database (cache check)
-        if not force_reprocess:
-            existing_invoice = db.query(Invoice).filter(
-                Invoice.file_hash == file_hash
-            ).first()
-            
-            if existing_invoice:
-                # Return cached data without calling Gemini API
-                response = InvoiceResponse.model_validate(existing_invoice)
-                response.is_cached = True
-                return response
-        
-        # Convert to supported format if needed
-        processed_content, mime_type = convert_to_supported_format(content, file.content_type)
-        
-        # Extract structured data using Gemini Vision (only if not cached)
-        invoice_data = gemini.extract_invoice_data(processed_content, mime_type)
-        
-        # Save original file
-        os.makedirs(settings.upload_dir, exist_ok=True)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        file_path = os.path.join(settings.upload_dir, f"{timestamp}_{file.filename}")
+        # Stream the file to disk, hashing it as it arrives
+        upload = await spool_upload(file, settings.upload_dir, settings.max_upload_bytes)
         
-        with open(file_path, "wb") as f:
-            f.write(content)
+        return await invoice_service.process(db, upload, force_reprocess)
         
-        # Save to database
-        db_invoice = Invoice(
-            store_name=invoice_data['store_name'],
-            invoice_date=datetime.strptime(invoice_data['invoice_date'], '%Y-%m-%d').date(),
-            total=float(invoice_data['total']),
-            details=invoice_data['details'],
-            file_path=file_path,
-            file_hash=file_hash
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except GeminiUnavailableError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
         )
-        db.add(db_invoice)
-        db.commit()
-        db.refresh(db_invoice)
-        
-        response = InvoiceResponse.model_validate(db_invoice)
-        response.is_cached = False
-        return response
-        
     except ValueError as e:
         raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing invoice: {str(e)}")
 
+@router.post(
+    "/upload/batch",
+    response_class=StreamingResponse,
+    responses={200: {"model": BatchUploadResult, "content": {"application/x-ndjson": {}}}}
+)
+async def upload_invoice_batch(
+    files: List[UploadFile] = File(...),
+    force_reprocess: bool = False
+):
+    """
+    Upload many invoices at once and stream one NDJSON result per file
+
+    - Identical files in the batch are extracted once
+    - Files already stored are returned from cache
+    - New files are extracted concurrently; each line is sent as soon as its file completes
+    - A failing file produces an error line without failing the batch
+
+    Each line is a BatchUploadResult; `index` is the file's position in the request.
+    """
+    positions = []
+    uploads = []
+    rejected = []
+    for index, file in enumerate(files):
+        if file.content_type not in ALLOWED_TYPES:
+            rejected.append(_batch_rejection(
+                index, file.filename, 400, f"Unsupported file type. Allowed: {', '.join(ALLOWED_TYPES)}"
+            ))
+            continue
+        # Spool everything now: uploaded files are closed once this handler returns
+        try:
+            uploads.append(await spool_upload(file, settings.upload_dir, settings.max_upload_bytes))
+            positions.append(index)
+        except UploadTooLargeError as e:
+            rejected.append(_batch_rejection(index, file.filename, 413, str(e)))
+
+    async def stream_results():
+        try:
+            for result in rejected:
+                yield json.dumps(result) + "\n"
+            async for result in invoice_service.process_batch(uploads, force_reprocess):
+                # Map back from the position among accepted files to the request position
+                result["index"] = positions[result["index"]]
+                yield json.dumps(result) + "\n"
+        finally:
+            # Drop spooled files of any results that were never produced
+            await run_in_threadpool(lambda: [upload.discard() for upload in uploads])
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+def _batch_rejection(index: int, filename: str, status_code: int, detail: str) -> dict:
+    return {
+        "index": index,
+        "filename": filename,
+        "status": "error",
+        "status_code": status_code,
+        "invoice": None,
+        "error": detail
+    }
+
 @router.get("/", response_model=list[InvoiceResponse])
-def get_invoices(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Get all invoices with pagination"""
-    invoices = db.query(Invoice).offset(skip).limit(limit).all()
-    return invoices
+def get_invoices(
+    request: Request,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    store: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Get invoices, newest first, with keyset pagination
+
+    Pass the X-Next-Cursor header of one page as cursor to get the next;
+    the Link header carries the same as a ready-made URL. Unlike skip, a
+    cursor costs the same however deep the page is. Invoices without a
+    date have no place in that order and aren't listed.
+
+    Args:
+        store: Only invoices from this store
+        start_date, end_date: Only invoices dated within this range (inclusive)
+        fields: Comma-separated fields to return, e.g. "id,store_name,total" to leave out details
+    """
+    columns = None
+    if fields:
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in names if name not in LIST_FIELDS]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(LIST_FIELDS)}"
+            )
+        columns = list(dict.fromkeys(names))
+
+    # Not NULL also keeps databases that sort NULLs first in descending order in step with the cursor
+    query = db.query(Invoice).filter(Invoice.invoice_date.is_not(None))
+    if columns is not None:
+        # Only the requested columns are read; date and id are always needed for the cursor
+        query = query.options(load_only(*(getattr(Invoice, name) for name in {*columns, 'invoice_date', 'id'})))
+    if store is not None:
+        query = query.filter(Invoice.store_name == store)
+    if start_date is not None:
+        query = query.filter(Invoice.invoice_date >= start_date)
+    if end_date is not None:
+        query = query.filter(Invoice.invoice_date <= end_date)
+    if cursor is not None:
+        try:
+            after_date, after_id = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        query = query.filter(or_(
+            Invoice.invoice_date < after_date,
+            and_(Invoice.invoice_date == after_date, Invoice.id < after_id)
+        ))
+
+    query = query.order_by(Invoice.invoice_date.desc(), Invoice.id.desc())
+    if cursor is None and skip:
+        query = query.offset(skip)
+
+    # One extra row tells whether there is a next page
+    invoices = query.limit(limit + 1).all()
+    has_more = len(invoices) > limit
+    invoices = invoices[:limit]
+
+    if columns is None:
+        rows = [InvoiceResponse.model_validate(invoice).model_dump(mode="json") for invoice in invoices]
+    else:
+        rows = [
+            {name: jsonable_encoder(getattr(invoice, name)) for name in columns}
+            for invoice in invoices
+        ]
+    body = json.dumps(rows).encode()
+
+    headers = {"ETag": etag(body)}
+    if has_more:
+        last = invoices[-1]
+        next_cursor = encode_cursor(last.invoice_date, last.id)
+        headers["X-Next-Cursor"] = next_cursor
+        next_url = request.url.remove_query_params(["cursor", "skip"]).include_query_params(cursor=next_cursor)
+        headers["Link"] = f'<{next_url}>; rel="next"'
+
+    if if_none_match and etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.get("/export")
+def export_invoices(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    store: Optional[str] = None,
+    export_format: str = Query("csv", alias="format"),
+    layout: str = "items",
+    compress: bool = Query(False, alias="gzip")
+):
+    """
+    Download all invoices in a date range as one streamed file
+
+    Rows are streamed from the database as they are encoded, so exports of
+    any size use the same memory.
+
+    Args:
+        start_date, end_date: Only invoices dated within this range (inclusive)
+        store: Only invoices from this store
+        format: csv, ndjson or parquet (needs pyarrow)
+        layout: "items" for one row per line item, "invoices" for one row per invoice with its items nested
+        gzip: Gzip the file (csv and ndjson)
+    """
+    try:
+        ExportService.validate(export_format, layout, compress)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    period = f"{start_date or 'start'}_{end_date or 'end'}"
+    filename = f"invoices_{layout}_{period}.{export_format}" + (".gz" if compress else "")
+    return StreamingResponse(
+        ExportService.stream(export_format, layout, start_date, end_date, store, compress),
+        media_type="application/gzip" if compress else EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@router.get("/search", response_model=InvoiceSearchResponse)
+def search_invoices(
+    store: Optional[str] = None,
+    product: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    min_score: Optional[float] = Query(None, ge=0, le=1),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """
+    Fuzzy search invoices by store name and/or product name
+
+    Tolerates typos and partial names: store=indomart matches "Indomaret",
+    product=minyak matches "Minyak Goreng 2L". Results are ranked by how
+    well they match, then newest first.
+
+    Args:
+        store: Text to match against store names
+        product: Text to match against line item product names
+        start_date, end_date: Only invoices dated within this range (inclusive)
+        min_score: How much of the query (0-1) a name must contain to match; default SEARCH_MIN_SCORE
+    """
+    try:
+        results, total = invoice_service.search(db, store, product, start_date, end_date, min_score, limit, skip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return InvoiceSearchResponse(total=total, results=results)
 
 @router.get("/{invoice_id}", response_model=InvoiceResponse)
-def get_invoice(invoice_id: int, db: Session = Depends(get_db)):
+async def get_invoice(invoice_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get specific invoice by ID"""
-    invoice = db.query(Invoice).filter(Invoice.id == invoice_id).first()
+    invoice = await db.get(Invoice, invoice_id)
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
     return invoice
@@ -109,7 +297,7 @@ def get_invoice(invoice_id: int, db: Session = Depends(get_db)):
 @router.get("/hash/{file_hash}", response_model=InvoiceResponse)
 def get_invoice_by_hash(file_hash: str, db: Session = Depends(get_db)):
     """Get invoice by file hash (useful for checking cache)"""
-    invoice = db.query(Invoice).filter(Invoice.file_hash == file_hash).first()
+    invoice = invoice_service.find_by_hash(db, file_hash)
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
     return invoice
@@ -121,23 +309,33 @@ def delete_invoice(invoice_id: int, db: Session = Depends(get_db)):
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
     
-    # Delete file if exists
-    if os.path.exists(invoice.file_path):
-        os.remove(invoice.file_path)
-    
+    file_hash, file_path = invoice.file_hash, invoice.file_path
+    RollupService.remove(db, invoice)
     db.delete(invoice)
     db.commit()
+    invoice_service.forget(invoice_id, file_hash)
+
+    # Delete the file unless a queued job still needs it
+    remove_if_unreferenced(db, file_path)
     return {"message": "Invoice deleted successfully"}
 
 @router.get("/stats/cache")
 def get_cache_stats(db: Session = Depends(get_db)):
-    """Get cache statistics"""
-    total_invoices = db.query(Invoice).count()
-    unique_hashes = db.query(Invoice.file_hash).distinct().count()
+    """Get cache statistics for uploads handled by this process since it started"""
+    hits = UPLOADS.value(result="hit")
+    near_duplicates = UPLOADS.value(result="near_duplicate")
+    misses = UPLOADS.value(result="miss")
+    reprocessed = UPLOADS.value(result="reprocess")
+    coalesced = UPLOADS.value(result="coalesced")
+    uploads = hits + near_duplicates + misses + reprocessed + coalesced
     
     return {
-        "total_invoices": total_invoices,
-        "unique_invoices": unique_hashes,
-        "duplicate_uploads": total_invoices - unique_hashes,
-        "cache_hit_rate": f"{((total_invoices - unique_hashes) / total_invoices * 100):.2f}%" if total_invoices > 0 else "0%"
+        "total_invoices": db.query(func.count(Invoice.id)).scalar(),
+        "uploads": uploads,
+        "cache_hits": hits,
+        "near_duplicate_hits": near_duplicates,
+        "cache_misses": misses,
+        "reprocessed": reprocessed,
+        "coalesced_uploads": coalesced,  # Served from a concurrent upload of the same file
+        "cache_hit_rate": f"{((hits + near_duplicates + coalesced) / uploads * 100):.2f}%" if uploads > 0 else "0%"
     }
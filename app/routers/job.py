@@ -0,0 +1,67 @@
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.database import get_db, get_async_db
+from app.models.job import ExtractionJob
+from app.routers.invoice import invoice_service, ALLOWED_TYPES
+from app.schemas.job import JobResponse
+from app.services.job_service import JobQueue
+from app.utils.file_handler import spool_upload, UploadTooLargeError
+from app.config import settings
+from typing import Optional
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+job_queue = JobQueue(invoice_service)
+
+JOB_STATUSES = ['queued', 'running', 'done', 'failed']
+
+@router.post("/upload", response_model=JobResponse, status_code=202)
+async def upload_invoice_job(
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    force_reprocess: bool = False
+):
+    """
+    Store an invoice and queue it for extraction, returning immediately
+
+    Poll GET /jobs/{job_id} until status is "done" (invoice_id is set) or "failed".
+    """
+    # Validate file type
+    if file.content_type not in ALLOWED_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file type. Allowed: {', '.join(ALLOWED_TYPES)}"
+        )
+
+    try:
+        upload = await spool_upload(file, settings.upload_dir, settings.max_upload_bytes)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return await job_queue.enqueue(db, upload, force_reprocess)
+
+@router.get("/", response_model=list[JobResponse])
+def get_jobs(
+    status: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """List extraction jobs, newest first, optionally filtered by status"""
+    query = db.query(ExtractionJob)
+    if status is not None:
+        if status not in JOB_STATUSES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"status must be one of: {', '.join(JOB_STATUSES)}"
+            )
+        query = query.filter(ExtractionJob.status == status)
+    return query.order_by(ExtractionJob.created_at.desc()).offset(skip).limit(limit).all()
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Get extraction job status and timings"""
+    # Polled often: served on the event loop without a threadpool hop
+    job = await db.get(ExtractionJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
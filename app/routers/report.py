@@ -1,25 +1,27 @@
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, get_async_db
+from app.models.job import ReportJob
 from app.schemas.invoice import ReportRequest
+from app.schemas.job import ReportJobResponse
+from app.services.report_cache import ReportCache
+from app.services.report_job_service import ReportJobService
 from app.services.report_service import ReportService
+from app.services.rollup_service import RollupService, PERIOD_FORMATS
 from app.config import settings
+from datetime import date, datetime
+from typing import BinaryIO, Optional
 import os
 
 router = APIRouter(prefix="/reports", tags=["reports"])
+report_cache = ReportCache(os.path.join(settings.report_dir, "cache"), settings.report_cache_max_bytes)
+report_jobs = ReportJobService(report_cache)
 
-@router.post("/generate")
-def generate_report(request: ReportRequest, db: Session = Depends(get_db)):
-    """
-    Generate invoice report for specified date range
-    
-    Args:
-        request: ReportRequest with start_date, end_date, and report_type (monthly/yearly)
-    
-    Returns:
-        PDF file download
-    """
+JOB_STATUSES = ['queued', 'running', 'done', 'failed']
+
+def _validate_request(request: ReportRequest):
     # Validate report type
     if request.report_type not in ['monthly', 'yearly']:
         raise HTTPException(
@@ -33,24 +35,123 @@ def generate_report(request: ReportRequest, db: Session = Depends(get_db)):
             status_code=400, 
             detail="start_date must be before end_date"
         )
+
+def _pdf_response(output: BinaryIO, report_type: str, headers: Optional[dict] = None) -> StreamingResponse:
+    filename = f"report_{report_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    headers = {"Content-Disposition": f"attachment; filename={filename}", **(headers or {})}
+    # Already open, so a concurrent eviction can't remove the file mid-response
+    return StreamingResponse(ReportService.iter_file(output), media_type='application/pdf', headers=headers)
+
+@router.post("/generate")
+async def generate_report(request: ReportRequest, db: Session = Depends(get_db)):
+    """
+    Generate invoice report for specified date range
+    
+    The PDF is rendered in a worker process, so large reports don't stall
+    other requests. Use POST /reports/jobs to avoid holding the connection.
+    
+    Args:
+        request: ReportRequest with start_date, end_date, and report_type (monthly/yearly)
+    
+    Returns:
+        PDF file download
+    """
+    _validate_request(request)
     
     try:
-        os.makedirs(settings.report_dir, exist_ok=True)
-        
-        filename = ReportService.generate_report(
+        # Same range, type and unchanged invoices: serve the report rendered last time
+        output, is_cached = await report_jobs.get_or_render(
             db, 
             request.start_date, 
             request.end_date, 
             request.report_type
         )
-        
-        filepath = os.path.join(settings.report_dir, filename)
-        
-        return FileResponse(
-            filepath, 
-            filename=filename, 
-            media_type='application/pdf',
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        return _pdf_response(output, request.report_type, {"X-Report-Cache": "hit" if is_cached else "miss"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating report: {str(e)}")
+
+@router.get("/summary")
+def get_summary(
+    start_date: date,
+    end_date: date,
+    group_by: str = 'month',
+    db: Session = Depends(get_db)
+):
+    """
+    Spend totals for a date range, per period, per store and top products
+
+    Answered from the rollup tables, so the cost grows with the number of
+    days and stores in the range rather than the number of invoices.
+
+    Args:
+        group_by: Period for the per-period rows: day, month or year
+    """
+    if group_by not in PERIOD_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"group_by must be one of: {', '.join(PERIOD_FORMATS)}"
+        )
+    if start_date > end_date:
+        raise HTTPException(
+            status_code=400,
+            detail="start_date must be before end_date"
+        )
+    return RollupService.summary(db, start_date, end_date, group_by)
+
+@router.post("/jobs", response_model=ReportJobResponse, status_code=202)
+async def submit_report_job(request: ReportRequest, db: Session = Depends(get_db)):
+    """
+    Queue a report for rendering and return immediately
+
+    Poll GET /reports/jobs/{job_id} until status is "done", then fetch the
+    PDF from GET /reports/jobs/{job_id}/download.
+    """
+    _validate_request(request)
+    return await report_jobs.submit(db, request.start_date, request.end_date, request.report_type)
+
+@router.get("/jobs", response_model=list[ReportJobResponse])
+def get_report_jobs(
+    status: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """List report jobs, newest first, optionally filtered by status"""
+    query = db.query(ReportJob)
+    if status is not None:
+        if status not in JOB_STATUSES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"status must be one of: {', '.join(JOB_STATUSES)}"
+            )
+        query = query.filter(ReportJob.status == status)
+    return query.order_by(ReportJob.created_at.desc()).offset(skip).limit(limit).all()
+
+@router.get("/jobs/{job_id}", response_model=ReportJobResponse)
+async def get_report_job(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Get report job status and timings"""
+    # Polled often: served on the event loop without a threadpool hop
+    job = await db.get(ReportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs/{job_id}/download")
+def download_report_job(job_id: str, db: Session = Depends(get_db)):
+    """Download the PDF produced by a finished report job"""
+    job = db.get(ReportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Report is not ready (status: {job.status})")
+    try:
+        return _pdf_response(report_jobs.open_result(job), job.report_type)
+    except FileNotFoundError:
+        # Evicted from the report cache, or already downloaded with the cache disabled;
+        # submitting again is cheap if the data is unchanged
+        raise HTTPException(status_code=410, detail="Report has expired, submit the job again")
+
+@router.get("/cache/stats")
+def get_report_cache_stats():
+    """Get report cache hit/miss counters and disk usage"""
+    return report_cache.stats()
@@ -0,0 +1,56 @@
+"""
+Schema creation and additive migrations
+
+create_all only creates missing tables, so columns and indexes added to
+existing models never reach databases created before them. migrate() also
+adds those. Nothing is ever dropped or altered.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn
+from app.database import engine, Base
+from app.models import invoice, job, page_extraction, rollup, upload_claim  # noqa: F401 (register tables)
+import logging
+
+logger = logging.getLogger(__name__)
+
+def migrate(bind: Engine = engine) -> list[str]:
+    """
+    Bring the database schema up to date with the models
+
+    New columns on existing tables must be nullable or have a server default.
+
+    Returns:
+        list: Description of each change made; empty if already up to date
+    """
+    changes = []
+    inspector = inspect(bind)
+    existing = set(inspector.get_table_names())
+
+    missing = [table for table in Base.metadata.sorted_tables if table.name not in existing]
+    if missing:
+        Base.metadata.create_all(bind=bind, tables=missing)
+        changes.extend(f"created table {table.name}" for table in missing)
+
+    with bind.begin() as conn:
+        preparer = bind.dialect.identifier_preparer
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                    conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}"))
+                    changes.append(f"added column {table.name}.{column.name}")
+
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(bind=conn)
+                    changes.append(f"created index {index.name}")
+
+    for change in changes:
+        logger.info("Schema: %s", change)
+    return changes
@@ -15,15 +15,41 @@ class InvoiceCreate(BaseModel):
     total: float
     details: List[InvoiceDetail]
 
+class PreprocessMetrics(BaseModel):
+    bytes_before: int
+    bytes_after: int
+    width_before: Optional[int] = None
+    height_before: Optional[int] = None
+    width_after: Optional[int] = None
+    height_after: Optional[int] = None
+    seconds: float
+
 class InvoiceResponse(InvoiceCreate):
     id: int
     file_path: str
     file_hash: str
     is_cached: Optional[bool] = False  # Indicates if data was from cache
+    similarity: Optional[float] = None  # Set when matched by perceptual hash (1.0 = identical)
+    preprocessing: Optional[PreprocessMetrics] = None  # Set when the image was sent for extraction
 
     class Config:
         from_attributes = True
 
+class InvoiceSearchResult(InvoiceResponse):
+    score: float = 0.0  # Store plus best product match, each 0-1 (trigram containment)
+
+class InvoiceSearchResponse(BaseModel):
+    total: int  # Matches across all pages
+    results: List[InvoiceSearchResult]
+
+class BatchUploadResult(BaseModel):
+    index: int  # Position of the file in the uploaded batch
+    filename: Optional[str] = None
+    status: str  # "ok" or "error"
+    status_code: int  # HTTP status the single-file endpoint would have returned
+    invoice: Optional[InvoiceResponse] = None
+    error: Optional[str] = None
+
 class ReportRequest(BaseModel):
     start_date: date
     end_date: date
@@ -0,0 +1,58 @@
+from pydantic import BaseModel, computed_field
+from datetime import date, datetime
+from typing import Optional
+
+class JobResponse(BaseModel):
+    id: str
+    status: str  # "queued", "running", "done" or "failed"
+    filename: Optional[str] = None
+    file_hash: Optional[str] = None
+    invoice_id: Optional[int] = None  # Set once the job is done
+    is_cached: Optional[bool] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @computed_field
+    @property
+    def queue_seconds(self) -> Optional[float]:
+        """Time spent waiting for a worker"""
+        if self.created_at is None or self.started_at is None:
+            return None
+        return (self.started_at - self.created_at).total_seconds()
+
+    @computed_field
+    @property
+    def run_seconds(self) -> Optional[float]:
+        """Time spent extracting and storing the invoice"""
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+    class Config:
+        from_attributes = True
+
+class ReportJobResponse(BaseModel):
+    id: str
+    status: str  # "queued", "running", "done" or "failed"
+    start_date: date
+    end_date: date
+    report_type: str
+    is_cached: Optional[bool] = None
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @computed_field
+    @property
+    def render_seconds(self) -> Optional[float]:
+        """Time from the job starting to the report being ready"""
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return (self.finished_at - self.started_at).total_seconds()
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,159 @@
+from app.config import settings
+from app.services.extraction_backend import ExtractionBackend
+from app.services.gemini_client import GeminiUnavailableError
+from app.services.gemini_service import EXTRACTION_PROMPT, GeminiService
+from app.utils.metrics import GEMINI_BATCH_REQUESTS_SAVED, GEMINI_BATCH_SIZE, GEMINI_BATCH_TOKENS_SAVED, GEMINI_BATCHED_IMAGES
+from dataclasses import dataclass
+from PIL import Image
+import asyncio
+import io
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+# Gemini bills images by 768x768 tile, or a single tile if both sides are at most 384 pixels
+TOKENS_PER_TILE = 258
+TILE_SIZE = 768
+SMALL_IMAGE_SIZE = 384
+
+# Roughly 4 characters per token
+PROMPT_TOKENS = len(EXTRACTION_PROMPT) // 4
+
+def estimate_image_tokens(image_bytes: bytes) -> int:
+    """Input tokens Gemini will charge for an image, from its header alone"""
+    try:
+        width, height = Image.open(io.BytesIO(image_bytes)).size
+    except Exception:
+        return TOKENS_PER_TILE
+    if width <= SMALL_IMAGE_SIZE and height <= SMALL_IMAGE_SIZE:
+        return TOKENS_PER_TILE
+    return TOKENS_PER_TILE * math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+
+@dataclass
+class _Pending:
+    image_bytes: bytes
+    mime_type: str
+    future: asyncio.Future
+
+class BatchingExtractor(ExtractionBackend):
+    """
+    Packs small images extracted at about the same time into one Gemini request
+
+    The first image to arrive opens a window of `window` seconds; every image
+    arriving before it closes joins the same multi-image request, which sends
+    the prompt once and returns one result per image. A batch is sent early
+    once it holds max_images images or max_tokens estimated image tokens.
+    Images the batched response has no valid result for are retried on their
+    own, so one unreadable receipt never fails the others.
+
+    PDF pages, custom prompts and images over max_image_bytes are passed
+    straight through to the wrapped extractor.
+    """
+
+    def __init__(
+        self,
+        extractor: GeminiService,
+        window: float,
+        max_images: int = 8,
+        max_tokens: int = 16_000,
+        max_image_bytes: int = 512 * 1024
+    ):
+        self.extractor = extractor
+        self.window = window
+        self.max_images = max_images
+        self.max_tokens = max_tokens
+        self.max_image_bytes = max_image_bytes
+        self._pending: list[_Pending] = []
+        self._pending_tokens = 0
+        self._timer = None
+        # Strong references to running batches, which the event loop alone doesn't keep
+        self._tasks = set()
+
+    @classmethod
+    def from_settings(cls, extractor: GeminiService) -> "BatchingExtractor":
+        return cls(
+            extractor,
+            window=settings.gemini_batch_window_ms / 1000,
+            max_images=settings.gemini_batch_max_images,
+            max_tokens=settings.gemini_batch_max_tokens,
+            max_image_bytes=settings.gemini_batch_max_image_bytes
+        )
+
+    async def extract_invoice_data_async(self, image_bytes: bytes, mime_type: str, prompt: str = None) -> dict:
+        if prompt is not None or not mime_type.startswith('image/') or len(image_bytes) > self.max_image_bytes:
+            return await self.extractor.extract_invoice_data_async(image_bytes, mime_type, prompt)
+
+        tokens = estimate_image_tokens(image_bytes)
+        if self._pending and self._pending_tokens + tokens > self.max_tokens:
+            self._flush()
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(_Pending(image_bytes, mime_type, future))
+        self._pending_tokens += tokens
+        if len(self._pending) >= self.max_images:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        """Send everything pending as one batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_tokens = self._pending, [], 0
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: list[_Pending]):
+        if len(batch) == 1:
+            await self._single(batch[0])
+            return
+
+        try:
+            results = await self.extractor.extract_invoice_batch_async(
+                [(pending.image_bytes, pending.mime_type) for pending in batch]
+            )
+        except GeminiUnavailableError as e:
+            # Single calls would hit the same outage; let every caller handle it as usual
+            for pending in batch:
+                _settle(pending.future, error=e)
+            return
+        except Exception as e:
+            logger.warning("Batch of %d images failed, extracting them one by one: %s", len(batch), e)
+            results = [None] * len(batch)
+
+        retries = [pending for pending, result in zip(batch, results) if result is None]
+        answered = len(batch) - len(retries)
+        GEMINI_BATCH_SIZE.observe(len(batch))
+        GEMINI_BATCHED_IMAGES.inc(answered, outcome="ok")
+        GEMINI_BATCHED_IMAGES.inc(len(retries), outcome="fallback")
+        if answered > 1:
+            GEMINI_BATCH_REQUESTS_SAVED.inc(answered - 1)
+            GEMINI_BATCH_TOKENS_SAVED.inc((answered - 1) * PROMPT_TOKENS)
+
+        for pending, result in zip(batch, results):
+            if result is not None:
+                _settle(pending.future, result=result)
+        await asyncio.gather(*(self._single(pending) for pending in retries))
+
+    async def _single(self, pending: _Pending):
+        try:
+            result = await self.extractor.extract_invoice_data_async(pending.image_bytes, pending.mime_type)
+        except Exception as e:
+            _settle(pending.future, error=e)
+        else:
+            _settle(pending.future, result=result)
+
+def _settle(future: asyncio.Future, result=None, error: Exception = None):
+    # The caller may have given up (client disconnected) while the batch was in flight
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
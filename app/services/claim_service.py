@@ -0,0 +1,51 @@
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models.upload_claim import UploadClaim
+from datetime import datetime, timedelta, timezone
+
+class ClaimService:
+    """
+    Database leases that let one worker process at a time extract a given file
+
+    The primary key on file_hash makes claiming atomic across processes.
+    A lease that runs out without being released belonged to a worker that
+    died mid-extraction, and the next worker to ask takes it over.
+    """
+
+    @staticmethod
+    def claim(db: Session, file_hash: str, owner: str, lease_seconds: float) -> tuple[bool, bool]:
+        """
+        Try to take the lease on file_hash
+
+        Commits, so the caller's next query starts a fresh transaction.
+
+        Returns:
+            tuple: (whether owner now holds the lease, whether it was taken over from an expired one)
+        """
+        now = _utcnow()
+        expires_at = now + timedelta(seconds=lease_seconds)
+        db.add(UploadClaim(file_hash=file_hash, owner=owner, expires_at=expires_at))
+        try:
+            db.commit()
+            return True, False
+        except IntegrityError:
+            db.rollback()
+
+        taken = db.query(UploadClaim).filter(
+            UploadClaim.file_hash == file_hash,
+            UploadClaim.expires_at < now
+        ).update({"owner": owner, "expires_at": expires_at}, synchronize_session=False)
+        db.commit()
+        return taken == 1, taken == 1
+
+    @staticmethod
+    def release(db: Session, file_hash: str, owner: str):
+        """Give up the lease, if owner still holds it"""
+        db.query(UploadClaim).filter(
+            UploadClaim.file_hash == file_hash,
+            UploadClaim.owner == owner
+        ).delete(synchronize_session=False)
+        db.commit()
+
+def _utcnow():
+    return datetime.now(timezone.utc)
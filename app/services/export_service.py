@@ -0,0 +1,213 @@
+from sqlalchemy import select
+from app.database import SessionLocal
+from app.models.invoice import Invoice, InvoiceItem
+from app.config import settings
+from typing import Iterable, Iterator, Optional
+import csv
+import importlib.util
+import io
+import json
+import zlib
+
+# Media type of each export format
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+# "items": one row per line item; "invoices": one row per invoice with its items nested
+EXPORT_LAYOUTS = ['items', 'invoices']
+
+INVOICE_FIELDS = ['invoice_id', 'invoice_date', 'store_name', 'total', 'file_hash']
+ITEM_FIELDS = ['line_no', 'product_name', 'quantity', 'unit', 'amount', 'discount']
+
+GZIP_LEVEL = 6
+
+class ExportService:
+    """
+    Streams invoices in bulk straight from a server-side cursor
+
+    Rows are read as plain tuples, skipping ORM objects and Pydantic
+    validation, and encoded one batch at a time, so memory use depends on
+    settings.export_batch_size and not on the number of rows exported.
+    """
+
+    @staticmethod
+    def validate(export_format: str, layout: str, compress: bool = False):
+        """
+        Raises:
+            ValueError: Unknown format or layout, or Parquet requested without pyarrow
+        """
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+        if layout not in EXPORT_LAYOUTS:
+            raise ValueError(f"layout must be one of: {', '.join(EXPORT_LAYOUTS)}")
+        if export_format == 'parquet':
+            if importlib.util.find_spec('pyarrow') is None:
+                raise ValueError("Parquet export requires pyarrow, which is not installed")
+            if compress:
+                raise ValueError("Parquet files are already compressed; gzip is only for csv and ndjson")
+
+    @staticmethod
+    def stream(
+        export_format: str,
+        layout: str,
+        start_date=None,
+        end_date=None,
+        store: Optional[str] = None,
+        compress: bool = False
+    ) -> Iterator[bytes]:
+        """
+        Encoded export, in chunks of one batch of rows each
+
+        Invoices are ordered by date, then id. Invoices without line items
+        appear once with empty item fields in the items layout.
+
+        Args:
+            export_format: 'csv', 'ndjson' or 'parquet'
+            layout: 'items' or 'invoices'
+            start_date, end_date: Only invoices dated within this range (inclusive)
+            store: Only invoices from this store
+            compress: Gzip the output
+        """
+        batches = _item_rows(start_date, end_date, store)
+        if layout == 'invoices':
+            batches = _nest(batches)
+        chunks = ENCODERS[export_format](batches, layout)
+        return _gzip(chunks) if compress else chunks
+
+def _item_rows(start_date, end_date, store: Optional[str]) -> Iterator[list[tuple]]:
+    """Batches of (invoice fields..., item fields...) tuples, one per line item"""
+    query = select(
+        Invoice.id, Invoice.invoice_date, Invoice.store_name, Invoice.total, Invoice.file_hash,
+        InvoiceItem.line_no, InvoiceItem.product_name, InvoiceItem.quantity, InvoiceItem.unit,
+        InvoiceItem.amount, InvoiceItem.discount
+    ).outerjoin(InvoiceItem, InvoiceItem.invoice_id == Invoice.id)
+    if start_date is not None:
+        query = query.where(Invoice.invoice_date >= start_date)
+    if end_date is not None:
+        query = query.where(Invoice.invoice_date <= end_date)
+    if store is not None:
+        query = query.where(Invoice.store_name == store)
+    query = query.order_by(Invoice.invoice_date, Invoice.id, InvoiceItem.line_no)
+
+    # Opened here rather than taken from the request: the body is sent after the handler returns
+    with SessionLocal() as db:
+        result = db.execute(query.execution_options(stream_results=True, yield_per=settings.export_batch_size))
+        for batch in result.partitions():
+            yield batch
+
+def _nest(batches: Iterable[list[tuple]]) -> Iterator[list[dict]]:
+    """Group consecutive item rows into one dict per invoice"""
+    current = None
+    for batch in batches:
+        invoices = []
+        for row in batch:
+            if current is None or current['invoice_id'] != row[0]:
+                if current is not None:
+                    invoices.append(current)
+                current = dict(zip(INVOICE_FIELDS, row))
+                current['items'] = []
+            item = row[len(INVOICE_FIELDS):]
+            if item[0] is not None:
+                current['items'].append(dict(zip(ITEM_FIELDS, item)))
+        # The last invoice may continue in the next batch
+        if invoices:
+            yield invoices
+    if current is not None:
+        yield [current]
+
+def _encode_csv(batches: Iterable[list], layout: str) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if layout == 'items':
+        writer.writerow(INVOICE_FIELDS + ITEM_FIELDS)
+    else:
+        writer.writerow(INVOICE_FIELDS + ['items'])
+    for batch in batches:
+        if layout == 'items':
+            writer.writerows(batch)
+        else:
+            writer.writerows(
+                [invoice[field] for field in INVOICE_FIELDS] + [json.dumps(invoice['items'])]
+                for invoice in batch
+            )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+def _encode_ndjson(batches: Iterable[list], layout: str) -> Iterator[bytes]:
+    fields = INVOICE_FIELDS + ITEM_FIELDS
+    for batch in batches:
+        records = (dict(zip(fields, row)) for row in batch) if layout == 'items' else batch
+        yield "".join(json.dumps(record, default=str) + "\n" for record in records).encode()
+
+def _encode_parquet(batches: Iterable[list], layout: str) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    invoice_types = [pa.int64(), pa.date32(), pa.string(), pa.float64(), pa.string()]
+    item_types = [pa.int64(), pa.string(), pa.float64(), pa.string(), pa.float64(), pa.float64()]
+    if layout == 'items':
+        schema = pa.schema(list(zip(INVOICE_FIELDS + ITEM_FIELDS, invoice_types + item_types)))
+    else:
+        item_struct = pa.struct(list(zip(ITEM_FIELDS, item_types)))
+        schema = pa.schema(list(zip(INVOICE_FIELDS, invoice_types)) + [('items', pa.list_(item_struct))])
+
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in batches:
+            if layout == 'items':
+                # Column-wise is much faster to convert than a list of dicts
+                table = pa.Table.from_arrays(
+                    [pa.array(column, type=field.type) for column, field in zip(zip(*batch), schema)],
+                    schema=schema
+                )
+            else:
+                table = pa.Table.from_pylist(batch, schema=schema)
+            # One row group per batch, sent as soon as it is written
+            writer.write_table(table)
+            yield sink.drain()
+    yield sink.drain()
+
+ENCODERS = {
+    'csv': _encode_csv,
+    'ndjson': _encode_ndjson,
+    'parquet': _encode_parquet
+}
+
+def _gzip(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last drain()"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
@@ -0,0 +1,46 @@
+from abc import ABC, abstractmethod
+from app.config import settings
+
+class ExtractionBackend(ABC):
+    """Turns an invoice image or PDF page into structured invoice data"""
+
+    @abstractmethod
+    async def extract_invoice_data_async(self, image_bytes: bytes, mime_type: str, prompt: str = None) -> dict:
+        """
+        Args:
+            image_bytes: Raw bytes of the image or single-page PDF
+            mime_type: MIME type of image_bytes
+            prompt: Extraction instructions; None for the backend's default whole-invoice prompt
+
+        Returns:
+            dict: store_name, invoice_date, total and details
+
+        Raises:
+            GeminiUnavailableError: The backend is temporarily unavailable
+            ValueError: The input could not be extracted
+        """
+
+def get_extraction_backend() -> ExtractionBackend:
+    """
+    Backend selected by settings.extraction_backend: "gemini" or "fake"
+
+    Wrapped in a BatchingExtractor when settings.gemini_batch_window_ms is set.
+    """
+    if settings.extraction_backend == "gemini":
+        from app.services.gemini_service import GeminiService
+        backend = GeminiService()
+    elif settings.extraction_backend == "fake":
+        from app.services.fake_genai import FakeExtractionBackend
+        backend = FakeExtractionBackend(
+            latency_ms=settings.fake_latency_ms,
+            latency_sigma=settings.fake_latency_sigma,
+            error_rate=settings.fake_error_rate,
+            seed=settings.fake_seed
+        )
+    else:
+        raise ValueError(f"Unknown extraction backend: {settings.extraction_backend}")
+
+    if settings.gemini_batch_window_ms > 0:
+        from app.services.batch_extractor import BatchingExtractor
+        return BatchingExtractor.from_settings(backend)
+    return backend
@@ -0,0 +1,175 @@
+from app.services.gemini_client import GeminiCaller
+from app.services.gemini_service import BATCH_EXTRACTION_PROMPT, GeminiService, PAGE_EXTRACTION_PROMPT
+from datetime import date, timedelta
+from google.genai import errors as genai_errors
+from types import SimpleNamespace
+from typing import Callable, Optional, Union
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+
+DEFAULT_RESPONSE = {
+    "store_name": "Fake Store",
+    "invoice_date": "2025-01-01",
+    "total": 10000,
+    "details": [
+        {"product_name": "Fake Product", "quantity": 1, "unit": "pcs", "amount": 10000, "discount": 0}
+    ]
+}
+
+STORES = ["Indomaret", "Alfamart", "Superindo", "Hypermart", "Lotte Mart", "Transmart", "Hero", "Giant"]
+
+# (name, unit, price range in rupiah)
+PRODUCTS = [
+    ("Minyak Goreng 2L", "pcs", (30000, 42000)),
+    ("Beras 5kg", "pcs", (65000, 80000)),
+    ("Gula Pasir 1kg", "pcs", (15000, 19000)),
+    ("Telur", "kg", (26000, 32000)),
+    ("Susu UHT 1L", "pcs", (17000, 21000)),
+    ("Kopi Bubuk 200g", "pcs", (12000, 28000)),
+    ("Mie Instan", "pcs", (3000, 3800)),
+    ("Sabun Mandi", "pcs", (4000, 9000)),
+    ("Teh Celup", "box", (6000, 11000)),
+    ("Air Mineral 600ml", "pcs", (3000, 4500)),
+    ("Apel Fuji", "gram", (40, 60)),
+    ("Deterjen 800g", "pcs", (18000, 26000)),
+]
+
+def fake_invoice(content: bytes, page: bool = False) -> dict:
+    """
+    Plausible invoice data derived from the file content
+
+    The same bytes always give the same invoice, so runs are reproducible
+    and re-uploads agree with the first extraction.
+    """
+    rng = random.Random(hashlib.sha256(content).digest())
+    details = []
+    for _ in range(rng.randint(1, 8)):
+        name, unit, (low, high) = rng.choice(PRODUCTS)
+        quantity = rng.randint(100, 1500) if unit == "gram" else rng.randint(1, 6)
+        amount = round(quantity * rng.randint(low, high), -2)
+        discount = rng.choice([0, 0, 0, round(amount * 0.1, -2)])
+        details.append({
+            "product_name": name, "quantity": quantity, "unit": unit, "amount": amount, "discount": discount
+        })
+
+    invoice = {
+        "store_name": rng.choice(STORES),
+        "invoice_date": (date(2025, 1, 1) + timedelta(days=rng.randrange(365))).isoformat(),
+        "total": sum(d["amount"] - d["discount"] for d in details),
+        "details": details
+    }
+    if page and rng.random() < 0.5:
+        # Later statement pages usually carry only line items
+        invoice.update(store_name=None, invoice_date=None, total=None)
+    return invoice
+
+def unavailable_error() -> Exception:
+    return genai_errors.ServerError(503, {"error": {"code": 503, "message": "The model is overloaded", "status": "UNAVAILABLE"}})
+
+def quota_error() -> Exception:
+    return genai_errors.ClientError(429, {"error": {"code": 429, "message": "Resource exhausted", "status": "RESOURCE_EXHAUSTED"}})
+
+class FakeGenaiClient:
+    """
+    Local stand-in for genai.Client that injects latency and errors
+
+    Exposes the client.models.generate_content and
+    client.aio.models.generate_content calls GeminiService makes. Each call
+    first pops the next entry of script, if any: None succeeds, an exception
+    (or exception factory) is raised. Once the script is used up, calls fail
+    with error() at error_rate. Successful calls return response, which may
+    be a dict or a function of the request contents.
+    """
+
+    def __init__(
+        self,
+        response: Union[dict, Callable[[list], dict]] = DEFAULT_RESPONSE,
+        latency: Union[float, Callable[[], float]] = 0.0,
+        error_rate: float = 0.0,
+        error: Callable[[], Exception] = unavailable_error,
+        script: Optional[list] = None,
+        seed: Optional[int] = None,
+        prompt_tokens: int = 1500,
+        output_tokens: int = 300
+    ):
+        self.response = response
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error = error
+        self.script = list(script or [])
+        self.prompt_tokens = prompt_tokens
+        self.output_tokens = output_tokens
+        self.calls = 0
+        self._random = random.Random(seed)
+        self.models = SimpleNamespace(generate_content=self._generate)
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content=self._generate_async))
+
+    def _delay(self) -> float:
+        return self.latency() if callable(self.latency) else self.latency
+
+    def _outcome(self, contents: list):
+        if self.script:
+            planned = self.script.pop(0)
+            if planned is not None:
+                raise planned() if callable(planned) else planned
+        elif self.error_rate and self._random.random() < self.error_rate:
+            raise self.error()
+
+        data = self.response(contents) if callable(self.response) else self.response
+        return SimpleNamespace(
+            text=json.dumps(data),
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=self.prompt_tokens,
+                candidates_token_count=self.output_tokens,
+                thoughts_token_count=None,
+                total_token_count=self.prompt_tokens + self.output_tokens
+            )
+        )
+
+    def _generate(self, model: str, contents: list, config=None):
+        self.calls += 1
+        time.sleep(self._delay())
+        return self._outcome(contents)
+
+    async def _generate_async(self, model: str, contents: list, config=None):
+        self.calls += 1
+        await asyncio.sleep(self._delay())
+        return self._outcome(contents)
+
+class FakeExtractionBackend(GeminiService):
+    """
+    GeminiService talking to a FakeGenaiClient that returns realistic invoices
+
+    Calls still go through the JSON parsing and the caller's concurrency cap,
+    deadlines and retries, so load tests measure everything but the API.
+    Multi-image requests get one invoice per image.
+    There is no quota to protect, so the RPM/TPM limits are off.
+    """
+
+    def __init__(self, latency_ms: float, latency_sigma: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        latency_random = random.Random(seed)
+        median = latency_ms / 1000
+
+        def latency() -> float:
+            # Lognormal: most calls near the median, with a long slow tail like the real API
+            if latency_sigma <= 0:
+                return median
+            return latency_random.lognormvariate(math.log(median), latency_sigma) if median > 0 else 0.0
+
+        def response(contents: list) -> Union[dict, list]:
+            prompt, parts = contents[0], [part for part in contents if not isinstance(part, str)]
+            if prompt is BATCH_EXTRACTION_PROMPT:
+                return [
+                    {"image_index": index, **fake_invoice(part.inline_data.data)}
+                    for index, part in enumerate(parts)
+                ]
+            return fake_invoice(parts[0].inline_data.data, page=prompt is PAGE_EXTRACTION_PROMPT)
+
+        client = FakeGenaiClient(response=response, latency=latency, error_rate=error_rate, seed=seed)
+        caller = GeminiCaller.from_settings()
+        caller.requests.rate = caller.tokens.rate = 0
+        super().__init__(client=client, caller=caller)
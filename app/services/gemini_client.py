@@ -0,0 +1,315 @@
+from app.config import settings
+from app.utils.metrics import GEMINI_BREAKER_STATE, GEMINI_HEDGES, GEMINI_IN_FLIGHT, GEMINI_RETRIES, timed
+from typing import Awaitable, Callable, Optional, TypeVar
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# HTTP statuses worth retrying: quota exhaustion and server-side failures
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class GeminiUnavailableError(Exception):
+    """Gemini could not be reached in time; the request may succeed if retried later"""
+
+    def __init__(self, message: str, retry_after: float = 0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failed call is worth retrying"""
+    # Imported on first failure rather than at startup
+    from google.genai import errors as genai_errors
+    import httpx
+
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    if isinstance(error, genai_errors.APIError):
+        return error.code in TRANSIENT_STATUS_CODES
+    return isinstance(error, (httpx.TransportError, ConnectionError))
+
+class TokenBucket:
+    """
+    Async token bucket refilled continuously at rate tokens per second
+
+    Waiters are served in arrival order. A rate of 0 or less disables the limit.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1) -> float:
+        """Wait until amount tokens are available and take them; returns seconds waited"""
+        if not self.enabled:
+            return 0.0
+        # A single call bigger than the bucket could never run otherwise
+        amount = min(amount, self.capacity)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return time.monotonic() - started
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+
+    def try_acquire(self, amount: float = 1) -> bool:
+        """Take amount tokens only if available right now and nobody is waiting"""
+        if not self.enabled:
+            return True
+        if self._lock is not None and self._lock.locked():
+            return False
+        self._refill()
+        if self._tokens >= min(amount, self.capacity):
+            self._tokens -= min(amount, self.capacity)
+            return True
+        return False
+
+    def settle(self, delta: float):
+        """Charge (or refund) the difference between an estimated and the actual cost"""
+        if self.enabled:
+            self._refill()
+            # May go negative: the debt delays the next callers instead of overshooting quota
+            self._tokens = min(self.capacity, self._tokens - delta)
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing dependency for a while instead of queueing them up
+
+    Opens after failure_threshold consecutive transient failures. After
+    reset_seconds one probe call is let through: success closes the
+    circuit, failure opens it again. A threshold of 0 disables the breaker.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def check(self) -> bool:
+        """
+        Raise if calls should not be attempted right now
+
+        Returns:
+            bool: True if this call is the half-open probe, which must end in
+            record_success, record_failure or release_probe
+
+        Raises:
+            GeminiUnavailableError: While the circuit is open
+        """
+        if self.failure_threshold <= 0 or self.state == "closed":
+            return False
+        remaining = self._opened_at + self.reset_seconds - time.monotonic()
+        if self.state == "open" and remaining <= 0:
+            self._set_state("half_open")
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        raise GeminiUnavailableError(
+            "Gemini is failing; not sending requests until it recovers",
+            retry_after=max(remaining, 1.0)
+        )
+
+    def record_success(self):
+        self._failures = 0
+        self._probing = False
+        if self.state != "closed":
+            logger.info("Gemini circuit closed")
+            self._set_state("closed")
+
+    def record_failure(self):
+        self._failures += 1
+        self._probing = False
+        if self.failure_threshold <= 0:
+            return
+        if self.state == "half_open" or self._failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning("Gemini circuit opened after %d failures", self._failures)
+            self._opened_at = time.monotonic()
+            self._set_state("open")
+
+    def release_probe(self):
+        """Give up the probe without an outcome (the call was cancelled); the next call probes instead"""
+        self._probing = False
+
+    def _set_state(self, state: str):
+        self.state = state
+        GEMINI_BREAKER_STATE.set({"closed": 0, "half_open": 1, "open": 2}[state])
+
+class GeminiCaller:
+    """
+    Runs Gemini calls under quota limits, deadlines, retries and a circuit breaker
+
+    Each attempt takes one request from the RPM bucket and an estimate of its
+    tokens from the TPM bucket (corrected once the real usage is known), waits
+    for a concurrency slot, and must finish within timeout seconds. Transient
+    failures are retried with jittered exponential backoff. If hedge_after is
+    set, an attempt still running after that many seconds is raced against a
+    second identical call, quota permitting.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        max_concurrency: int,
+        timeout: float,
+        max_retries: int,
+        retry_base_delay: float,
+        retry_max_delay: float,
+        breaker_failures: int,
+        breaker_reset_seconds: float,
+        hedge_after: Optional[float] = None
+    ):
+        self.requests = TokenBucket(requests_per_minute / 60, max(requests_per_minute / 60, 1))
+        self.tokens = TokenBucket(tokens_per_minute / 60, max(tokens_per_minute / 60, 1))
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.breaker = CircuitBreaker(breaker_failures, breaker_reset_seconds)
+        self.hedge_after = hedge_after
+        self._semaphore = None
+
+    @classmethod
+    def from_settings(cls) -> "GeminiCaller":
+        return cls(
+            requests_per_minute=settings.gemini_rpm_limit,
+            tokens_per_minute=settings.gemini_tpm_limit,
+            max_concurrency=settings.gemini_max_concurrency,
+            timeout=settings.gemini_timeout_seconds,
+            max_retries=settings.gemini_max_retries,
+            retry_base_delay=settings.gemini_retry_base_delay,
+            retry_max_delay=settings.gemini_retry_max_delay,
+            breaker_failures=settings.gemini_breaker_failures,
+            breaker_reset_seconds=settings.gemini_breaker_reset_seconds,
+            hedge_after=settings.gemini_hedge_after_seconds
+        )
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """Caps the number of Gemini calls in flight from this process"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def call(
+        self,
+        request: Callable[[], Awaitable[T]],
+        estimated_tokens: int,
+        used_tokens: Callable[[T], Optional[int]] = lambda response: None
+    ) -> T:
+        """
+        Run request with rate limiting, deadlines, retries and the circuit breaker
+
+        Args:
+            request: Makes one API call; called again for every retry or hedge
+            estimated_tokens: Tokens the call is expected to use, charged up front
+            used_tokens: Reads the actual token count from a response, if known
+
+        Raises:
+            GeminiUnavailableError: Circuit open, or every attempt failed transiently
+            Exception: Non-transient errors from request, unchanged
+        """
+        for attempt in range(self.max_retries + 1):
+            probe = self.breaker.check()
+            try:
+                response = await self._attempt(request, estimated_tokens)
+            except asyncio.CancelledError:
+                # Says nothing about Gemini, but a probe left taken would keep the circuit shut for good
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    # The API answered, it just didn't like this request
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                reason = "timeout" if isinstance(e, asyncio.TimeoutError) else type(e).__name__
+                if attempt == self.max_retries:
+                    raise GeminiUnavailableError(
+                        f"Gemini unavailable after {attempt + 1} attempts: {reason} {e}".strip(),
+                        retry_after=self.retry_max_delay
+                    ) from e
+                GEMINI_RETRIES.inc(reason=reason)
+                # Full jitter keeps a burst of failed callers from retrying in lockstep
+                delay = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+                logger.info("Gemini call failed (%s), retrying in %.2fs", reason, delay)
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            actual = used_tokens(response)
+            if actual is not None:
+                # Only what acquire() actually charged is corrected
+                self.tokens.settle(actual - min(estimated_tokens, self.tokens.capacity))
+            return response
+
+    async def _attempt(self, request: Callable[[], Awaitable[T]], estimated_tokens: int) -> T:
+        with timed("rate_limit_wait"):
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimated_tokens)
+
+        first = asyncio.ensure_future(self._run(request))
+        racers = {first}
+        try:
+            if self.hedge_after is None:
+                return await first
+
+            done, _ = await asyncio.wait(racers, timeout=self.hedge_after)
+            if done or not self._try_acquire_hedge(estimated_tokens):
+                return await first
+
+            GEMINI_HEDGES.inc()
+            racers.add(asyncio.ensure_future(self._run(request)))
+            error = None
+            while racers:
+                done, racers = await asyncio.wait(racers, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # The losing hedge, or everything if the caller was cancelled
+            for task in racers:
+                task.cancel()
+
+    def _try_acquire_hedge(self, estimated_tokens: int) -> bool:
+        """Take quota for a hedge only if both buckets have it right now"""
+        if not self.requests.try_acquire(1):
+            return False
+        if not self.tokens.try_acquire(estimated_tokens):
+            # Hand the request back rather than spend RPM on a hedge that is never sent
+            self.requests.settle(-1)
+            return False
+        return True
+
+    async def _run(self, request: Callable[[], Awaitable[T]]) -> T:
+        async with self.semaphore:
+            with GEMINI_IN_FLIGHT.track():
+                return await asyncio.wait_for(request(), timeout=self.timeout)
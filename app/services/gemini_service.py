@@ -1,33 +1,15 @@
-from google import genai
-from google.genai import types
 from app.config import settings
+from app.services.extraction_backend import ExtractionBackend
+from app.services.gemini_client import GeminiCaller, GeminiUnavailableError
+from app.utils.metrics import GEMINI_ERRORS, GEMINI_REQUESTS, GEMINI_TOKENS, timed
+from typing import Callable, Optional, TypeVar
 import json
-from PIL import Image
-import io
 
-class GeminiService:
-    def __init__(self):
-        self.client = genai.Client(api_key=settings.gemini_api_key)
-        self.model_name = settings.gemini_flash_3
-    
-    def extract_invoice_data(self, image_bytes: bytes, mime_type: str) -> dict:
-        """
-        Extract structured data from invoice image using Gemini Vision
-        
-        Args:
-            image_bytes: Raw bytes of the image
-            mime_type: MIME type of the image (e.g., 'image/jpeg')
-        
-        Returns:
-            dict: Structured invoice data
-        """
-        # Prepare the image for Gemini
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Create the prompt for extraction
-        prompt = """
+T = TypeVar("T")
+
+EXTRACTION_PROMPT = """
         Analyze this invoice image and extract the following information in JSON format:
-        
+
         {
           "store_name": "Name of the vendor/store",
           "invoice_date": "Date in YYYY-MM-DD format",
@@ -42,7 +24,7 @@ class GeminiService:
             }
           ]
         }
-        
+
         Important:
         - Return ONLY valid JSON, no markdown code blocks or additional text
         - Ensure all numeric values are numbers, not strings
@@ -51,25 +33,239 @@ class GeminiService:
         - If you can't find a field, use null for that field or 0 if the field required numerical value
         - Extract ALL line items from the invoice into the details array
         """
-        
+
+PAGE_EXTRACTION_PROMPT = """
+        This document is ONE page of a multi-page invoice or supplier statement.
+        Extract the information visible on this page in JSON format:
+
+        {
+          "store_name": "Name of the vendor/store, or null if not shown on this page",
+          "invoice_date": "Date in YYYY-MM-DD format, or null if not shown on this page",
+          "total": numeric grand total after discounts, or null if not shown on this page,
+          "details": [
+            {
+              "product_name": "Name of product/service",
+              "quantity": numeric quantity,
+              "unit": "unit of measurement (liter, pcs, box)",
+              "amount": numeric amount for this item before discount,
+              "discount": numeric discount for the product
+            }
+          ]
+        }
+
+        Important:
+        - Return ONLY valid JSON, no markdown code blocks or additional text
+        - Ensure all numeric values are numbers, not strings
+        - Only include line items printed on this page; do not include subtotals carried over from other pages
+        - If the quantity written in string, extract only the numerical value from the string.
+        - If the unit of measurement is missing, use the most likely unit for the product, such as grams for fruit products, or use 'pcs' as the default.
+        - Use an empty details array if the page has no line items
+        """
+
+BATCH_EXTRACTION_PROMPT = """
+        The following images are SEPARATE invoices or receipts. Each image is preceded by a label
+        "Image N:", with N counting from 0. Extract each one on its own and return a JSON array
+        with exactly one object per image, in image order:
+
+        [
+          {
+            "image_index": N,
+            "store_name": "Name of the vendor/store",
+            "invoice_date": "Date in YYYY-MM-DD format",
+            "total": numeric value of total amount after discounts,
+            "details": [
+              {
+                "product_name": "Name of product/service",
+                "quantity": numeric quantity,
+                "unit": "unit of measurement (liter, pcs, box)",
+                "amount": numeric amount for this item before discount,
+                "discount": numeric discount for the product
+              }
+            ]
+          }
+        ]
+
+        Important:
+        - Return ONLY valid JSON, no markdown code blocks or additional text
+        - Never mix information or line items between images
+        - Ensure all numeric values are numbers, not strings
+        - If the quantity written in string, extract only the numerical value from the string.
+        - If the unit of measurement is missing, use the most likely unit for the product, such as grams for fruit products, or use 'pcs' as the default.
+        - If you can't find a field, use null for that field or 0 if the field required numerical value
+        - Extract ALL line items from each invoice into its details array
+        """
+
+REQUIRED_FIELDS = ['store_name', 'invoice_date', 'total', 'details']
+
+class GeminiService(ExtractionBackend):
+    def __init__(self, client=None, caller: Optional[GeminiCaller] = None):
+        """
+        Args:
+            client: genai.Client, or a stand-in such as FakeGenaiClient for tests and benchmarks
+            caller: Rate limiting, retry and circuit breaker policy for async calls
+        """
+        self._client = client
+        self.model_name = settings.gemini_flash_3
+        self.caller = caller if caller is not None else GeminiCaller.from_settings()
+
+    @property
+    def client(self):
+        """genai.Client, built on first use: google.genai is slow to import"""
+        if self._client is None:
+            from google import genai
+            self._client = genai.Client(api_key=settings.gemini_api_key)
+        return self._client
+
+    async def extract_invoice_data_async(
+        self,
+        image_bytes: bytes,
+        mime_type: str,
+        prompt: Optional[str] = None
+    ) -> dict:
+        """
+        Extract structured data from an invoice image or PDF using the async Gemini client
+
+        The raw bytes are sent as an inline part, so nothing is decoded on the
+        event loop. Calls go through self.caller, which applies the RPM/TPM
+        quota, concurrency cap, per-attempt deadline, retries and circuit breaker.
+
+        Args:
+            image_bytes: Raw bytes of the image
+            mime_type: MIME type of the image (e.g., 'image/jpeg' or 'application/pdf')
+            prompt: Extraction instructions sent along with the file
+
+        Returns:
+            dict: Structured invoice data
+
+        Raises:
+            GeminiUnavailableError: Gemini is down or over quota; worth retrying later
+            ValueError: The request was rejected or the response was unusable
+        """
+        from google.genai import types
+
+        part = types.Part.from_bytes(data=image_bytes, mime_type=mime_type)
+        return await self._generate(
+            [prompt or EXTRACTION_PROMPT, part],
+            settings.gemini_tokens_per_call,
+            self._parse_response
+        )
+
+    async def extract_invoice_batch_async(self, images: list[tuple[bytes, str]]) -> list[Optional[dict]]:
+        """
+        Extract several separate invoices with one request
+
+        The prompt is sent once for all images, and the response is an array
+        keyed by image index.
+
+        Args:
+            images: (image_bytes, mime_type) per invoice
+
+        Returns:
+            list: Structured invoice data per image, in order; None for any
+            image the response had no usable result for
+
+        Raises:
+            GeminiUnavailableError: Gemini is down or over quota; worth retrying later
+            ValueError: The request was rejected or the response was unusable as a whole
+        """
+        from google.genai import types
+
+        contents = [BATCH_EXTRACTION_PROMPT, f"There are {len(images)} images."]
+        for index, (image_bytes, mime_type) in enumerate(images):
+            contents.append(f"Image {index}:")
+            contents.append(types.Part.from_bytes(data=image_bytes, mime_type=mime_type))
+        return await self._generate(
+            contents,
+            settings.gemini_tokens_per_call * len(images),
+            lambda text: self._parse_batch_response(text, len(images))
+        )
+
+    async def _generate(self, contents: list, estimated_tokens: int, parse: Callable[[str], T]) -> T:
+        """Make one async call through self.caller and parse its JSON, recording metrics"""
+        from google.genai import types
+
+        config = types.GenerateContentConfig(
+            response_mime_type='application/json' # Forces JSON output
+        )
+
         try:
-            # Generate content with image
-            response = self.client.models.generate_content(
-                model=self.model_name,
-                contents=[prompt, image],
-                config=types.GenerateContentConfig(
-                    response_mime_type='application/json' # Forces JSON output
+            with timed("gemini"):
+                response = await self.caller.call(
+                    lambda: self.client.aio.models.generate_content(
+                        model=self.model_name,
+                        contents=contents,
+                        config=config
+                    ),
+                    estimated_tokens=estimated_tokens,
+                    used_tokens=_total_tokens
                 )
-            )
-            result = json.loads(response.text)
-            
-            # Validate required fields
-            if not all(key in result for key in ['store_name', 'invoice_date', 'total', 'details']):
-                raise ValueError("Missing required fields in extracted data")
-            
-            return result
-            
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Failed to parse JSON from Gemini response: {str(e)}")
+            _record_usage(response)
+            result = parse(response.text)
+
+        except GeminiUnavailableError as e:
+            _record_failure(e)
+            raise
+        except ValueError as e:
+            _record_failure(e)
+            raise
         except Exception as e:
+            _record_failure(e)
             raise ValueError(f"Error processing image with Gemini: {str(e)}")
+
+        GEMINI_REQUESTS.inc(outcome="ok")
+        return result
+
+    @staticmethod
+    def _parse_response(text: str) -> dict:
+        """Parse and validate the JSON returned by Gemini"""
+        try:
+            result = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Failed to parse JSON from Gemini response: {str(e)}")
+
+        # Validate required fields
+        if not isinstance(result, dict) or not all(key in result for key in REQUIRED_FIELDS):
+            raise ValueError("Missing required fields in extracted data")
+
+        return result
+
+    @staticmethod
+    def _parse_batch_response(text: str, count: int) -> list[Optional[dict]]:
+        """Parse the array returned for a multi-image request into one result per image"""
+        try:
+            items = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Failed to parse JSON from Gemini response: {str(e)}")
+        if not isinstance(items, list):
+            raise ValueError("Expected a JSON array with one invoice per image")
+
+        results = [None] * count
+        for position, item in enumerate(items):
+            if not isinstance(item, dict) or not all(key in item for key in REQUIRED_FIELDS):
+                continue
+            index = item.pop('image_index', position)
+            # Anything ambiguous is left for a single-image retry rather than risk a mix-up
+            if isinstance(index, int) and 0 <= index < count and results[index] is None:
+                results[index] = item
+        return results
+
+def _record_usage(response):
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    for kind, field in (('prompt', 'prompt_token_count'), ('output', 'candidates_token_count'), ('thinking', 'thoughts_token_count')):
+        count = getattr(usage, field, None)
+        if count:
+            GEMINI_TOKENS.inc(count, kind=kind)
+
+def _total_tokens(response) -> Optional[int]:
+    usage = getattr(response, 'usage_metadata', None)
+    return getattr(usage, 'total_token_count', None) if usage is not None else None
+
+def _record_failure(error: Exception):
+    GEMINI_REQUESTS.inc(outcome="error")
+    if isinstance(error, GeminiUnavailableError):
+        GEMINI_ERRORS.inc(error="unavailable")
+    else:
+        # Our own ValueErrors mean Gemini answered but the JSON was unusable
+        GEMINI_ERRORS.inc(error="invalid_response" if isinstance(error, ValueError) else type(error).__name__)
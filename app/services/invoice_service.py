@@ -0,0 +1,793 @@
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models.invoice import Invoice, InvoiceItem
+from app.models.page_extraction import PageExtraction
+from app.schemas.invoice import InvoiceResponse, InvoiceSearchResult, PreprocessMetrics
+from app.services.claim_service import ClaimService
+from app.services.gemini_client import GeminiUnavailableError
+from app.services.extraction_backend import ExtractionBackend
+from app.services.gemini_service import PAGE_EXTRACTION_PROMPT
+from app.services.item_service import ItemService
+from app.services.rollup_service import RollupService
+from app.services.search_service import InvoiceSearchIndex
+from app.utils.file_handler import (
+    SpooledUpload, convert_to_supported_format, calculate_perceptual_hash, store_content_addressed
+)
+from app.utils.bloom_filter import CountingBloomFilter
+from app.utils.hamming_index import HammingIndex
+from app.utils.image_preprocess import preprocess_image, resolve_options
+from app.utils.lru_cache import LRUCache
+from app.utils.metrics import HASH_LOOKUPS, UPLOADS, timed
+from app.utils.pdf_handler import count_pdf_pages, iter_pdf_pages
+from app.config import settings
+from datetime import date, datetime
+from itertools import groupby
+from operator import itemgetter
+from typing import AsyncIterator, Optional
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# SQL parameter lists are chunked to stay under driver limits
+HASH_LOOKUP_CHUNK = 500
+
+# Perceptual hashes are 64-bit
+PHASH_BITS = 64
+
+PHASH_TYPES = ['image/png', 'image/jpeg', 'image/jpg', 'image/webp']
+
+class InvoiceService:
+    """Upload pipeline shared by the upload endpoints and the extraction job workers"""
+
+    def __init__(self, extractor: ExtractionBackend):
+        self.extractor = extractor
+        self.similarity_index = HammingIndex(settings.near_duplicate_threshold, PHASH_BITS)
+        self.known_hashes = CountingBloomFilter(settings.hash_filter_capacity, settings.hash_filter_error_rate)
+        self.response_cache = LRUCache(settings.response_cache_size, settings.response_cache_ttl_seconds)
+        # Built in the background at startup (warm_search_index), with its own watermark
+        self.search_index = InvoiceSearchIndex()
+        self._search_watermark = 0
+        self._search_refreshed = 0.0
+        self._search_lock = threading.Lock()
+        # Highest invoice id loaded into the in-memory indexes, and when they were last refreshed
+        self._indexes_watermark = 0
+        self._indexes_refreshed = 0.0
+        self._refresh_lock = threading.Lock()
+        # Extractions running in this process by (file hash, use_caches); concurrent misses of the same
+        # file wait on them. A forced reprocess never joins a plain upload, which may return a stored result.
+        self._in_flight: dict[tuple[str, bool], asyncio.Future] = {}
+        # Identifies this process's leases in upload_claims
+        self.claim_owner = f"{socket.gethostname()[:40]}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.preprocess_options = resolve_options(
+            settings.preprocess_preset,
+            max_edge=settings.preprocess_max_edge,
+            grayscale=settings.preprocess_grayscale,
+            autocrop=settings.preprocess_autocrop,
+            quality=settings.preprocess_quality,
+            target_bytes=settings.preprocess_target_bytes
+        )
+
+    def warm_indexes(self):
+        """Load stored file and perceptual hashes into the in-memory lookup indexes"""
+        with SessionLocal() as db:
+            self._refresh_indexes(db)
+        logger.info("Loaded %d file hashes and %d perceptual hashes", len(self.known_hashes), len(self.similarity_index))
+
+    def warm_search_index(self):
+        """Load store and product names of stored invoices into the search index"""
+        with SessionLocal() as db:
+            self._refresh_search_index(db)
+        logger.info("Indexed %d invoices for search", len(self.search_index))
+
+    def forget(self, invoice_id: int, file_hash: str):
+        """Drop a deleted invoice from the in-memory indexes"""
+        self.similarity_index.remove(invoice_id)
+        self.search_index.remove(invoice_id)
+        self.response_cache.invalidate(file_hash)
+        with self._refresh_lock:
+            # Only what was counted into the filter may be taken out of it
+            if invoice_id <= self._indexes_watermark:
+                self.known_hashes.remove(file_hash)
+
+    def find_by_hash(self, db: Session, file_hash: str) -> Optional[InvoiceResponse]:
+        """
+        Stored invoice for a file hash, answered from memory where possible
+
+        Recently used invoices come from the response cache. A hash the Bloom
+        filter has never seen is a miss without a query, once the filter has
+        caught up with invoices stored by other processes.
+
+        Returns:
+            InvoiceResponse: A copy the caller may modify, or None if not stored
+        """
+        cached = self.response_cache.get(file_hash)
+        if cached is not None:
+            HASH_LOOKUPS.inc(source="memory")
+            return cached.model_copy()
+
+        if file_hash not in self.known_hashes:
+            self._refresh_indexes(db, max_age=settings.hash_filter_refresh_seconds)
+            if file_hash not in self.known_hashes:
+                HASH_LOOKUPS.inc(source="filter")
+                return None
+
+        invoice = _find_by_hash(db, file_hash)
+        if invoice is None:
+            HASH_LOOKUPS.inc(source="false_positive")
+            return None
+        HASH_LOOKUPS.inc(source="database")
+        return self._remember(invoice)
+
+    def find_many_by_hash(self, file_hashes: list[str]) -> dict[str, InvoiceResponse]:
+        """Batch version of find_by_hash; returns the stored invoices by hash"""
+        found = {}
+        for file_hash in file_hashes:
+            cached = self.response_cache.get(file_hash)
+            if cached is not None:
+                found[file_hash] = cached.model_copy()
+        HASH_LOOKUPS.inc(len(found), source="memory")
+
+        remaining = [file_hash for file_hash in file_hashes if file_hash not in found]
+        if not remaining:
+            return found
+
+        with SessionLocal() as db:
+            self._refresh_indexes(db, max_age=settings.hash_filter_refresh_seconds)
+            candidates = [file_hash for file_hash in remaining if file_hash in self.known_hashes]
+            HASH_LOOKUPS.inc(len(remaining) - len(candidates), source="filter")
+
+            stored = 0
+            for start in range(0, len(candidates), HASH_LOOKUP_CHUNK):
+                chunk = candidates[start:start + HASH_LOOKUP_CHUNK]
+                for invoice in db.query(Invoice).filter(Invoice.file_hash.in_(chunk)):
+                    found[invoice.file_hash] = self._remember(invoice)
+                    stored += 1
+            HASH_LOOKUPS.inc(stored, source="database")
+            HASH_LOOKUPS.inc(len(candidates) - stored, source="false_positive")
+        return found
+
+    def search(
+        self,
+        db: Session,
+        store: Optional[str] = None,
+        product: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        min_score: Optional[float] = None,
+        limit: int = 50,
+        skip: int = 0
+    ) -> tuple[list[InvoiceSearchResult], int]:
+        """
+        Fuzzy search by store name and/or product name, best matches first
+
+        Matching and ranking run on the in-memory search index; only the
+        page of results is read from the database. Waits for the index if it
+        is still being built.
+
+        Returns:
+            tuple: (results for the page, total number of matches)
+
+        Raises:
+            ValueError: Neither store nor product was given
+        """
+        if min_score is None:
+            min_score = settings.search_min_score
+        self._refresh_search_index(db, max_age=settings.search_refresh_seconds)
+        page, total = self.search_index.search(store, product, start_date, end_date, min_score, limit, skip)
+
+        invoices = {
+            invoice.id: invoice
+            for invoice in db.query(Invoice).filter(Invoice.id.in_([invoice_id for invoice_id, _ in page]))
+        }
+        results = []
+        for invoice_id, score in page:
+            invoice = invoices.get(invoice_id)
+            if invoice is None:
+                # Deleted by another worker process
+                self.search_index.remove(invoice_id)
+                total -= 1
+                continue
+            result = InvoiceSearchResult.model_validate(invoice)
+            result.score = score
+            results.append(result)
+        return results, total
+
+    async def process(
+        self,
+        db: Session,
+        upload: SpooledUpload,
+        force_reprocess: bool = False
+    ) -> InvoiceResponse:
+        """
+        Run one upload through the cache check, extraction and storage steps
+
+        The spooled file is moved into content-addressed storage when a new
+        invoice is stored, and discarded otherwise.
+
+        Args:
+            db: Database session used for the lookup and the write
+            upload: Upload spooled to disk, with its hash already computed
+            force_reprocess: Re-run extraction even if the hash is already stored
+
+        Returns:
+            InvoiceResponse: Stored invoice, with is_cached set on cache hits
+        """
+        try:
+            # Check if invoice already exists in database (cache check)
+            if not force_reprocess:
+                with timed("cache_lookup"):
+                    existing_invoice = await run_in_threadpool(_released, db, self.find_by_hash, upload.file_hash)
+                if existing_invoice:
+                    UPLOADS.inc(result="hit")
+                    existing_invoice.is_cached = True
+                    return existing_invoice
+
+            return await self._process_miss(db, upload, use_caches=not force_reprocess)
+        finally:
+            await run_in_threadpool(upload.discard)
+
+    async def process_batch(
+        self,
+        uploads: list[SpooledUpload],
+        force_reprocess: bool = False
+    ) -> AsyncIterator[dict]:
+        """
+        Process many uploads concurrently, yielding one result per file as it completes
+
+        Files are deduplicated by hash within the batch and against stored
+        invoices, so each unique new file is extracted exactly once. Failures
+        are reported per file instead of aborting the batch.
+
+        Args:
+            uploads: Spooled uploads, in request order
+            force_reprocess: Re-run extraction even if the hash is already stored
+
+        Yields:
+            dict: BatchUploadResult payload for one file
+        """
+        # Group files by hash; the first file of each group is the one extracted
+        groups: dict[str, list[int]] = {}
+        for index, upload in enumerate(uploads):
+            groups.setdefault(upload.file_hash, []).append(index)
+
+        existing = {}
+        if not force_reprocess:
+            with timed("cache_lookup"):
+                existing = await run_in_threadpool(self.find_many_by_hash, list(groups))
+
+        pending = []
+        try:
+            for file_hash, indexes in groups.items():
+                # Only the leader of a group is ever read again
+                followers = [uploads[index] for index in indexes[1:]]
+                if file_hash in existing:
+                    followers.append(uploads[indexes[0]])
+                await run_in_threadpool(lambda: [upload.discard() for upload in followers])
+
+                if file_hash in existing:
+                    UPLOADS.inc(len(indexes), result="hit")
+                    for index in indexes:
+                        yield _batch_result(index, uploads[index].filename, existing[file_hash], True)
+                else:
+                    pending.append(asyncio.ensure_future(
+                        self._process_group(uploads, indexes, force_reprocess)
+                    ))
+
+            for next_done in asyncio.as_completed(pending):
+                for result in await next_done:
+                    yield result
+        finally:
+            # Client went away mid-stream: stop paying for extractions nobody will read
+            for task in pending:
+                task.cancel()
+
+    async def _process_group(
+        self,
+        uploads: list[SpooledUpload],
+        indexes: list[int],
+        force_reprocess: bool
+    ) -> list[dict]:
+        leader = uploads[indexes[0]]
+        db = SessionLocal()
+        try:
+            response = await self._process_miss(db, leader, use_caches=not force_reprocess)
+        except GeminiUnavailableError as e:
+            return [_batch_error(index, uploads[index].filename, 503, str(e)) for index in indexes]
+        except ValueError as e:
+            return [_batch_error(index, uploads[index].filename, 422, str(e)) for index in indexes]
+        except Exception as e:
+            detail = f"Error processing invoice: {str(e)}"
+            return [_batch_error(index, uploads[index].filename, 500, detail) for index in indexes]
+        finally:
+            await run_in_threadpool(leader.discard)
+            await run_in_threadpool(db.close)
+
+        # Later copies of the leader's file within the batch are served from its result
+        UPLOADS.inc(len(indexes) - 1, result="hit")
+        results = [_batch_result(indexes[0], leader.filename, response, response.is_cached)]
+        results.extend(_batch_result(index, uploads[index].filename, response, True) for index in indexes[1:])
+        return results
+
+    async def _process_miss(
+        self,
+        db: Session,
+        upload: SpooledUpload,
+        use_caches: bool = True
+    ) -> InvoiceResponse:
+        """
+        Serve an exact-hash miss, extracting each file once however many requests upload it at once
+
+        The first miss of a file in this process does the work; concurrent
+        misses of the same file wait for it and get its result as cached.
+        Across worker processes a lease in upload_claims does the same.
+        """
+        key = (upload.file_hash, use_caches)
+        while True:
+            leader = self._in_flight.get(key)
+            if leader is None:
+                break
+            await asyncio.wait({leader})
+            if leader.cancelled():
+                # The request doing the extraction went away; a waiting one takes over
+                continue
+            # Raises the leader's error, which this request would most likely have hit too
+            response = leader.result()
+            UPLOADS.inc(result="coalesced")
+            return response.model_copy(update={"is_cached": True, "preprocessing": None})
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            response = await self._process_claimed(db, upload, use_caches)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark it retrieved; asyncio would log it if no request was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(response)
+            return response
+        finally:
+            del self._in_flight[key]
+
+    async def _process_claimed(self, db: Session, upload: SpooledUpload, use_caches: bool) -> InvoiceResponse:
+        """Extract and store the upload under its lease, or return what the worker holding the lease stored"""
+        lease = settings.upload_claim_lease_seconds
+        if lease <= 0:
+            return await self._extract_and_store(db, upload, use_caches)
+
+        waited = False
+        while True:
+            claimed, taken_over = await run_in_threadpool(
+                ClaimService.claim, db, upload.file_hash, self.claim_owner, lease
+            )
+            if claimed:
+                break
+            waited = True
+            await asyncio.sleep(settings.upload_claim_poll_seconds)
+
+        try:
+            # The holder we waited for, or a worker that died holding the lease, may have stored it.
+            # Otherwise the cache lookup just missed; a worker storing it since is caught on insert.
+            if use_caches and (waited or taken_over):
+                existing = await run_in_threadpool(_released, db, self._find_stored, upload.file_hash)
+                if existing is not None:
+                    UPLOADS.inc(result="coalesced")
+                    return existing
+            return await self._extract_and_store(db, upload, use_caches)
+        finally:
+            # Shielded so a cancelled request still frees the lease instead of leaving it to expire
+            await asyncio.shield(run_in_threadpool(_release_claim, upload.file_hash, self.claim_owner))
+
+    async def _extract_and_store(self, db: Session, upload: SpooledUpload, use_caches: bool) -> InvoiceResponse:
+        """Serve the upload from a near-duplicate, or extract and store it"""
+        # Only misses are ever read back into memory
+        content = await run_in_threadpool(upload.read)
+
+        perceptual_hash = None
+        if upload.content_type in PHASH_TYPES:
+            with timed("perceptual_hash"):
+                perceptual_hash = await run_in_threadpool(_safe_perceptual_hash, content)
+
+        if use_caches and perceptual_hash and settings.near_duplicate_threshold > 0:
+            with timed("similarity_lookup"):
+                similar = await run_in_threadpool(_released, db, self._find_similar, perceptual_hash)
+            if similar:
+                UPLOADS.inc(result="near_duplicate")
+                return similar
+
+        # Convert to supported format if needed
+        with timed("convert"):
+            processed_content, mime_type = await run_in_threadpool(
+                convert_to_supported_format, content, upload.content_type
+            )
+
+        preprocessing = None
+        if mime_type == 'application/pdf':
+            invoice_data = await self._extract_pdf(processed_content, use_caches)
+        else:
+            # Shrink the image before it is uploaded to Gemini
+            with timed("preprocess"):
+                processed_content, mime_type, preprocessing = await run_in_threadpool(
+                    preprocess_image, processed_content, mime_type, self.preprocess_options
+                )
+            logger.info(
+                "Pre-processed %s: %d -> %d bytes in %.3fs",
+                upload.filename, preprocessing["bytes_before"], preprocessing["bytes_after"], preprocessing["seconds"]
+            )
+
+            # Extract structured data using Gemini Vision (only if not cached)
+            invoice_data = await self.extractor.extract_invoice_data_async(processed_content, mime_type)
+
+        # Save original file; identical content is only ever stored once
+        with timed("store_file"):
+            file_path = await run_in_threadpool(store_content_addressed, upload, settings.upload_dir)
+
+        with timed("db_write"):
+            try:
+                db_invoice = await run_in_threadpool(
+                    _save_invoice, db, invoice_data, upload.file_hash, file_path, perceptual_hash
+                )
+            except IntegrityError:
+                # Another worker stored the same file first (claims disabled, or a lease that ran out);
+                # _save_invoice has already rolled back
+                existing = await run_in_threadpool(_released, db, self._find_stored, upload.file_hash)
+                if existing is None:
+                    raise
+                UPLOADS.inc(result="coalesced")
+                return existing
+        UPLOADS.inc(result="miss" if use_caches else "reprocess")
+        if perceptual_hash:
+            self.similarity_index.add(db_invoice.id, int(perceptual_hash, 16))
+        if db_invoice.id <= self._search_watermark:
+            # Reprocessed in place; the search index refresh only picks up new ids
+            self.search_index.add(
+                db_invoice.id, db_invoice.invoice_date, db_invoice.store_name,
+                [detail.get('product_name') for detail in db_invoice.details or []]
+            )
+        else:
+            # The next search refreshes the index whatever its age, so it finds this invoice
+            self._search_refreshed = 0.0
+        # A new invoice joins the Bloom filter; a reprocessed one replaces its cached response
+        await run_in_threadpool(self._refresh_indexes, db)
+        response = self._remember(db_invoice)
+        if preprocessing:
+            response.preprocessing = PreprocessMetrics(**preprocessing)
+        return response
+
+    async def _extract_pdf(self, content: bytes, use_page_cache: bool = True) -> dict:
+        """
+        Extract a PDF page by page and merge the pages into one invoice
+
+        Pages are split off lazily and handed to settings.pdf_page_concurrency
+        workers, so only the pages in flight exist as separate documents.
+        Each page's result is cached by page hash.
+        """
+        try:
+            page_count = await run_in_threadpool(count_pdf_pages, content)
+        except Exception as e:
+            raise ValueError(f"Could not read PDF: {str(e)}")
+        if page_count == 0:
+            raise ValueError("PDF has no pages")
+        if page_count > settings.pdf_max_pages:
+            raise ValueError(f"PDF has {page_count} pages; the limit is {settings.pdf_max_pages}")
+
+        pages = iter_pdf_pages(content)
+        pages_lock = asyncio.Lock()
+        results: dict[int, dict] = {}
+
+        async def page_worker():
+            while True:
+                # The page iterator is not thread-safe: one worker advances it at a time
+                async with pages_lock:
+                    page = await run_in_threadpool(next, pages, None)
+                if page is None:
+                    return
+                page_number, page_bytes, page_hash = page
+                results[page_number] = await self._extract_pdf_page(page_bytes, page_hash, use_page_cache)
+
+        workers = [
+            asyncio.ensure_future(page_worker())
+            for _ in range(min(settings.pdf_page_concurrency, page_count))
+        ]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            # One failed page fails the document: don't keep paying for the rest
+            for worker in workers:
+                worker.cancel()
+
+        return _merge_pages([results[page_number] for page_number in sorted(results)])
+
+    async def _extract_pdf_page(self, page_bytes: bytes, page_hash: str, use_page_cache: bool) -> dict:
+        if use_page_cache:
+            cached = await run_in_threadpool(_load_page_result, page_hash)
+            if cached is not None:
+                return cached
+
+        result = await self.extractor.extract_invoice_data_async(
+            page_bytes, 'application/pdf', prompt=PAGE_EXTRACTION_PROMPT
+        )
+        await run_in_threadpool(_store_page_result, page_hash, result)
+        return result
+
+    def _find_similar(self, db: Session, perceptual_hash: str) -> Optional[InvoiceResponse]:
+        # Pick up invoices stored by other worker processes since the last lookup
+        self._refresh_indexes(db)
+
+        match = self.similarity_index.nearest(int(perceptual_hash, 16))
+        if match is None:
+            return None
+
+        invoice_id, distance = match
+        invoice = db.get(Invoice, invoice_id)
+        if invoice is None:
+            # Deleted by another worker process
+            self.similarity_index.remove(invoice_id)
+            return None
+
+        response = _to_response(invoice, is_cached=True)
+        response.similarity = round(1 - distance / PHASH_BITS, 4)
+        return response
+
+    def _refresh_indexes(self, db: Session, max_age: Optional[float] = None):
+        """
+        Load invoices stored since the last refresh, by this or any other process
+
+        Args:
+            max_age: Skip the query if the last refresh is more recent than this many seconds
+        """
+        # Check out a connection before taking the lock. Otherwise the lock holder can wait
+        # for a pooled connection while every connection is held by a thread waiting for the lock.
+        db.connection()
+        with self._refresh_lock:
+            if max_age is not None and time.monotonic() - self._indexes_refreshed < max_age:
+                return
+            self._indexes_refreshed = time.monotonic()
+
+            rows = db.query(Invoice.id, Invoice.file_hash, Invoice.perceptual_hash).filter(
+                Invoice.id > self._indexes_watermark
+            ).order_by(Invoice.id).yield_per(10000)
+            for invoice_id, file_hash, perceptual_hash in rows:
+                self.known_hashes.add(file_hash)
+                if perceptual_hash:
+                    self.similarity_index.add(invoice_id, int(perceptual_hash, 16))
+                self._indexes_watermark = invoice_id
+
+            if len(self.known_hashes) > self.known_hashes.capacity:
+                # Past capacity the false positive rate climbs; rebuild at twice the size
+                known_hashes = CountingBloomFilter(2 * len(self.known_hashes), settings.hash_filter_error_rate)
+                for (file_hash,) in db.query(Invoice.file_hash).filter(
+                    Invoice.id <= self._indexes_watermark
+                ).yield_per(10000):
+                    known_hashes.add(file_hash)
+                self.known_hashes = known_hashes
+                logger.info("Resized the file hash filter for %d invoices", len(known_hashes))
+
+    def _refresh_search_index(self, db: Session, max_age: Optional[float] = None):
+        """
+        Add invoices stored since the last refresh, by this or any other process, to the search index
+
+        Args:
+            max_age: Skip the query if the last refresh is more recent than this many seconds
+        """
+        # Checked out before the lock, as in _refresh_indexes. Queried directly for plain
+        # rows: ORM row handling would double the time to index every stored invoice.
+        connection = db.connection()
+        with self._search_lock:
+            if max_age is not None and time.monotonic() - self._search_refreshed < max_age:
+                return
+            self._search_refreshed = time.monotonic()
+
+            previous_watermark = self._search_watermark
+            new_invoices = {}
+            for invoice_id, invoice_date, store_name in connection.execute(
+                select(Invoice.id, Invoice.invoice_date, Invoice.store_name).where(
+                    Invoice.id > previous_watermark
+                ).execution_options(yield_per=10000)
+            ):
+                new_invoices[invoice_id] = (invoice_date, store_name)
+            if not new_invoices:
+                return
+            self._search_watermark = max(new_invoices)
+
+            items = connection.execute(
+                select(InvoiceItem.invoice_id, InvoiceItem.product_name).where(
+                    InvoiceItem.invoice_id > previous_watermark,
+                    InvoiceItem.invoice_id <= self._search_watermark
+                ).order_by(InvoiceItem.invoice_id).execution_options(yield_per=10000)
+            )
+            for invoice_id, group in groupby(items, key=itemgetter(0)):
+                if invoice_id in new_invoices:
+                    invoice_date, store_name = new_invoices.pop(invoice_id)
+                    self.search_index.add(invoice_id, invoice_date, store_name, [name for _, name in group])
+            # Invoices without line items
+            for invoice_id, (invoice_date, store_name) in new_invoices.items():
+                self.search_index.add(invoice_id, invoice_date, store_name, ())
+
+    def _find_stored(self, db: Session, file_hash: str) -> Optional[InvoiceResponse]:
+        """Stored invoice for a file hash straight from the database, as a cached response"""
+        invoice = _find_by_hash(db, file_hash)
+        if invoice is None:
+            return None
+        response = self._remember(invoice)
+        response.is_cached = True
+        return response
+
+    def _remember(self, invoice: Invoice) -> InvoiceResponse:
+        """Cache an invoice's response and return a copy for the caller"""
+        response = InvoiceResponse.model_validate(invoice)
+        self.response_cache.put(invoice.file_hash, response)
+        return response.model_copy()
+
+def _released(db: Session, lookup, *args):
+    """
+    Run a read-only lookup on db, then end its transaction in the same thread
+
+    The pooled connection goes back before the upload awaits extraction.
+    Ending it in a later threadpool call is not enough: under load every
+    thread can be waiting for a connection, and this one never gets a thread.
+    """
+    try:
+        return lookup(db, *args)
+    finally:
+        db.rollback()
+
+def _release_claim(file_hash: str, owner: str) -> None:
+    """
+    Release an upload lease on a session of its own
+
+    The request's session may hold a failed invoice write, which releasing on
+    it would commit, and after a cancellation get_db closes it while the
+    shielded release is still running.
+    """
+    with SessionLocal() as db:
+        ClaimService.release(db, file_hash, owner)
+
+def _to_response(invoice: Invoice, is_cached: bool) -> InvoiceResponse:
+    response = InvoiceResponse.model_validate(invoice)
+    response.is_cached = is_cached
+    return response
+
+def _batch_result(index: int, filename: str, invoice: InvoiceResponse, is_cached: bool) -> dict:
+    response = invoice.model_copy(update={"is_cached": is_cached})
+    return {
+        "index": index,
+        "filename": filename,
+        "status": "ok",
+        "status_code": 200,
+        "invoice": response.model_dump(mode="json"),
+        "error": None
+    }
+
+def _batch_error(index: int, filename: str, status_code: int, detail: str) -> dict:
+    return {
+        "index": index,
+        "filename": filename,
+        "status": "error",
+        "status_code": status_code,
+        "invoice": None,
+        "error": detail
+    }
+
+def _merge_pages(pages: list[dict]) -> dict:
+    """Combine per-page extractions, in page order, into one invoice"""
+    store_name = next((page['store_name'] for page in pages if page.get('store_name')), None)
+    invoice_date = next((page['invoice_date'] for page in pages if page.get('invoice_date')), None)
+    details = [item for page in pages for item in (page.get('details') or [])]
+
+    # The grand total is printed last; fall back to the line items if no page shows one
+    totals = [page['total'] for page in pages if page.get('total')]
+    if totals:
+        total = totals[-1]
+    else:
+        total = sum((item.get('amount') or 0) - (item.get('discount') or 0) for item in details)
+
+    if store_name is None:
+        raise ValueError("No store name found on any page of the PDF")
+    if invoice_date is None:
+        raise ValueError("No invoice date found on any page of the PDF")
+
+    return {
+        'store_name': store_name,
+        'invoice_date': invoice_date,
+        'total': total,
+        'details': details
+    }
+
+def _load_page_result(page_hash: str) -> Optional[dict]:
+    with SessionLocal() as db:
+        page = db.get(PageExtraction, page_hash)
+        return page.result if page else None
+
+def _store_page_result(page_hash: str, result: dict):
+    with SessionLocal() as db:
+        db.merge(PageExtraction(page_hash=page_hash, result=result))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker cached the same page first
+            db.rollback()
+
+def _safe_perceptual_hash(content: bytes) -> Optional[str]:
+    try:
+        return calculate_perceptual_hash(content)
+    except Exception:
+        # Undecodable images still go to Gemini, which reports the real error
+        return None
+
+def _find_by_hash(db: Session, file_hash: str) -> Optional[Invoice]:
+    return db.query(Invoice).filter(Invoice.file_hash == file_hash).first()
+
+def _save_invoice(
+    db: Session,
+    invoice_data: dict,
+    file_hash: str,
+    file_path: str,
+    perceptual_hash: Optional[str] = None
+) -> Invoice:
+    """
+    Insert a new invoice, or overwrite the extracted fields of a reprocessed one
+
+    The session is rolled back if anything fails, so no half-built invoice is left in it.
+
+    Raises:
+        ValueError: invoice_data has an unreadable date or total
+    """
+    try:
+        invoice_date = datetime.strptime(invoice_data['invoice_date'], '%Y-%m-%d').date()
+        total = float(invoice_data['total'])
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Extracted invoice has an invalid date or total: {str(e)}")
+
+    try:
+        return _write_invoice(db, invoice_data, invoice_date, total, file_hash, file_path, perceptual_hash)
+    except BaseException:
+        db.rollback()
+        raise
+
+def _write_invoice(
+    db: Session,
+    invoice_data: dict,
+    invoice_date: date,
+    total: float,
+    file_hash: str,
+    file_path: str,
+    perceptual_hash: Optional[str]
+) -> Invoice:
+    db_invoice = _find_by_hash(db, file_hash)
+    if db_invoice is None:
+        db_invoice = Invoice(file_hash=file_hash)
+        db.add(db_invoice)
+    else:
+        # Reprocessing: the old figures come out of the rollups before the new ones go in
+        RollupService.remove(db, db_invoice)
+
+    # Invoices stored before content addressing move to the new path on reprocess
+    if db_invoice.file_path and db_invoice.file_path != file_path and os.path.exists(db_invoice.file_path):
+        os.remove(db_invoice.file_path)
+    db_invoice.file_path = file_path
+
+    db_invoice.store_name = invoice_data['store_name']
+    db_invoice.invoice_date = invoice_date
+    db_invoice.total = total
+    db_invoice.details = invoice_data['details']
+    db_invoice.perceptual_hash = perceptual_hash
+    ItemService.sync_items(db_invoice)
+    RollupService.add(db, db_invoice)
+
+    db.commit()
+    db.refresh(db_invoice)
+    return db_invoice
@@ -0,0 +1,62 @@
+from sqlalchemy import exists
+from sqlalchemy.orm import Session
+from app.models.invoice import Invoice, InvoiceItem
+
+class ItemService:
+    @staticmethod
+    def build_items(invoice: Invoice) -> list[InvoiceItem]:
+        """Line items for an invoice, one per entry in its details JSON"""
+        return [
+            InvoiceItem(
+                line_no=n,
+                product_name=detail.get('product_name'),
+                quantity=_to_float(detail.get('quantity')),
+                unit=detail.get('unit'),
+                amount=_to_float(detail.get('amount')),
+                discount=_to_float(detail.get('discount')),
+                invoice_date=invoice.invoice_date,
+                store_name=invoice.store_name
+            )
+            for n, detail in enumerate(invoice.details or [])
+            if isinstance(detail, dict)
+        ]
+
+    @staticmethod
+    def sync_items(invoice: Invoice):
+        """Replace an invoice's line items with ones built from its current details"""
+        invoice.items = ItemService.build_items(invoice)
+
+    @staticmethod
+    def backfill(db: Session, batch_size: int = 500, rebuild: bool = False) -> int:
+        """
+        Populate invoice_items from the details of existing invoices
+
+        Args:
+            batch_size: Invoices loaded and committed per batch
+            rebuild: Rebuild items for every invoice, not just those without any
+
+        Returns:
+            int: Number of invoices whose items were written
+        """
+        query = db.query(Invoice)
+        if not rebuild:
+            query = query.filter(~exists().where(InvoiceItem.invoice_id == Invoice.id))
+
+        count, last_id = 0, 0
+        while True:
+            # Keyset pagination: committed batches drop out of the NOT EXISTS filter anyway
+            batch = query.filter(Invoice.id > last_id).order_by(Invoice.id).limit(batch_size).all()
+            if not batch:
+                return count
+            for invoice in batch:
+                ItemService.sync_items(invoice)
+            db.commit()
+            count += len(batch)
+            last_id = batch[-1].id
+            db.expunge_all()
+
+def _to_float(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
@@ -0,0 +1,218 @@
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models.job import ExtractionJob
+from app.models.invoice import Invoice
+from app.services.gemini_client import GeminiUnavailableError
+from app.services.invoice_service import InvoiceService
+from app.utils.file_handler import SpooledUpload, store_content_addressed
+from app.config import settings
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+class JobQueue:
+    """
+    Database-backed extraction queue drained by a pool of async workers
+
+    Jobs are claimed with a conditional UPDATE, so several uvicorn workers
+    can share one queue table without handing the same job out twice.
+    """
+
+    def __init__(self, invoice_service: InvoiceService):
+        self.invoice_service = invoice_service
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def enqueue(
+        self,
+        db: Session,
+        upload: SpooledUpload,
+        force_reprocess: bool = False
+    ) -> ExtractionJob:
+        """Store the upload and queue it for extraction"""
+        file_path = await run_in_threadpool(store_content_addressed, upload, settings.upload_dir)
+
+        job = ExtractionJob(
+            filename=upload.filename,
+            content_type=upload.content_type,
+            file_path=file_path,
+            file_hash=upload.file_hash,
+            force_reprocess=force_reprocess
+        )
+        await run_in_threadpool(_add_job, db, job)
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    def start(self):
+        """Spawn the worker pool on the running event loop"""
+        if self._tasks or settings.job_workers <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"extraction-worker-{n}")
+            for n in range(settings.job_workers)
+        ]
+
+    async def stop(self):
+        """Cancel the workers; jobs they were running are requeued on next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        swept = 0.0
+        while True:
+            # Jobs of a worker process that died are only noticed once they time out
+            if time.monotonic() - swept >= settings.job_timeout_seconds / 2:
+                await run_in_threadpool(_requeue_stale_jobs)
+                swept = time.monotonic()
+
+            job_id = await run_in_threadpool(_claim_next_job)
+            if job_id is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), settings.job_poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Extraction job %s crashed", job_id)
+
+    async def _run(self, job_id: str):
+        db = SessionLocal()
+        try:
+            job = await run_in_threadpool(db.get, ExtractionJob, job_id)
+            try:
+                upload = SpooledUpload(
+                    job.file_path,
+                    job.file_hash,
+                    await run_in_threadpool(os.path.getsize, job.file_path),
+                    job.filename,
+                    job.content_type,
+                    temporary=False
+                )
+                response = await self.invoice_service.process(db, upload, job.force_reprocess)
+            except GeminiUnavailableError as e:
+                await run_in_threadpool(db.rollback)
+                if job.attempts < settings.job_max_attempts:
+                    # Put it back and give Gemini time to recover before this worker claims again
+                    await run_in_threadpool(_requeue_job, db, job)
+                    await asyncio.sleep(e.retry_after)
+                else:
+                    await run_in_threadpool(_fail_job, db, job, str(e))
+                return
+            except Exception as e:
+                await run_in_threadpool(db.rollback)
+                await run_in_threadpool(_fail_job, db, job, str(e))
+                return
+
+            # A near-duplicate hit leaves the queued copy unused
+            if response.file_path != job.file_path:
+                await run_in_threadpool(remove_if_unreferenced, db, job.file_path, job.id)
+            await run_in_threadpool(
+                _finish_job, db, job, invoice_id=response.id, is_cached=response.is_cached
+            )
+        finally:
+            await run_in_threadpool(db.close)
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+def _add_job(db: Session, job: ExtractionJob):
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+def _requeue_job(db: Session, job: ExtractionJob):
+    job.status = "queued"
+    job.started_at = None
+    db.commit()
+
+def _claim_next_job() -> Optional[str]:
+    with SessionLocal() as db:
+        candidates = db.query(ExtractionJob.id).filter(
+            ExtractionJob.status == "queued"
+        ).order_by(ExtractionJob.created_at).limit(5).all()
+
+        for (job_id,) in candidates:
+            claimed = db.execute(
+                update(ExtractionJob)
+                .where(ExtractionJob.id == job_id, ExtractionJob.status == "queued")
+                .values(
+                    status="running",
+                    started_at=_utcnow(),
+                    attempts=ExtractionJob.attempts + 1
+                )
+            )
+            db.commit()
+            if claimed.rowcount == 1:
+                return job_id
+    return None
+
+def _requeue_stale_jobs():
+    """Put back jobs whose worker died mid-run, failing those out of attempts"""
+    cutoff = _utcnow() - timedelta(seconds=settings.job_timeout_seconds)
+    with SessionLocal() as db:
+        stale = db.query(ExtractionJob).filter(
+            ExtractionJob.status == "running",
+            ExtractionJob.started_at < cutoff
+        ).all()
+        for job in stale:
+            if job.attempts >= settings.job_max_attempts:
+                _fail_job(db, job, "Job timed out")
+            else:
+                job.status = "queued"
+        db.commit()
+
+def _finish_job(
+    db: Session,
+    job: ExtractionJob,
+    invoice_id: Optional[int] = None,
+    is_cached: Optional[bool] = None,
+    error: Optional[str] = None
+):
+    job.status = "failed" if error else "done"
+    job.invoice_id = invoice_id
+    job.is_cached = is_cached
+    job.error = error
+    job.finished_at = _utcnow()
+    db.commit()
+
+def _fail_job(db: Session, job: ExtractionJob, error: str):
+    """Mark a job failed and delete its stored upload if nothing else needs it"""
+    _finish_job(db, job, error=error)
+    remove_if_unreferenced(db, job.file_path, job.id)
+
+def remove_if_unreferenced(db: Session, file_path: str, job_id: Optional[str] = None):
+    """
+    Delete a stored upload unless an invoice or a pending job still points at it
+
+    Identical uploads share one content-addressed file, so it can only go
+    once nothing refers to it.
+
+    Args:
+        job_id: Job giving up the file, which doesn't count as a reference
+    """
+    in_use = db.query(Invoice.id).filter(Invoice.file_path == file_path).first() or \
+        db.query(ExtractionJob.id).filter(
+            ExtractionJob.file_path == file_path,
+            ExtractionJob.status.in_(["queued", "running"]),
+            ExtractionJob.id != job_id
+        ).first()
+    if not in_use and file_path and os.path.exists(file_path):
+        os.remove(file_path)
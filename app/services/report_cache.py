@@ -0,0 +1,122 @@
+from typing import BinaryIO, Optional
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+class ReportCache:
+    """
+    On-disk cache of rendered reports, keyed by request parameters and data version
+
+    A report is only reused while the invoices in its date range are
+    unchanged, so entries never need explicit invalidation. Files are
+    evicted least-recently-used once the directory exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(start_date, end_date, report_type: str, data_version: tuple) -> str:
+        payload = json.dumps([str(start_date), str(end_date), report_type, [str(v) for v in data_version]])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """Open the cached report, marking it recently used, or return None on a miss"""
+        path = self.path(key)
+        # Opened under the lock eviction deletes under, so a hit can't be deleted before it is open
+        with self._lock:
+            try:
+                output = open(path, "rb")
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # mtime doubles as the last-access time for LRU eviction
+            os.utime(path)
+        return output
+
+    def new_tmp_path(self) -> str:
+        """Reserve a temporary file in the cache directory for a report being rendered"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        return tmp_path
+
+    def commit(self, key: str, tmp_path: str) -> BinaryIO:
+        """Move a rendered report into place under key, evict if over budget, and return it opened"""
+        # Opened first: eviction, here or in a concurrent commit, may delete it once it is in place
+        output = open(tmp_path, "rb")
+        try:
+            # Atomic, so concurrent renders of the same key just overwrite each other
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            output.close()
+            raise
+        self.evict()
+        return output
+
+    def evict(self):
+        """Delete least recently used reports until the cache fits in max_bytes"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".pdf"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            with self._lock:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self.evictions += 1
+            total -= size
+            logger.info("Evicted cached report %s", os.path.basename(path))
+
+    def stats(self) -> dict:
+        entries, size = 0, 0
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".pdf"):
+                    entries += 1
+                    try:
+                        size += os.path.getsize(os.path.join(self.cache_dir, name))
+                    except FileNotFoundError:
+                        pass
+
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": f"{(self.hits / lookups * 100):.2f}%" if lookups > 0 else "0%",
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes
+        }
@@ -0,0 +1,186 @@
+from concurrent.futures import ProcessPoolExecutor
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from app.database import SessionLocal
+from app.models.job import ReportJob
+from app.services.report_cache import ReportCache
+from app.services.report_service import ReportService
+from app.utils.metrics import timed
+from app.config import settings
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO, Optional
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+
+logger = logging.getLogger(__name__)
+
+class ReportJobService:
+    """
+    Renders PDF reports in a pool of worker processes
+
+    reportlab layout is CPU-bound and holds the GIL, so it runs outside the
+    API process. Finished reports land in the report cache, which is also
+    where job downloads are served from.
+    """
+
+    def __init__(self, cache: ReportCache):
+        self.cache = cache
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn, not fork: forking a process with live threads and DB connections is unsafe
+            self._executor = ProcessPoolExecutor(
+                max_workers=settings.report_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def get_or_render(self, db: Session, start_date, end_date, report_type: str) -> tuple[BinaryIO, bool]:
+        """
+        Open a cached report for the range, rendering it in the pool on a miss
+
+        With the cache disabled there is nothing to keep on disk: the worker
+        returns the PDF itself, which is streamed from memory.
+
+        Returns:
+            tuple: (the PDF opened for reading, whether it came from the cache)
+        """
+        if not self.cache.enabled:
+            with timed("report_render"):
+                content = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, render_report_bytes, start_date, end_date, report_type
+                )
+            return io.BytesIO(content), False
+
+        version = await run_in_threadpool(ReportService.data_version, db, start_date, end_date)
+        key = self.cache.key(start_date, end_date, report_type, version)
+
+        output = await run_in_threadpool(self.cache.open, key)
+        if output is not None:
+            return output, True
+
+        tmp_path = await run_in_threadpool(self.cache.new_tmp_path)
+        await self._render(tmp_path, start_date, end_date, report_type)
+        return await run_in_threadpool(self.cache.commit, key, tmp_path), False
+
+    def open_result(self, job: ReportJob) -> BinaryIO:
+        """
+        Open a finished job's PDF
+
+        Reports rendered with the cache disabled are job-private and are
+        removed once opened, so they can only be downloaded once.
+
+        Raises:
+            FileNotFoundError: The report was evicted or already downloaded
+        """
+        output = open(job.file_path, "rb")
+        if os.path.dirname(job.file_path) != self.cache.cache_dir:
+            os.remove(job.file_path)
+        return output
+
+    async def submit(self, db: Session, start_date, end_date, report_type: str) -> ReportJob:
+        """Record a report job and start rendering it in the background"""
+        job = ReportJob(start_date=start_date, end_date=end_date, report_type=report_type)
+        await run_in_threadpool(_add_job, db, job)
+
+        task = asyncio.create_task(self._run(job.id, start_date, end_date, report_type))
+        # Keep a reference so the task isn't garbage collected mid-run
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def fail_stale_jobs(self, db: Session) -> int:
+        """Fail jobs left unfinished by a process that died; returns how many"""
+        # Jobs aren't persisted across restarts, so anything this old was abandoned
+        cutoff = _utcnow() - timedelta(seconds=settings.job_timeout_seconds)
+        count = db.query(ReportJob).filter(
+            ReportJob.status.in_(["queued", "running"]),
+            ReportJob.created_at < cutoff
+        ).update(
+            {"status": "failed", "error": "Job timed out", "finished_at": _utcnow()},
+            synchronize_session=False
+        )
+        db.commit()
+        return count
+
+    def shutdown(self):
+        for task in self._tasks:
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, job_id: str, start_date, end_date, report_type: str):
+        db = SessionLocal()
+        try:
+            await run_in_threadpool(_update_job, db, job_id, status="running", started_at=_utcnow())
+            try:
+                if self.cache.enabled:
+                    output, is_cached = await self.get_or_render(db, start_date, end_date, report_type)
+                    output.close()
+                    path = output.name
+                else:
+                    # Kept out of the cache directory, where nothing evicts it, until downloaded
+                    path, is_cached = _job_report_path(job_id), False
+                    await self._render(path, start_date, end_date, report_type)
+            except Exception as e:
+                logger.exception("Report job %s failed", job_id)
+                await run_in_threadpool(
+                    _update_job, db, job_id, status="failed", error=str(e), finished_at=_utcnow()
+                )
+                return
+            await run_in_threadpool(
+                _update_job, db, job_id,
+                status="done", file_path=path, is_cached=is_cached, finished_at=_utcnow()
+            )
+        finally:
+            await run_in_threadpool(db.close)
+
+    async def _render(self, filepath: str, start_date, end_date, report_type: str):
+        """Render a report to filepath in the pool, removing the partial file on failure"""
+        try:
+            with timed("report_render"):
+                await asyncio.get_running_loop().run_in_executor(
+                    self.executor, render_report_file, start_date, end_date, report_type, filepath
+                )
+        except BaseException:
+            await run_in_threadpool(_discard, filepath)
+            raise
+
+def render_report_file(start_date, end_date, report_type: str, filepath: str):
+    """Worker process entry point: render one report to filepath"""
+    with SessionLocal() as db:
+        ReportService.write_report(db, start_date, end_date, report_type, filepath)
+
+def render_report_bytes(start_date, end_date, report_type: str) -> bytes:
+    """Worker process entry point: render one report and return the PDF"""
+    with SessionLocal() as db:
+        return ReportService.render_report(db, start_date, end_date, report_type)
+
+def _job_report_path(job_id: str) -> str:
+    jobs_dir = os.path.join(settings.report_dir, "jobs")
+    os.makedirs(jobs_dir, exist_ok=True)
+    return os.path.join(jobs_dir, f"{job_id}.pdf")
+
+def _discard(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+def _add_job(db: Session, job: ReportJob):
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+def _update_job(db: Session, job_id: str, **values):
+    db.rollback()
+    db.query(ReportJob).filter(ReportJob.id == job_id).update(values)
+    db.commit()
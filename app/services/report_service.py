@@ -1,151 +1,398 @@
-import pandas as pd
-from datetime import datetime
+from collections import deque
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from app.models.invoice import Invoice
-from reportlab.lib.pagesizes import letter, landscape
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.units import inch
-import os
-from app.config import settings
+from app.models.invoice import Invoice, InvoiceItem
+from app.services.rollup_service import RollupService, TOP_PRODUCTS
+from typing import TYPE_CHECKING, Iterable, Iterator
+import io
+
+# reportlab is imported where it is used, so that only report rendering pays for it
+if TYPE_CHECKING:
+    from reportlab.platypus import Table
+
+# Table rows per reportlab Table; layout and page-splitting cost grows with table size
+TABLE_CHUNK_ROWS = 200
+
+# Invoices fetched per round trip from the database cursor
+FETCH_BATCH_SIZE = 1000
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+TABLE_HEADER = [
+    'Invoice Date',
+    'Store',
+    'Product',
+    'Qty',
+    'Unit',
+    'Amount',
+    'Discount',
+    'Total'
+]
+
+COL_WIDTHS = [80, 120, 150, 50, 50, 70, 70, 80]
+
+# Rollup period used for each report type's per-period table
+REPORT_PERIODS = {
+    'monthly': 'month',
+    'yearly': 'year'
+}
 
 class ReportService:
     @staticmethod
-    def generate_report(db: Session, start_date, end_date, report_type: str) -> str:
-        """Generate PDF report with grouped invoice structure"""
-        # Query invoices
-        invoices = db.query(Invoice).filter(
+    def write_report(db: Session, start_date, end_date, report_type: str, filepath: str):
+        """
+        Render the report to filepath
+
+        Invoices are read through a streaming cursor and laid out in fixed-size
+        table chunks, so build time grows linearly with the number of invoices.
+        """
+        ReportService._build(filepath, db, start_date, end_date, report_type)
+
+    @staticmethod
+    def render_report(db: Session, start_date, end_date, report_type: str) -> bytes:
+        """
+        Render the report in memory
+
+        reportlab assembles the whole document before writing it out, so this
+        costs no more memory than write_report and skips the file round trip.
+        """
+        output = io.BytesIO()
+        ReportService._build(output, db, start_date, end_date, report_type)
+        return output.getvalue()
+
+    @staticmethod
+    def data_version(db: Session, start_date, end_date) -> tuple:
+        """
+        Fingerprint of the invoices in a date range
+
+        Changes whenever an invoice in the range is added, deleted or
+        reprocessed, so it can key cached reports for that range.
+        """
+        invoices = db.query(
+            func.count(Invoice.id),
+            func.sum(Invoice.id),
+            func.sum(Invoice.total),
+            func.max(Invoice.created_at),
+            func.max(Invoice.updated_at)
+        ).filter(
             Invoice.invoice_date >= start_date,
             Invoice.invoice_date <= end_date
-        ).order_by(Invoice.invoice_date.desc()).all()
-        
-        # Generate PDF
-        filename = f"report_{report_type}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        filepath = os.path.join(settings.report_dir, filename)
-        
+        ).one()
+        # Backfilling line items changes the aggregates without touching any invoice
+        items = db.query(func.count(InvoiceItem.id), func.max(InvoiceItem.id)).filter(
+            InvoiceItem.invoice_date >= start_date,
+            InvoiceItem.invoice_date <= end_date
+        ).one()
+        return tuple(invoices) + tuple(items)
+
+    @staticmethod
+    def aggregates(db: Session, start_date, end_date, report_type: str) -> dict:
+        """
+        Summary figures for a report
+
+        Totals, periods and stores come from the rollup tables; top products
+        are grouped over invoice_items so they match the exact date range.
+
+        Returns:
+            dict: RollupService.summary with "products" replaced
+        """
+        summary = RollupService.summary(db, start_date, end_date, REPORT_PERIODS[report_type])
+
+        net = func.sum(InvoiceItem.amount - InvoiceItem.discount)
+        summary['products'] = [
+            {
+                'product_name': product_name,
+                'lines': lines,
+                'quantity': float(quantity or 0),
+                'amount': float(amount or 0),
+                'discount': float(discount or 0),
+                'net': float(net_amount or 0)
+            }
+            for product_name, lines, quantity, amount, discount, net_amount in db.query(
+                InvoiceItem.product_name,
+                func.count(InvoiceItem.id),
+                func.sum(InvoiceItem.quantity),
+                func.sum(InvoiceItem.amount),
+                func.sum(InvoiceItem.discount),
+                net
+            ).filter(
+                InvoiceItem.invoice_date >= start_date,
+                InvoiceItem.invoice_date <= end_date
+            ).group_by(InvoiceItem.product_name).order_by(net.desc()).limit(TOP_PRODUCTS)
+        ]
+        return summary
+
+    @staticmethod
+    def iter_file(output, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        """Yield a rendered report in chunks and close it when done"""
+        try:
+            while chunk := output.read(chunk_size):
+                yield chunk
+        finally:
+            output.close()
+
+    @staticmethod
+    def _build(target, db: Session, start_date, end_date, report_type: str):
+        from reportlab.lib.pagesizes import letter, landscape
+        from reportlab.platypus import SimpleDocTemplate
+
         # Use landscape for better table layout
-        doc = SimpleDocTemplate(filepath, pagesize=landscape(letter))
-        elements = []
-        styles = getSampleStyleSheet()
-        
-        # Title
-        title = Paragraph(f"Invoice Report ({report_type.capitalize()})", styles['Title'])
-        elements.append(title)
-        elements.append(Spacer(1, 0.2*inch))
-        
-        # Summary Statistics
-        if invoices:
-            total_invoices = len(invoices)
-            total_amount = sum(inv.total for inv in invoices)
-            unique_stores = len(set(inv.store_name for inv in invoices))
-            total_items = sum(len(inv.details) for inv in invoices)
-            
-            summary_text = f"""
-            <b>Period:</b> {start_date} to {end_date}<br/>
-            <b>Total Invoices:</b> {total_invoices}<br/>
-            <b>Total Items:</b> {total_items}<br/>
-            <b>Unique Stores:</b> {unique_stores}<br/>
-            <b>Total Amount:</b> Rp.{total_amount:,.2f}
-            """
-        else:
-            summary_text = f"""
-            <b>Period:</b> {start_date} to {end_date}<br/>
-            <b>No invoices found for this period</b>
-            """
-        
-        summary = Paragraph(summary_text, styles['Normal'])
-        elements.append(summary)
-        elements.append(Spacer(1, 0.3*inch))
-        
-        # Detailed Table with grouped invoices
-        if invoices:
-            # Create table header
-            table_data = [[
-                'Invoice Date',
-                'Store',
-                'Product',
-                'Qty',
-                'Unit',
-                'Amount',
-                'Discount',
-                'Total'
-            ]]
-            
-            # Build table with invoice grouping
-            for invoice in invoices:
-                # First row of invoice (with invoice-level info)
-                first_detail = invoice.details[0]
-                table_data.append([
-                    str(invoice.invoice_date),
-                    invoice.store_name,
-                    first_detail['product_name'],
-                    f"{first_detail['quantity']:.2f}",
-                    first_detail['unit'],
-                    f"Rp.{first_detail['amount']:,.2f}",
-                    f"Rp.{first_detail['discount']:,.2f}",
-                    f"Rp.{invoice.total:,.2f}"
-                ])
-                
-                # Subsequent rows (sub-rows for additional products)
-                for detail in invoice.details[1:]:
-                    table_data.append([
-                        '',  # Empty date (merged cell effect)
-                        '',  # Empty store (merged cell effect)
-                        detail['product_name'],
-                        f"{detail['quantity']:.2f}",
-                        detail['unit'],
-                        f"Rp.{detail['amount']:,.2f}",
-                        f"Rp.{detail['discount']:,.2f}",
-                        ''  # Empty total (only show on first row)
-                    ])
-            
-            # Create table
-            t = Table(table_data, colWidths=[80, 120, 150, 50, 50, 70, 70, 80])
-            
-            # Apply styling
-            style = TableStyle([
-                # Header styling
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                
-                # Data rows styling
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 8),
-                ('ALIGN', (3, 1), (6, -1), 'RIGHT'),  # Right align numbers
-                ('ALIGN', (7, 1), (7, -1), 'RIGHT'),  # Right align total
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                
-                # Grid
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-                ('LINEBELOW', (0, 0), (-1, 0), 2, colors.HexColor('#2c3e50')),
-            ])
-            
-            # Add alternating row colors and invoice grouping
-            row_num = 1
-            for i, invoice in enumerate(invoices):
-                num_details = len(invoice.details)
-                
-                # Alternate background color per invoice group
-                bg_color = colors.HexColor('#f8f9fa') if i % 2 == 0 else colors.white
-                style.add('BACKGROUND', (0, row_num), (-1, row_num + num_details - 1), bg_color)
-                
-                # Add thicker line between invoice groups
-                if row_num > 1:
-                    style.add('LINEABOVE', (0, row_num), (-1, row_num), 1.5, colors.HexColor('#34495e'))
-                
-                # Bold the first row of each invoice
-                style.add('FONTNAME', (0, row_num), (1, row_num), 'Helvetica-Bold')
-                style.add('FONTNAME', (7, row_num), (7, row_num), 'Helvetica-Bold')
-                
-                row_num += num_details
-            
-            t.setStyle(style)
-            elements.append(t)
-        
+        doc = SimpleDocTemplate(target, pagesize=landscape(letter), pageCompression=1)
+        elements = _LazyFlowables(
+            _report_flowables(db, start_date, end_date, report_type)
+        )
         doc.build(elements)
-        return filename
\ No newline at end of file
+
+def _report_flowables(db: Session, start_date, end_date, report_type: str) -> Iterator:
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Spacer
+
+    styles = getSampleStyleSheet()
+
+    # Title
+    yield Paragraph(f"Invoice Report ({report_type.capitalize()})", styles['Title'])
+    yield Spacer(1, 0.2*inch)
+
+    # Summary Statistics, read from the rollup tables rather than the invoices themselves
+    aggregates = ReportService.aggregates(db, start_date, end_date, report_type)
+    totals = aggregates['totals']
+
+    if totals['invoices']:
+        summary_text = f"""
+        <b>Period:</b> {start_date} to {end_date}<br/>
+        <b>Total Invoices:</b> {totals['invoices']}<br/>
+        <b>Total Items:</b> {totals['items']}<br/>
+        <b>Unique Stores:</b> {totals['stores']}<br/>
+        <b>Total Discount:</b> Rp.{totals['discount']:,.2f}<br/>
+        <b>Total Amount:</b> Rp.{totals['total']:,.2f}
+        """
+    else:
+        summary_text = f"""
+        <b>Period:</b> {start_date} to {end_date}<br/>
+        <b>No invoices found for this period</b>
+        """
+
+    yield Paragraph(summary_text, styles['Normal'])
+    yield Spacer(1, 0.3*inch)
+
+    if not totals['invoices']:
+        return
+
+    yield Paragraph("By Month" if report_type == 'monthly' else "By Year", styles['Heading2'])
+    yield _summary_table(
+        ['Period', 'Invoices', 'Items', 'Amount', 'Discount', 'Total'],
+        [
+            [
+                row['period'],
+                str(row['invoices']),
+                str(row['items']),
+                f"Rp.{row['amount']:,.2f}",
+                f"Rp.{row['discount']:,.2f}",
+                f"Rp.{row['total']:,.2f}"
+            ]
+            for row in aggregates['periods']
+        ],
+        [80, 70, 70, 120, 120, 120]
+    )
+    yield Spacer(1, 0.2*inch)
+
+    yield Paragraph("By Store", styles['Heading2'])
+    yield _summary_table(
+        ['Store', 'Invoices', 'Discount', 'Total'],
+        [
+            [
+                row['store_name'] or '',
+                str(row['invoices']),
+                f"Rp.{row['discount']:,.2f}",
+                f"Rp.{row['total']:,.2f}"
+            ]
+            for row in aggregates['stores']
+        ],
+        [200, 70, 120, 120]
+    )
+    yield Spacer(1, 0.2*inch)
+
+    yield Paragraph(f"Top {TOP_PRODUCTS} Products", styles['Heading2'])
+    yield _summary_table(
+        ['Product', 'Lines', 'Qty', 'Amount', 'Discount', 'Net'],
+        [
+            [
+                row['product_name'] or '',
+                str(row['lines']),
+                f"{row['quantity']:,.2f}",
+                f"Rp.{row['amount']:,.2f}",
+                f"Rp.{row['discount']:,.2f}",
+                f"Rp.{row['net']:,.2f}"
+            ]
+            for row in aggregates['products']
+        ],
+        [200, 60, 70, 120, 120, 120]
+    )
+    yield Spacer(1, 0.3*inch)
+
+    yield Paragraph("Invoice Details", styles['Heading2'])
+
+    # Detailed Table with grouped invoices, fetched in batches
+    invoices = db.query(
+        Invoice.invoice_date,
+        Invoice.store_name,
+        Invoice.total,
+        Invoice.details
+    ).filter(
+        Invoice.invoice_date >= start_date,
+        Invoice.invoice_date <= end_date
+    ).order_by(Invoice.invoice_date.desc(), Invoice.id.desc()).yield_per(FETCH_BATCH_SIZE)
+
+    for chunk in _chunk_invoice_rows(invoices):
+        yield _invoice_table(chunk)
+
+def _summary_table(header: list[str], rows: list[list[str]], col_widths: list[int]) -> "Table":
+    from reportlab.lib import colors
+    from reportlab.platypus import Table, TableStyle
+
+    t = Table([header] + rows, colWidths=col_widths, repeatRows=1)
+    t.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('ALIGN', (1, 1), (-1, -1), 'RIGHT'),  # Right align counts and amounts
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.HexColor('#f8f9fa'), colors.white]),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ]))
+    return t
+
+def _invoice_rows(invoice) -> list[list[str]]:
+    """Table rows for one invoice: invoice-level info on the first row only"""
+    details = invoice.details or [{}]
+    rows = []
+    for n, detail in enumerate(details):
+        rows.append([
+            str(invoice.invoice_date) if n == 0 else '',  # Empty date (merged cell effect)
+            invoice.store_name if n == 0 else '',  # Empty store (merged cell effect)
+            detail.get('product_name') or '',
+            f"{detail.get('quantity') or 0:.2f}",
+            detail.get('unit') or '',
+            f"Rp.{detail.get('amount') or 0:,.2f}",
+            f"Rp.{detail.get('discount') or 0:,.2f}",
+            f"Rp.{invoice.total:,.2f}" if n == 0 else ''  # Only show total on first row
+        ])
+    return rows
+
+def _chunk_invoice_rows(invoices: Iterable) -> Iterator[list[list[list[str]]]]:
+    """Group invoices into chunks of about TABLE_CHUNK_ROWS rows, never splitting an invoice"""
+    chunk, row_count = [], 0
+    for invoice in invoices:
+        rows = _invoice_rows(invoice)
+        chunk.append(rows)
+        row_count += len(rows)
+        if row_count >= TABLE_CHUNK_ROWS:
+            yield chunk
+            chunk, row_count = [], 0
+    if chunk:
+        yield chunk
+
+def _invoice_table(groups: list[list[list[str]]]) -> "Table":
+    from reportlab.lib import colors
+    from reportlab.platypus import Table, TableStyle
+
+    table_data = [TABLE_HEADER] + [row for rows in groups for row in rows]
+
+    # Create table; the header repeats when a chunk is split across pages
+    t = Table(table_data, colWidths=COL_WIDTHS, repeatRows=1)
+
+    # Apply styling
+    style = TableStyle([
+        # Header styling
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+
+        # Data rows styling
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 8),
+        ('ALIGN', (3, 1), (6, -1), 'RIGHT'),  # Right align numbers
+        ('ALIGN', (7, 1), (7, -1), 'RIGHT'),  # Right align total
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+
+        # Grid
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('LINEBELOW', (0, 0), (-1, 0), 2, colors.HexColor('#2c3e50')),
+    ])
+
+    # Add alternating row colors and invoice grouping
+    row_num = 1
+    for i, rows in enumerate(groups):
+        num_details = len(rows)
+
+        # Alternate background color per invoice group
+        bg_color = colors.HexColor('#f8f9fa') if i % 2 == 0 else colors.white
+        style.add('BACKGROUND', (0, row_num), (-1, row_num + num_details - 1), bg_color)
+
+        # Add thicker line between invoice groups
+        if row_num > 1:
+            style.add('LINEABOVE', (0, row_num), (-1, row_num), 1.5, colors.HexColor('#34495e'))
+
+        # Bold the first row of each invoice
+        style.add('FONTNAME', (0, row_num), (1, row_num), 'Helvetica-Bold')
+        style.add('FONTNAME', (7, row_num), (7, row_num), 'Helvetica-Bold')
+
+        row_num += num_details
+
+    t.setStyle(style)
+    return t
+
+class _LazyFlowables:
+    """
+    List-like view over a flowable generator for SimpleDocTemplate.build
+
+    build() only looks at and edits the front of its flowable list, so
+    flowables are pulled from the generator as the layout reaches them
+    instead of being materialised up front.
+    """
+
+    def __init__(self, flowables: Iterable):
+        self._source = iter(flowables)
+        self._buffer = deque()
+
+    def _fill(self, count: int) -> bool:
+        while len(self._buffer) < count:
+            try:
+                self._buffer.append(next(self._source))
+            except StopIteration:
+                return False
+        return True
+
+    def __len__(self) -> int:
+        # Only emptiness matters to build(); report what is buffered plus one pending item
+        self._fill(1)
+        return len(self._buffer)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) or index < 0:
+            raise TypeError("_LazyFlowables only supports indexing from the front")
+        if not self._fill(index + 1):
+            raise IndexError(index)
+        return self._buffer[index]
+
+    def __delitem__(self, index):
+        if index != 0:
+            raise TypeError("_LazyFlowables only supports deleting the first item")
+        self._fill(1)
+        self._buffer.popleft()
+
+    def __setitem__(self, index, values):
+        # build() pushes split remainders back with flowables[0:0] = [...]
+        if not (isinstance(index, slice) and index.start in (0, None) and index.stop == 0):
+            raise TypeError("_LazyFlowables only supports inserting at the front")
+        self._buffer.extendleft(reversed(list(values)))
+
+    def insert(self, index: int, value):
+        if index != 0:
+            raise TypeError("_LazyFlowables only supports inserting at the front")
+        self._buffer.appendleft(value)
@@ -0,0 +1,262 @@
+from collections import defaultdict
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app.models.invoice import Invoice, InvoiceItem
+from app.models.rollup import StoreDailyRollup, ProductMonthlyRollup
+from app.services.item_service import ItemService
+from datetime import date
+import math
+
+# Period grouping accepted by RollupService.summary
+PERIOD_FORMATS = {
+    'day': '%Y-%m-%d',
+    'month': '%Y-%m',
+    'year': '%Y'
+}
+
+STORE_VALUES = ('invoices', 'items', 'amount', 'discount', 'total')
+PRODUCT_VALUES = ('lines', 'quantity', 'amount', 'discount')
+
+# Products listed in a summary
+TOP_PRODUCTS = 20
+
+class RollupService:
+    """
+    Maintains per-store daily and per-product monthly totals
+
+    Every change to an invoice is applied to the rollups as a delta in the
+    same transaction, so range summaries read one row per store per day
+    instead of every invoice in the range.
+    """
+
+    @staticmethod
+    def add(db: Session, invoice: Invoice):
+        """Count an invoice's current fields into the rollups"""
+        _apply(db, invoice, 1)
+
+    @staticmethod
+    def remove(db: Session, invoice: Invoice):
+        """Take an invoice's current fields back out of the rollups"""
+        _apply(db, invoice, -1)
+
+    @staticmethod
+    def summary(db: Session, start_date, end_date, period: str = 'month') -> dict:
+        """
+        Totals for a date range, read from the rollup tables
+
+        Args:
+            period: 'day', 'month' or 'year' grouping for the per-period rows
+
+        Returns:
+            dict: "totals", "periods", "stores" and "products". Products are
+            tracked per month, so they cover every month touching the range.
+        """
+        period_format = PERIOD_FORMATS[period]
+        in_range = (StoreDailyRollup.day >= start_date, StoreDailyRollup.day <= end_date)
+
+        periods = {}
+        days = db.query(
+            StoreDailyRollup.day,
+            *(func.sum(getattr(StoreDailyRollup, name)) for name in STORE_VALUES)
+        ).filter(*in_range).group_by(StoreDailyRollup.day).order_by(StoreDailyRollup.day)
+        for day, *values in days:
+            key = day.strftime(period_format)
+            row = periods.setdefault(key, {'period': key, **{name: 0 for name in STORE_VALUES}})
+            for name, value in zip(STORE_VALUES, values):
+                row[name] += value or 0
+
+        stores = [
+            {'store_name': store_name or None, **_values(STORE_VALUES, values)}
+            for store_name, *values in db.query(
+                StoreDailyRollup.store_name,
+                *(func.sum(getattr(StoreDailyRollup, name)) for name in STORE_VALUES)
+            ).filter(*in_range).group_by(StoreDailyRollup.store_name).order_by(
+                func.sum(StoreDailyRollup.total).desc()
+            )
+        ]
+
+        net = func.sum(ProductMonthlyRollup.amount - ProductMonthlyRollup.discount)
+        products = [
+            {'product_name': product_name or None, **_values(PRODUCT_VALUES, values), 'net': float(net_amount or 0)}
+            for product_name, *values, net_amount in db.query(
+                ProductMonthlyRollup.product_name,
+                *(func.sum(getattr(ProductMonthlyRollup, name)) for name in PRODUCT_VALUES),
+                net
+            ).filter(
+                ProductMonthlyRollup.month >= _month(start_date),
+                ProductMonthlyRollup.month <= end_date
+            ).group_by(ProductMonthlyRollup.product_name).order_by(net.desc()).limit(TOP_PRODUCTS)
+        ]
+
+        totals = {name: sum(row[name] for row in periods.values()) for name in STORE_VALUES}
+        totals['stores'] = len(stores)
+
+        return {
+            'start_date': start_date,
+            'end_date': end_date,
+            'period': period,
+            'totals': totals,
+            'periods': list(periods.values()),
+            'stores': stores,
+            'products': products
+        }
+
+    @staticmethod
+    def rebuild(db: Session) -> tuple[int, int]:
+        """
+        Recompute both rollup tables from invoices and invoice_items
+
+        Line items missing for older invoices are backfilled first.
+
+        Returns:
+            tuple: (store/day rows, product/month rows) written
+        """
+        ItemService.backfill(db)
+        stores, products = _expected_rollups(db)
+
+        db.query(StoreDailyRollup).delete()
+        db.query(ProductMonthlyRollup).delete()
+        db.bulk_insert_mappings(StoreDailyRollup, [
+            {'store_name': store_name, 'day': day, **values}
+            for (store_name, day), values in stores.items()
+        ])
+        db.bulk_insert_mappings(ProductMonthlyRollup, [
+            {'product_name': product_name, 'month': month, **values}
+            for (product_name, month), values in products.items()
+        ])
+        db.commit()
+        return len(stores), len(products)
+
+    @staticmethod
+    def verify(db: Session) -> list[str]:
+        """Compare the rollup tables against a fresh recompute; returns a description of each mismatch"""
+        expected_stores, expected_products = _expected_rollups(db)
+        actual_stores = {
+            (row.store_name, row.day): {name: getattr(row, name) for name in STORE_VALUES}
+            for row in db.query(StoreDailyRollup)
+        }
+        actual_products = {
+            (row.product_name, row.month): {name: getattr(row, name) for name in PRODUCT_VALUES}
+            for row in db.query(ProductMonthlyRollup)
+        }
+        return (
+            _diff("store_daily", expected_stores, actual_stores, STORE_VALUES)
+            + _diff("product_monthly", expected_products, actual_products, PRODUCT_VALUES)
+        )
+
+def _apply(db: Session, invoice: Invoice, sign: int):
+    if invoice.invoice_date is None:
+        return
+    items = ItemService.build_items(invoice)
+
+    store_key = {'store_name': invoice.store_name or '', 'day': invoice.invoice_date}
+    _increment(db, StoreDailyRollup, store_key, {
+        'invoices': sign,
+        'items': sign * len(items),
+        'amount': sign * sum(item.amount for item in items),
+        'discount': sign * sum(item.discount for item in items),
+        'total': sign * float(invoice.total or 0)
+    })
+
+    products = defaultdict(lambda: dict.fromkeys(PRODUCT_VALUES, 0))
+    for item in items:
+        values = products[item.product_name or '']
+        values['lines'] += sign
+        values['quantity'] += sign * item.quantity
+        values['amount'] += sign * item.amount
+        values['discount'] += sign * item.discount
+    month = _month(invoice.invoice_date)
+    for product_name, values in products.items():
+        _increment(db, ProductMonthlyRollup, {'product_name': product_name, 'month': month}, values)
+
+    if sign < 0:
+        # Drop rows that no longer count anything so empty days don't linger
+        db.query(StoreDailyRollup).filter_by(**store_key).filter(StoreDailyRollup.invoices <= 0).delete()
+        if products:
+            db.query(ProductMonthlyRollup).filter(
+                ProductMonthlyRollup.product_name.in_(list(products)),
+                ProductMonthlyRollup.month == month,
+                ProductMonthlyRollup.lines <= 0
+            ).delete(synchronize_session=False)
+
+def _increment(db: Session, model, key: dict, values: dict):
+    """Add values to the row at key, creating it if missing, as a single atomic statement where supported"""
+    dialect = db.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert(model).values(**key, **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(key),
+            set_={name: getattr(model, name) + stmt.excluded[name] for name in values}
+        )
+        db.execute(stmt)
+        return
+
+    row = db.get(model, tuple(key.values()), with_for_update=True)
+    if row is None:
+        db.add(model(**key, **values))
+        db.flush()
+    else:
+        for name, value in values.items():
+            setattr(row, name, getattr(row, name) + value)
+
+def _expected_rollups(db: Session) -> tuple[dict, dict]:
+    """Rollup rows recomputed from scratch, keyed like the tables' primary keys"""
+    stores = defaultdict(lambda: dict.fromkeys(STORE_VALUES, 0))
+    for store_name, day, invoices, total in db.query(
+        Invoice.store_name,
+        Invoice.invoice_date,
+        func.count(Invoice.id),
+        func.sum(Invoice.total)
+    ).filter(Invoice.invoice_date.isnot(None)).group_by(Invoice.store_name, Invoice.invoice_date):
+        values = stores[(store_name or '', day)]
+        values['invoices'] += invoices
+        values['total'] += float(total or 0)
+
+    products = defaultdict(lambda: dict.fromkeys(PRODUCT_VALUES, 0))
+    # Grouped by day in SQL and folded into months here, which works on any dialect
+    for store_name, product_name, day, lines, quantity, amount, discount in db.query(
+        InvoiceItem.store_name,
+        InvoiceItem.product_name,
+        InvoiceItem.invoice_date,
+        func.count(InvoiceItem.id),
+        func.sum(InvoiceItem.quantity),
+        func.sum(InvoiceItem.amount),
+        func.sum(InvoiceItem.discount)
+    ).filter(InvoiceItem.invoice_date.isnot(None)).group_by(
+        InvoiceItem.store_name, InvoiceItem.product_name, InvoiceItem.invoice_date
+    ):
+        store = stores[(store_name or '', day)]
+        store['items'] += lines
+        store['amount'] += float(amount or 0)
+        store['discount'] += float(discount or 0)
+
+        product = products[(product_name or '', _month(day))]
+        product['lines'] += lines
+        product['quantity'] += float(quantity or 0)
+        product['amount'] += float(amount or 0)
+        product['discount'] += float(discount or 0)
+
+    return dict(stores), dict(products)
+
+def _diff(table: str, expected: dict, actual: dict, names: tuple) -> list[str]:
+    problems = []
+    for key in sorted(expected.keys() | actual.keys(), key=str):
+        want, got = expected.get(key), actual.get(key)
+        if want is None:
+            problems.append(f"{table} {key}: unexpected row {got}")
+        elif got is None:
+            problems.append(f"{table} {key}: missing row, expected {want}")
+        else:
+            # Floats drift slightly after many increments and decrements
+            wrong = [name for name in names if not math.isclose(want[name], got[name], rel_tol=1e-9, abs_tol=1e-6)]
+            if wrong:
+                problems.append(f"{table} {key}: " + ", ".join(f"{name} {got[name]} != {want[name]}" for name in wrong))
+    return problems
+
+def _values(names: tuple, values) -> dict:
+    return {name: value or 0 for name, value in zip(names, values)}
+
+def _month(day: date) -> date:
+    return day.replace(day=1)
@@ -0,0 +1,112 @@
+from app.utils.trigram_index import TrigramIndex
+from array import array
+from datetime import date
+from typing import Iterable, Optional
+import heapq
+import threading
+
+# Date slots of invoice ids that aren't indexed, and of indexed invoices without a date
+NOT_INDEXED = 0
+NO_DATE = -1
+
+class InvoiceSearchIndex:
+    """
+    Fuzzy store and product name search over every stored invoice
+
+    Kept in memory next to the hash indexes of InvoiceService and refreshed
+    with them. Each invoice is indexed under its store name and its line
+    items' product names, with its date kept for range filters. About 200
+    bytes per invoice.
+    """
+
+    def __init__(self):
+        self.stores = TrigramIndex()
+        self.products = TrigramIndex()
+        # Date ordinal by invoice id; ids are dense, so an array is far smaller than a dict
+        self._dates = array('i')
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, invoice_id: int) -> bool:
+        return invoice_id < len(self._dates) and self._dates[invoice_id] != NOT_INDEXED
+
+    def add(self, invoice_id: int, invoice_date: Optional[date], store_name: Optional[str], product_names: Iterable[str]):
+        """Insert or replace an invoice"""
+        if invoice_id in self:
+            self.remove(invoice_id)
+        with self._lock:
+            if invoice_id >= len(self._dates):
+                # Grow geometrically so appends stay amortized O(1)
+                self._dates.extend([NOT_INDEXED] * max(invoice_id + 1 - len(self._dates), len(self._dates) // 2))
+            self._dates[invoice_id] = invoice_date.toordinal() if invoice_date else NO_DATE
+            self._count += 1
+        self.stores.add(invoice_id, (store_name,))
+        self.products.add(invoice_id, product_names)
+
+    def remove(self, invoice_id: int):
+        with self._lock:
+            if invoice_id not in self:
+                return
+            self._dates[invoice_id] = NOT_INDEXED
+            self._count -= 1
+        self.stores.remove(invoice_id)
+        self.products.remove(invoice_id)
+
+    def search(
+        self,
+        store: Optional[str] = None,
+        product: Optional[str] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        min_score: float = 0.6,
+        limit: int = 50,
+        skip: int = 0
+    ) -> tuple[list[tuple[int, float]], int]:
+        """
+        Rank invoices matching store and/or product
+
+        Invoices must match every query given. They are ranked by the sum of
+        their store and best product match scores, then newest first.
+
+        Args:
+            store, product: Text to match against store names and product names
+            start_date, end_date: Only invoices dated within this range (inclusive)
+            min_score: Lowest trigram containment (0-1) for a name to match
+            limit, skip: Page of the ranked results to return
+
+        Returns:
+            tuple: ((invoice_id, score) for the page, total number of matches)
+        """
+        if store is None and product is None:
+            raise ValueError("Give store, product or both to search for")
+
+        matches = None
+        for index, query in ((self.stores, store), (self.products, product)):
+            if query is None:
+                continue
+            found = index.search(query, min_score)
+            if matches is None:
+                matches = found
+            else:
+                matches = {
+                    invoice_id: score + found[invoice_id]
+                    for invoice_id, score in matches.items() if invoice_id in found
+                }
+
+        with self._lock:
+            dates = self._dates
+            if start_date is not None or end_date is not None:
+                low = start_date.toordinal() if start_date else 1
+                high = end_date.toordinal() if end_date else date.max.toordinal()
+                matches = {
+                    invoice_id: score for invoice_id, score in matches.items()
+                    if low <= dates[invoice_id] <= high
+                }
+            page = heapq.nlargest(
+                skip + limit, matches,
+                key=lambda invoice_id: (matches[invoice_id], dates[invoice_id], invoice_id)
+            )[skip:]
+        return [(invoice_id, round(matches[invoice_id], 4)) for invoice_id in page], len(matches)
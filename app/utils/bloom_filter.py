@@ -0,0 +1,56 @@
+from typing import Iterator
+import hashlib
+import math
+import threading
+
+# Counters stop at this value and are never decremented again, so removals can't cause false negatives
+MAX_COUNT = 255
+
+class CountingBloomFilter:
+    """
+    Set membership test that may report false positives but never false negatives
+
+    Each key sets hash_count counters chosen by hashing it. Counters instead
+    of bits allow removals. Sized for capacity keys at the given false
+    positive rate; past capacity the rate degrades gradually.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        # Optimal size and hash count for the target false positive rate
+        self.size = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self._counters = bytearray(self.size)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Number of keys added and not removed"""
+        return self._count
+
+    def __contains__(self, key: str) -> bool:
+        counters = self._counters
+        return all(counters[index] for index in self._indexes(key))
+
+    def add(self, key: str):
+        with self._lock:
+            for index in self._indexes(key):
+                if self._counters[index] < MAX_COUNT:
+                    self._counters[index] += 1
+            self._count += 1
+
+    def remove(self, key: str):
+        """Remove a key that was previously added; removing anything else corrupts the filter"""
+        with self._lock:
+            for index in self._indexes(key):
+                if 0 < self._counters[index] < MAX_COUNT:
+                    self._counters[index] -= 1
+            self._count -= 1
+
+    def _indexes(self, key: str) -> Iterator[int]:
+        # Double hashing: hash_count indexes from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + n * second) % self.size for n in range(self.hash_count))
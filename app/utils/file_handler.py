@@ -1,14 +1,108 @@
-from PIL import Image
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from PIL import Image, ImageOps
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+from app.utils.metrics import timed
+from typing import Optional
 import io
 import hashlib
-import imagehash
+import os
+import tempfile
+
+# Uploads are copied to disk in chunks of this size
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# Room for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured size limit"""
+
+class UploadLimitMiddleware:
+    """
+    Reject request bodies over a size limit before they are parsed
+
+    A Content-Length over the limit is answered with 413 before any of the
+    body is read. Bodies without one are counted as they arrive and cut off
+    with 413 once they pass the limit, so an oversized upload never fills
+    the multipart parser's spool files.
+
+    Args:
+        max_bytes: Body limit for every request
+        path_limits: Body limits for specific paths, in place of max_bytes
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int, path_limits: Optional[dict[str, int]] = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.path_limits.get(scope["path"], self.max_bytes)
+        detail = f"Request body exceeds the {limit} byte limit"
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside body parsing, which passes HTTPException through to the handlers
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+class SpooledUpload:
+    """
+    An upload written to disk, with its SHA-256 computed while it was copied
+
+    path points at a temporary file until store_content_addressed moves it
+    into place; discard() only ever removes temporary files.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        file_hash: str,
+        size: int,
+        filename: Optional[str],
+        content_type: Optional[str],
+        temporary: bool = True
+    ):
+        self.path = path
+        self.file_hash = file_hash
+        self.size = size
+        self.filename = filename
+        self.content_type = content_type
+        self.temporary = temporary
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def discard(self):
+        if self.temporary and os.path.exists(self.path):
+            os.remove(self.path)
 
 def convert_to_supported_format(file_bytes: bytes, mime_type: str) -> tuple[bytes, str]:
     """
     Convert uploaded file to a format supported by Gemini Vision
-    Gemini supports: PNG, JPEG, WEBP, HEIC, HEIF
+    Gemini supports: PNG, JPEG, WEBP, HEIC, HEIF, PDF
     """
-    if mime_type in ['image/png', 'image/jpeg', 'image/jpg', 'image/webp']:
+    if mime_type in ['image/png', 'image/jpeg', 'image/jpg', 'image/webp', 'application/pdf']:
         return file_bytes, mime_type
     
     # Convert other formats to PNG
@@ -17,19 +111,76 @@ def convert_to_supported_format(file_bytes: bytes, mime_type: str) -> tuple[byte
     img.save(output, format='PNG')
     return output.getvalue(), 'image/png'
 
-def calculate_file_hash(file_bytes: bytes) -> str:
-    """
-    Calculate SHA-256 hash of file content for exact duplicate detection
-    """
-    return hashlib.sha256(file_bytes).hexdigest()
-
 def calculate_perceptual_hash(file_bytes: bytes) -> str:
     """
     Calculate perceptual hash for detecting similar images
     (e.g., same invoice but different quality, rotation, or format)
     """
-    img = Image.open(io.BytesIO(file_bytes))
-    # Use average hash for robustness
-    phash = imagehash.average_hash(img)
+    # Pulls in numpy and scipy; only paid for by the first image upload
+    import imagehash
+
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(file_bytes)))
+    # DCT hash separates text-heavy receipts better than average hash,
+    # whose 8x8 thumbnails of white paper all look alike
+    phash = imagehash.phash(img)
     return str(phash)
 
+async def spool_upload(file: UploadFile, upload_dir: str, max_bytes: int) -> SpooledUpload:
+    """
+    Stream an upload to a temporary file under upload_dir, hashing it on the way
+
+    Only one chunk is held in memory at a time. The request body has already
+    been spooled by the multipart parser, within UploadLimitMiddleware's limit;
+    this enforces the per-file limit, which matters for batch uploads.
+
+    Raises:
+        UploadTooLargeError: If the upload is larger than max_bytes
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLargeError(f"File exceeds the {max_bytes} byte upload limit")
+
+    tmp_dir = os.path.join(upload_dir, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out, timed("spool_hash"):
+            while chunk := await file.read(SPOOL_CHUNK_SIZE):
+                size += len(chunk)
+                await run_in_threadpool(_write_chunk, out, sha256, chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    return SpooledUpload(tmp_path, sha256.hexdigest(), size, file.filename, file.content_type)
+
+def store_content_addressed(upload: SpooledUpload, upload_dir: str) -> str:
+    """
+    Move a spooled upload to uploads/ab/cd/<sha256>
+
+    If the content is already stored, the temporary copy is dropped instead
+    of being written again.
+
+    Returns:
+        str: Path of the stored file
+    """
+    file_hash = upload.file_hash
+    path = os.path.join(upload_dir, file_hash[:2], file_hash[2:4], file_hash)
+    if upload.path == path:
+        return path
+
+    if os.path.exists(path):
+        upload.discard()
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(upload.path, path)
+
+    upload.path = path
+    upload.temporary = False
+    return path
+
+def _write_chunk(out, sha256, chunk: bytes):
+    sha256.update(chunk)
+    out.write(chunk)
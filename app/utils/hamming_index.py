@@ -0,0 +1,88 @@
+from typing import Hashable, Optional
+import threading
+
+class HammingIndex:
+    """
+    In-memory multi-index hash table for Hamming radius queries over fixed-width hashes
+
+    The hash is split into max_distance + 1 disjoint chunks. Two hashes within
+    max_distance bits of each other must agree exactly on at least one chunk
+    (pigeonhole), so a query only compares against entries sharing a chunk
+    value with it instead of scanning every stored hash.
+    """
+
+    def __init__(self, max_distance: int, bits: int = 64):
+        self.max_distance = max(0, min(max_distance, bits - 1))
+        self.bits = bits
+
+        # (shift, mask) for each chunk, sizes as even as possible
+        chunk_count = self.max_distance + 1
+        self._chunks = []
+        start = 0
+        for n in range(chunk_count):
+            width = bits // chunk_count + (1 if n < bits % chunk_count else 0)
+            self._chunks.append((start, (1 << width) - 1))
+            start += width
+
+        self._tables: list[dict[int, set]] = [{} for _ in self._chunks]
+        self._values: dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._values
+
+    def add(self, key: Hashable, value: int):
+        """Insert or replace the hash stored under key"""
+        with self._lock:
+            if key in self._values:
+                self._discard(key)
+            self._values[key] = value
+            for table, (shift, mask) in zip(self._tables, self._chunks):
+                table.setdefault((value >> shift) & mask, set()).add(key)
+
+    def remove(self, key: Hashable):
+        with self._lock:
+            if key in self._values:
+                self._discard(key)
+
+    def nearest(self, value: int, max_distance: Optional[int] = None) -> Optional[tuple[Hashable, int]]:
+        """
+        Find the closest stored hash within max_distance bits
+
+        Args:
+            value: Hash to look up
+            max_distance: Search radius, at most the radius the index was built for
+
+        Returns:
+            (key, distance) of the best match, or None if nothing is close enough
+        """
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+
+        best = None
+        with self._lock:
+            seen = set()
+            for table, (shift, mask) in zip(self._tables, self._chunks):
+                for key in table.get((value >> shift) & mask, ()):
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    distance = (self._values[key] ^ value).bit_count()
+                    if distance <= max_distance and (best is None or distance < best[1]):
+                        best = (key, distance)
+                        if distance == 0:
+                            return best
+        return best
+
+    def _discard(self, key: Hashable):
+        value = self._values.pop(key)
+        for table, (shift, mask) in zip(self._tables, self._chunks):
+            bucket_key = (value >> shift) & mask
+            bucket = table.get(bucket_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del table[bucket_key]
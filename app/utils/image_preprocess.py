@@ -0,0 +1,163 @@
+from PIL import Image, ImageChops, ImageOps
+from typing import Optional
+import io
+import time
+
+# Named pre-processing presets, from most faithful to smallest payload
+PRESETS = {
+    "off": None,
+    "quality": {"max_edge": 3072, "grayscale": False, "autocrop": True, "quality": 90, "target_bytes": None},
+    "balanced": {"max_edge": 2048, "grayscale": False, "autocrop": True, "quality": 85, "target_bytes": 1_000_000},
+    "compact": {"max_edge": 1600, "grayscale": True, "autocrop": True, "quality": 75, "target_bytes": 400_000},
+}
+
+PREPROCESS_TYPES = ['image/png', 'image/jpeg', 'image/jpg', 'image/webp']
+
+# Re-encoding never goes below this JPEG quality; past it the image is shrunk instead
+MIN_QUALITY = 50
+
+# Pixels differing from the border colour by more than this count as content when cropping
+AUTOCROP_TOLERANCE = 32
+
+def resolve_options(preset: str, **overrides) -> Optional[dict]:
+    """
+    Look up a preset and apply per-setting overrides
+
+    Args:
+        preset: Name of an entry in PRESETS
+        overrides: Option values replacing the preset's (None leaves the preset value)
+
+    Returns:
+        dict of options for preprocess_image, or None when pre-processing is off
+    """
+    if preset not in PRESETS:
+        raise ValueError(f"Unknown preprocess preset '{preset}'. Available: {', '.join(PRESETS)}")
+    options = PRESETS[preset]
+    if options is None:
+        return None
+    options = dict(options)
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    return options
+
+def preprocess_image(file_bytes: bytes, mime_type: str, options: Optional[dict]) -> tuple[bytes, str, dict]:
+    """
+    Shrink an invoice image before it is sent for extraction
+
+    Applies EXIF orientation, downscales to options['max_edge'], optionally
+    converts to grayscale and crops uniform borders, then re-encodes as JPEG,
+    lowering quality (and finally size) until it fits options['target_bytes'].
+    The original bytes are kept if re-encoding would not make them smaller.
+
+    Args:
+        file_bytes: Image bytes after convert_to_supported_format
+        mime_type: MIME type of file_bytes
+        options: Result of resolve_options, or None to pass the image through
+
+    Returns:
+        tuple: (bytes, mime_type, metrics) where metrics reports sizes and time spent
+
+    Raises:
+        ValueError: The image can't be decoded
+    """
+    started = time.perf_counter()
+    metrics = {
+        "bytes_before": len(file_bytes),
+        "bytes_after": len(file_bytes),
+        "width_before": None,
+        "height_before": None,
+        "width_after": None,
+        "height_after": None,
+        "seconds": 0.0,
+    }
+    if options is None or mime_type not in PREPROCESS_TYPES:
+        return file_bytes, mime_type, metrics
+
+    try:
+        img = Image.open(io.BytesIO(file_bytes))
+        metrics["width_before"], metrics["height_before"] = img.size
+        orientation = img.getexif().get(0x0112, 1)
+
+        mode = "L" if options.get("grayscale") else "RGB"
+        max_edge = options.get("max_edge")
+        if max_edge and img.format == "JPEG":
+            # Let the JPEG decoder scale down by powers of two while decoding
+            img.draft(mode, _fit(img.size, max_edge))
+
+        img = ImageOps.exif_transpose(img)
+        img = _flatten(img, mode)
+
+        if max_edge and max(img.size) > max_edge:
+            img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+        if options.get("autocrop"):
+            img = _autocrop(img)
+
+        output = _encode(img, options.get("quality", 85), options.get("target_bytes"))
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        # Corrupt, truncated or oversized images: the client's file, not a server error
+        raise ValueError(f"Could not read image: {str(e)}")
+
+    if len(output) >= len(file_bytes) and orientation == 1:
+        # Nothing gained: keep the original encoding
+        metrics["width_after"], metrics["height_after"] = metrics["width_before"], metrics["height_before"]
+        metrics["seconds"] = time.perf_counter() - started
+        return file_bytes, mime_type, metrics
+
+    metrics["bytes_after"] = len(output)
+    metrics["width_after"], metrics["height_after"] = Image.open(io.BytesIO(output)).size
+    metrics["seconds"] = time.perf_counter() - started
+    return output, "image/jpeg", metrics
+
+def _fit(size: tuple[int, int], max_edge: int) -> tuple[int, int]:
+    width, height = size
+    scale = min(1.0, max_edge / max(width, height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+def _flatten(img: Image.Image, mode: str) -> Image.Image:
+    """Convert to mode, compositing any transparency onto white"""
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGBA", img.size, (255, 255, 255, 255))
+        img = Image.alpha_composite(background, img)
+    return img.convert(mode) if img.mode != mode else img
+
+def _autocrop(img: Image.Image) -> Image.Image:
+    """Trim borders matching the corner colour, keeping a small margin"""
+    gray = img.convert("L") if img.mode != "L" else img
+    width, height = gray.size
+    corners = [gray.getpixel((0, 0)), gray.getpixel((width - 1, 0)),
+               gray.getpixel((0, height - 1)), gray.getpixel((width - 1, height - 1))]
+    border = max(set(corners), key=corners.count)
+
+    diff = ImageChops.difference(gray, Image.new("L", gray.size, border))
+    mask = diff.point(lambda p: 255 if p > AUTOCROP_TOLERANCE else 0)
+    bbox = mask.getbbox()
+    if bbox is None:
+        return img
+
+    margin = max(4, int(max(width, height) * 0.01))
+    left, top, right, bottom = bbox
+    bbox = (max(0, left - margin), max(0, top - margin),
+            min(width, right + margin), min(height, bottom + margin))
+
+    # Only crop when it removes a meaningful border
+    cropped_area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+    if cropped_area > 0.95 * width * height:
+        return img
+    return img.crop(bbox)
+
+def _encode(img: Image.Image, quality: int, target_bytes: Optional[int]) -> bytes:
+    while True:
+        output = io.BytesIO()
+        img.save(output, format="JPEG", quality=quality, optimize=True)
+        data = output.getvalue()
+        if not target_bytes or len(data) <= target_bytes or max(img.size) <= 512:
+            return data
+
+        if quality > MIN_QUALITY:
+            quality = max(MIN_QUALITY, quality - 10)
+        else:
+            img = img.resize(
+                (max(1, int(img.width * 0.8)), max(1, int(img.height * 0.8))),
+                Image.Resampling.LANCZOS
+            )
@@ -0,0 +1,176 @@
+"""
+In-process metrics exported in the Prometheus text format
+
+Each metric keeps its samples in a dict keyed by label values behind a
+lock, so recording is a dict update and rendering happens only when
+/metrics is scraped. Values are per process; with several workers, scrape
+each one or aggregate in Prometheus.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+import bisect
+import math
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple, extra: Optional[dict] = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key: tuple, value) -> list[str]:
+        return [f"{self.name}{self._labels(key)} {_format(value)}"]
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track(self, **labels) -> Iterator[None]:
+        """Count the enclosed block as in progress"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            sample = self._values.get(key)
+            if sample is None:
+                # Per-bucket counts (the last slot is +Inf), then sum
+                sample = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            sample[0][index] += 1
+            sample[1] += value
+
+    def _render_sample(self, key: tuple, value) -> list[str]:
+        counts, total = value
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = "+Inf" if bound == math.inf else _format(bound)
+            lines.append(f"{self.name}_bucket{self._labels(key, {'le': le})} {cumulative}")
+        lines.append(f"{self.name}_sum{self._labels(key)} {_format(total)}")
+        lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+REGISTRY: list[_Metric] = []
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format"""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+# Per-request stage durations, collected for the Server-Timing header
+_request_timings: ContextVar[Optional[dict]] = ContextVar("request_timings", default=None)
+
+@contextmanager
+def collect_timings() -> Iterator[dict]:
+    """Collect the stage durations recorded by timed() within this context"""
+    timings = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Time a pipeline stage into STAGE_SECONDS and the current request's timings"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            # Stages can run several times per request (pages, batches); report the total
+            timings[stage] = timings.get(stage, 0.0) + elapsed
+
+def server_timing(timings: dict) -> str:
+    """Format stage durations as a Server-Timing header value"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+def _format(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests handled", ("method", "route", "status"))
+HTTP_REQUEST_SECONDS = Histogram("http_request_seconds", "HTTP request latency until the response starts", ("method", "route"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being handled")
+
+UPLOADS = Counter("invoice_uploads_total", "Invoice uploads by cache outcome", ("result",))
+HASH_LOOKUPS = Counter("invoice_hash_lookups_total", "file_hash lookups by where they were answered", ("source",))
+STAGE_SECONDS = Histogram("invoice_pipeline_stage_seconds", "Time spent per pipeline stage", ("stage",))
+
+GEMINI_REQUESTS = Counter("gemini_requests_total", "Gemini extraction calls by outcome", ("outcome",))
+GEMINI_ERRORS = Counter("gemini_errors_total", "Failed Gemini extraction calls by error type", ("error",))
+GEMINI_TOKENS = Counter("gemini_tokens_total", "Gemini tokens used", ("kind",))
+GEMINI_IN_FLIGHT = Gauge("gemini_requests_in_flight", "Gemini calls currently awaiting a response")
+GEMINI_RETRIES = Counter("gemini_retries_total", "Gemini calls retried after a transient failure", ("reason",))
+GEMINI_HEDGES = Counter("gemini_hedged_requests_total", "Slow Gemini calls raced against a second request")
+GEMINI_BREAKER_STATE = Gauge("gemini_circuit_state", "Gemini circuit breaker state (0 closed, 1 half-open, 2 open)")
+GEMINI_BATCH_SIZE = Histogram("gemini_batch_size", "Images packed into each multi-image Gemini request", buckets=(2, 3, 4, 6, 8, 12, 16, 24, 32))
+GEMINI_BATCHED_IMAGES = Counter("gemini_batched_images_total", "Images sent in multi-image requests, by whether the batch answered them or a single call was needed", ("outcome",))
+GEMINI_BATCH_REQUESTS_SAVED = Counter("gemini_batch_requests_saved_total", "Gemini requests not made thanks to multi-image requests")
+GEMINI_BATCH_TOKENS_SAVED = Counter("gemini_batch_prompt_tokens_saved_total", "Estimated prompt tokens not sent thanks to multi-image requests")
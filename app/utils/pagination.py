@@ -0,0 +1,34 @@
+from datetime import date
+import base64
+import hashlib
+import json
+
+def encode_cursor(invoice_date: date, invoice_id: int) -> str:
+    """Opaque cursor for the (invoice_date, id) keyset position of the last row returned"""
+    payload = json.dumps([invoice_date.isoformat(), invoice_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[date, int]:
+    """
+    Inverse of encode_cursor
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        invoice_date, invoice_id = json.loads(base64.urlsafe_b64decode(padded))
+        return date.fromisoformat(invoice_date), int(invoice_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def etag(body: bytes) -> str:
+    """Strong ETag for a response body"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: str, tag: str) -> bool:
+    """Whether an If-None-Match header value matches tag (weak comparison, as RFC 9110 requires)"""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return any(candidate.removeprefix("W/") == tag for candidate in candidates)
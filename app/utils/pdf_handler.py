@@ -0,0 +1,34 @@
+from typing import Iterator
+import hashlib
+import io
+
+# pypdf is imported on first use: it adds noticeably to startup and only PDF uploads need it
+
+def count_pdf_pages(file_bytes: bytes) -> int:
+    """Number of pages in a PDF, without rendering any of them"""
+    from pypdf import PdfReader
+
+    return len(PdfReader(io.BytesIO(file_bytes)).pages)
+
+def iter_pdf_pages(file_bytes: bytes) -> Iterator[tuple[int, bytes, str]]:
+    """
+    Split a PDF into single-page PDFs, one page at a time
+
+    Pages are written out lazily as the iterator advances, so only the pages
+    currently being worked on are held as separate documents. The per-page
+    hash only depends on that page's content and resources, so editing one
+    page of a statement leaves the other pages' hashes unchanged.
+
+    Yields:
+        tuple: (page_number starting at 1, single-page PDF bytes, SHA-256 of those bytes)
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(io.BytesIO(file_bytes))
+    for page_number, page in enumerate(reader.pages, start=1):
+        writer = PdfWriter()
+        writer.add_page(page)
+        output = io.BytesIO()
+        writer.write(output)
+        page_bytes = output.getvalue()
+        yield page_number, page_bytes, hashlib.sha256(page_bytes).hexdigest()
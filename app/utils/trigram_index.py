@@ -0,0 +1,109 @@
+from collections import Counter
+from typing import Hashable, Iterable, Optional
+import re
+import threading
+
+_WORD = re.compile(r"\w+")
+
+def normalize(text: str) -> str:
+    """Lowercase words separated by single spaces; punctuation is dropped"""
+    return " ".join(_WORD.findall(text.casefold()))
+
+def trigrams(text: str) -> set[str]:
+    """Word trigrams, each word padded like pg_trgm ("  mi", " mi", ..., "ak ")"""
+    grams = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class TrigramIndex:
+    """
+    In-memory fuzzy text index mapping short terms (names) to the keys they appear under
+
+    Each distinct term is indexed once by its trigrams and keeps the set of
+    keys it was added for. A query is scored against a term by trigram
+    containment: the share of the query's trigrams that the term has. A word
+    contained in a longer name ("minyak" in "Minyak Goreng 2L") scores 1, and
+    a misspelling ("indomart") still scores high against the right name.
+    Only terms sharing at least one trigram with the query are scored.
+
+    Keys are not mapped back to their terms, which would cost more memory
+    than all the postings; remove() scans every term's postings instead.
+    """
+
+    def __init__(self):
+        # Raw and normalized term -> term id (-1 for terms without any word)
+        self._term_ids: dict[str, int] = {}
+        self._postings: list[set] = []
+        self._trigram_terms: dict[str, set[int]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def term_count(self) -> int:
+        return len(self._postings)
+
+    def add(self, key: Hashable, terms: Iterable[Optional[str]]):
+        """Add key under each of terms; remove() it first to replace its terms"""
+        with self._lock:
+            for term in terms:
+                if not term:
+                    continue
+                term_id = self._term_ids.get(term)
+                if term_id is None:
+                    term_id = self._new_term(term)
+                if term_id >= 0:
+                    self._postings[term_id].add(key)
+
+    def remove(self, key: Hashable):
+        with self._lock:
+            for postings in self._postings:
+                postings.discard(key)
+
+    def search(self, query: str, min_score: float = 0.5) -> dict[Hashable, float]:
+        """
+        Keys with a term matching query
+
+        Args:
+            query: Text to look for
+            min_score: Lowest trigram containment (0-1) for a term to match
+
+        Returns:
+            dict: Score of the best matching term per key
+        """
+        query_trigrams = trigrams(query)
+        if not query_trigrams:
+            return {}
+
+        results = {}
+        with self._lock:
+            shared = Counter()
+            for gram in query_trigrams:
+                shared.update(self._trigram_terms.get(gram, ()))
+            scores = {
+                term_id: count / len(query_trigrams)
+                for term_id, count in shared.items()
+                if count / len(query_trigrams) >= min_score
+            }
+            # Best terms first, so each key keeps the score of its best match
+            for term_id in sorted(scores, key=scores.get, reverse=True):
+                postings = self._postings[term_id]
+                if results:
+                    postings = postings.difference(results)
+                results.update(dict.fromkeys(postings, scores[term_id]))
+        return results
+
+    def _new_term(self, term: str) -> int:
+        """Id for a term not seen in this exact spelling before"""
+        normalized = normalize(term)
+        term_id = self._term_ids.get(normalized)
+        if term_id is None:
+            if not normalized:
+                term_id = -1
+            else:
+                term_id = self._term_ids[normalized] = len(self._postings)
+                self._postings.append(set())
+                for gram in trigrams(normalized):
+                    self._trigram_terms.setdefault(gram, set()).add(term_id)
+        self._term_ids[term] = term_id
+        return term_id
@@ -0,0 +1,86 @@
+"""
+Measure how long importing the application takes, and what it pulls in
+
+Usage:
+    python -m benchmarks.import_benchmark [--runs 5] [--top 15] [--budget-ms 1500]
+
+Each run imports app.main in a fresh interpreter under `python -X importtime`.
+Prints the median total and the packages costing the most, then exits with
+status 1 if the median exceeds --budget-ms or if any package that should be
+imported lazily (google.genai, reportlab, pypdf, imagehash, ...) is loaded at
+startup. CI runs this to keep cold starts fast.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+# Only needed once a request uses them; importing any of these at startup is a regression
+LAZY_PACKAGES = ("google.genai", "reportlab", "pypdf", "imagehash", "numpy", "scipy", "pandas", "matplotlib")
+
+def import_times(module: str) -> dict[str, tuple[int, int]]:
+    """Self and cumulative import time in microseconds per module, from one fresh interpreter"""
+    env = {
+        **os.environ,
+        "DATABASE_URL": os.environ.get("DATABASE_URL", "sqlite:///./import_benchmark.db"),
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "benchmark"),
+        "GEMINI_FLASH_3": os.environ.get("GEMINI_FLASH_3", "benchmark"),
+    }
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+def package_of(name: str) -> str:
+    return ".".join(name.split(".")[:2]) if name.startswith(("google.", "app.")) else name.split(".")[0]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="packages to list by import time")
+    parser.add_argument("--budget-ms", type=float, help="fail if the median import time is above this")
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    totals = [times[args.module][1] / 1000 for times in runs]
+    median = statistics.median(totals)
+
+    # Self time summed per package, from the median run
+    times = runs[totals.index(sorted(totals)[len(totals) // 2])]
+    packages = defaultdict(int)
+    for name, (self_us, _) in times.items():
+        packages[package_of(name)] += self_us
+
+    print(f"import {args.module}: median {median:.0f} ms over {args.runs} runs "
+          f"(min {min(totals):.0f}, max {max(totals):.0f}), {len(times)} modules")
+    print(f"{'package':<28} {'ms':>8}")
+    print("-" * 37)
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{package:<28} {self_us / 1000:>8.1f}")
+
+    failures = []
+    eager = sorted({
+        lazy for lazy in LAZY_PACKAGES for name in times
+        if name == lazy or name.startswith(lazy + ".")
+    })
+    if eager:
+        failures.append(f"imported at startup but should be lazy: {', '.join(eager)}")
+    if args.budget_ms is not None and median > args.budget_ms:
+        failures.append(f"median import time {median:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+End-to-end load test of the API with the fake extraction backend
+
+Usage:
+    python -m benchmarks.load_benchmark [--concurrency 1,8,32] [--requests 200]
+        [--scenarios upload,list,report] [--latency-ms 0] [--batch-window-ms 0]
+        [--database-url URL]
+
+The app runs in-process behind httpx's ASGI transport with
+EXTRACTION_BACKEND=fake, so uploads go through spooling, hashing,
+pre-processing, the Gemini caller and the database exactly as in
+production, minus the network and the model. Every upload is a freshly
+generated image, so none is served from the duplicate cache. Report
+caching is disabled so every report request renders.
+
+Without --database-url a fresh SQLite database is created in a temporary
+directory. Pass a PostgreSQL URL to measure against a real server.
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+SCENARIOS = ("upload", "list", "report")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated client concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    parser.add_argument("--report-requests", type=int, default=20, help="report requests per concurrency level")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="median fake model latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="lognormal spread of the fake latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake model calls that fail")
+    parser.add_argument("--batch-window-ms", type=float, default=0.0, help="micro-batching window for uploads (0 disables)")
+    parser.add_argument("--database-url", help="database to test against (default: temporary SQLite)")
+    return parser.parse_args()
+
+def configure(args) -> tempfile.TemporaryDirectory:
+    """Point the settings at the fake backend and a scratch directory before the app is imported"""
+    workdir = tempfile.TemporaryDirectory(prefix="load-benchmark-")
+    # Relative upload, report and SQLite paths all land in the scratch directory
+    os.chdir(workdir.name)
+    os.environ.update({
+        "EXTRACTION_BACKEND": "fake",
+        "FAKE_LATENCY_MS": str(args.latency_ms),
+        "FAKE_LATENCY_SIGMA": str(args.latency_sigma),
+        "FAKE_ERROR_RATE": str(args.error_rate),
+        "GEMINI_BATCH_WINDOW_MS": str(args.batch_window_ms),
+        "REPORT_CACHE_MAX_BYTES": "0",
+        "DATABASE_URL": args.database_url or "sqlite:///./load_benchmark.db",
+    })
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    os.environ.setdefault("GEMINI_FLASH_3", "benchmark")
+    return workdir
+
+def invoice_image(seed: int) -> bytes:
+    """A PNG whose content, and so its hash and perceptual hash, is unique to seed"""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    # Random 8x8 blocks scaled up: far apart in perceptual hash space, cheap to make
+    small = Image.new("L", (8, 8))
+    small.putdata([rng.randrange(256) for _ in range(64)])
+    image = small.resize((800, 1100), Image.NEAREST)
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+class Scenario:
+    """Hands out the requests of one run to its client tasks"""
+
+    def __init__(self, name: str, total: int):
+        self.name = name
+        self.total = total
+        self.issued = 0
+
+    def next(self):
+        if self.issued >= self.total:
+            return None
+        self.issued += 1
+        return self.issued
+
+async def upload(client, state: dict):
+    state["image_seed"] += 1
+    content = invoice_image(state["image_seed"])
+    return await client.post(
+        "/invoices/upload", files={"file": (f"invoice-{state['image_seed']}.png", content, "image/png")}
+    )
+
+async def list_page(client, state: dict):
+    # Each request reads the next page, starting over once the end is reached
+    params = {"limit": 50}
+    if state.get("cursor"):
+        params["cursor"] = state["cursor"]
+    response = await client.get("/invoices/", params=params)
+    state["cursor"] = response.headers.get("X-Next-Cursor")
+    return response
+
+async def report(client, state: dict):
+    return await client.post(
+        "/reports/generate",
+        json={"start_date": "2025-01-01", "end_date": "2025-12-31", "report_type": "yearly"}
+    )
+
+REQUESTS = {"upload": upload, "list": list_page, "report": report}
+
+async def run(client, name: str, total: int, concurrency: int, state: dict) -> dict:
+    scenario = Scenario(name, total)
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        while scenario.next() is not None:
+            started = time.perf_counter()
+            try:
+                response = await REQUESTS[name](client, state)
+                # Drain streamed bodies such as report PDFs
+                await response.aread()
+                failed = response.status_code >= 400
+            except Exception:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        **{f"p{p}": percentile(latencies, p) * 1000 for p in (50, 95, 99)}
+    }
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, round(p / 100 * (len(values) - 1)))]
+
+async def benchmark(args):
+    import httpx
+    from app.database import engine
+    from app.main import app
+    from app.utils.metrics import GEMINI_BATCH_REQUESTS_SAVED, GEMINI_REQUESTS
+
+    if args.database_url and engine.url.render_as_string(hide_password=False) != args.database_url:
+        sys.exit(f"The app connected to {engine.url} instead of {args.database_url}; check DATABASE_URL handling")
+
+    scenarios = [name.strip() for name in args.scenarios.split(",")]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    print(f"database: {engine.url.render_as_string()}, fake latency: {args.latency_ms:g} ms median")
+    header = f"{'scenario':>8} {'clients':>8} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    print(header)
+    print("-" * len(header))
+
+    state = {"image_seed": random.randrange(1 << 32)}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                for name in scenarios:
+                    total = args.report_requests if name == "report" else args.requests
+                    stats = await run(client, name, total, concurrency, state)
+                    print(
+                        f"{name:>8} {concurrency:>8} {stats['requests']:>9} {stats['errors']:>7} {stats['rps']:>8.1f} "
+                        f"{stats['p50']:>8.1f} {stats['p95']:>8.1f} {stats['p99']:>8.1f}"
+                    )
+    print(f"model requests: {GEMINI_REQUESTS.value(outcome='ok'):g}, saved by batching: {GEMINI_BATCH_REQUESTS_SAVED.value():g}")
+
+def main():
+    args = parse_args()
+    # The benchmark package must stay importable after the chdir below
+    sys.path.insert(0, os.getcwd())
+    workdir = configure(args)
+    try:
+        asyncio.run(benchmark(args))
+    finally:
+        os.chdir(os.path.dirname(workdir.name))
+        workdir.cleanup()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compare image pre-processing presets on a set of sample invoices
+
+Usage:
+    python -m benchmarks.preprocess_benchmark [IMAGE_DIR] [--repeat N]
+
+For each preset, reports the average payload size, the size reduction, the
+time spent pre-processing and an estimate of the Gemini image tokens
+(258 tokens per 768x768 tile; images up to 384px count as one tile).
+"""
+import argparse
+import glob
+import io
+import math
+import os
+import statistics
+import sys
+
+from PIL import Image
+
+from app.utils.image_preprocess import PRESETS, preprocess_image, resolve_options
+
+MIME_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".webp": "image/webp"}
+
+def estimate_image_tokens(width: int, height: int) -> int:
+    if width <= 384 and height <= 384:
+        return 258
+    return math.ceil(width / 768) * math.ceil(height / 768) * 258
+
+def load_samples(image_dir: str) -> list[tuple[str, bytes, str]]:
+    samples = []
+    for path in sorted(glob.glob(os.path.join(image_dir, "*"))):
+        mime_type = MIME_TYPES.get(os.path.splitext(path)[1].lower())
+        if mime_type:
+            with open(path, "rb") as f:
+                samples.append((os.path.basename(path), f.read(), mime_type))
+    return samples
+
+def run(image_dir: str, repeat: int):
+    samples = load_samples(image_dir)
+    if not samples:
+        sys.exit(f"No PNG/JPEG/WEBP images found in {image_dir}")
+    print(f"{len(samples)} images from {image_dir}, {repeat} run(s) each\n")
+
+    header = f"{'preset':<10} {'avg KB in':>10} {'avg KB out':>11} {'reduction':>10} {'avg ms':>8} {'p95 ms':>8} {'est. tokens':>12}"
+    print(header)
+    print("-" * len(header))
+
+    for preset in PRESETS:
+        options = resolve_options(preset)
+        bytes_in, bytes_out, times, tokens = [], [], [], []
+        for _, content, mime_type in samples:
+            for _ in range(repeat):
+                output, _, metrics = preprocess_image(content, mime_type, options)
+                times.append(metrics["seconds"] * 1000)
+            bytes_in.append(len(content))
+            bytes_out.append(len(output))
+            with Image.open(io.BytesIO(output)) as img:
+                tokens.append(estimate_image_tokens(*img.size))
+
+        p95 = sorted(times)[max(0, math.ceil(len(times) * 0.95) - 1)]
+        reduction = 1 - sum(bytes_out) / sum(bytes_in)
+        print(
+            f"{preset:<10} {statistics.mean(bytes_in) / 1024:>10.1f} {statistics.mean(bytes_out) / 1024:>11.1f} "
+            f"{reduction:>9.1%} {statistics.mean(times):>8.1f} {p95:>8.1f} {statistics.mean(tokens):>12.0f}"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir", nargs="?", default="uploads")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.image_dir, args.repeat)
@@ -0,0 +1,143 @@
+"""
+Measure PDF report generation time and peak memory at several invoice counts
+
+Usage:
+    python -m benchmarks.report_benchmark [--sizes 1000,10000,100000] [--items 3]
+
+Each size is seeded into a fresh SQLite database, then rendered in a child
+process so that peak RSS reflects the report build alone.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./benchmark.db")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("GEMINI_FLASH_3", "benchmark")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models.invoice import Invoice, InvoiceItem
+from app.services.rollup_service import RollupService
+
+STORES = ["Indomaret", "Alfamart", "Superindo", "Hypermart", "Lotte Mart", "Transmart", "Hero", "Giant"]
+PRODUCTS = ["Minyak Goreng 2L", "Beras 5kg", "Gula Pasir 1kg", "Telur 1kg", "Susu UHT 1L",
+            "Kopi Bubuk 200g", "Mie Instan", "Sabun Mandi", "Teh Celup", "Air Mineral 600ml"]
+
+START = date(2025, 1, 1)
+
+def seed(db_path: str, count: int, items: int):
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(count)
+    batch, item_rows = [], []
+    with engine.begin() as conn:
+        for n in range(count):
+            details = [
+                {
+                    "product_name": rng.choice(PRODUCTS),
+                    "quantity": rng.randint(1, 5),
+                    "unit": "pcs",
+                    "amount": rng.randint(5, 200) * 1000,
+                    "discount": rng.choice([0, 0, 0, 500, 1000]),
+                }
+                for _ in range(rng.randint(1, items * 2 - 1))
+            ]
+            invoice = {
+                "id": n + 1,
+                "store_name": rng.choice(STORES),
+                "invoice_date": START + timedelta(days=rng.randrange(365)),
+                "total": float(sum(d["amount"] - d["discount"] for d in details)),
+                "details": details,
+                "file_path": "",
+                "file_hash": f"{n:064x}",
+            }
+            batch.append(invoice)
+            item_rows.extend(
+                {
+                    "invoice_id": invoice["id"],
+                    "line_no": line_no,
+                    "invoice_date": invoice["invoice_date"],
+                    "store_name": invoice["store_name"],
+                    **detail,
+                }
+                for line_no, detail in enumerate(details)
+            )
+            if len(batch) == 5000:
+                conn.execute(Invoice.__table__.insert(), batch)
+                conn.execute(InvoiceItem.__table__.insert(), item_rows)
+                batch, item_rows = [], []
+        if batch:
+            conn.execute(Invoice.__table__.insert(), batch)
+            conn.execute(InvoiceItem.__table__.insert(), item_rows)
+
+    # Reports read their summary from the rollups, which bulk inserts bypass
+    with sessionmaker(bind=engine)() as session:
+        RollupService.rebuild(session)
+
+def render(db_path: str):
+    """Child process: render one report and print timing and memory as JSON"""
+    from app.services.report_service import ReportService
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    session = sessionmaker(bind=engine)()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # The same entry point the report worker processes use
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filepath = os.path.join(tmp_dir, "report.pdf")
+        started = time.perf_counter()
+        ReportService.write_report(session, START, START + timedelta(days=365), "yearly", filepath)
+        elapsed = time.perf_counter() - started
+        size = os.path.getsize(filepath)
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "seconds": elapsed,
+        "pdf_bytes": size,
+        "rss_before_kb": rss_before,
+        "peak_rss_kb": rss_after,
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--items", type=int, default=3, help="average line items per invoice")
+    parser.add_argument("--render", metavar="DB_PATH", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.render:
+        render(args.render)
+        return
+
+    header = f"{'invoices':>10} {'seconds':>9} {'inv/s':>9} {'PDF MB':>8} {'peak RSS MB':>12} {'build RSS MB':>13}"
+    print(header)
+    print("-" * len(header))
+    for size in (int(s) for s in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "report.db")
+            seed(db_path, size, args.items)
+            result = subprocess.run(
+                [sys.executable, "-m", "benchmarks.report_benchmark", "--render", db_path],
+                capture_output=True, text=True, check=True
+            )
+        stats = json.loads(result.stdout.strip().splitlines()[-1])
+        # ru_maxrss is in KB on Linux
+        peak_mb = stats["peak_rss_kb"] / 1024
+        build_mb = (stats["peak_rss_kb"] - stats["rss_before_kb"]) / 1024
+        print(
+            f"{size:>10} {stats['seconds']:>9.2f} {size / stats['seconds']:>9.0f} "
+            f"{stats['pdf_bytes'] / 1e6:>8.1f} {peak_mb:>12.1f} {build_mb:>13.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import asyncio
+import io
+import os
+import random
+import tempfile
+
+# Settings are read when the app is first imported: point everything at a scratch directory
+WORKDIR = tempfile.mkdtemp(prefix="invoice-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{WORKDIR}/test.db",
+    "UPLOAD_DIR": os.path.join(WORKDIR, "uploads"),
+    "REPORT_DIR": os.path.join(WORKDIR, "reports"),
+    "EXTRACTION_BACKEND": "fake",
+    "FAKE_LATENCY_MS": "0",
+    "JOB_WORKERS": "0",
+})
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("GEMINI_FLASH_3", "test")
+
+import pytest
+
+from app.services.extraction_backend import ExtractionBackend
+
+VALID_INVOICE = {
+    "store_name": "Indomaret",
+    "invoice_date": "2025-03-14",
+    "total": 25000.0,
+    "details": [
+        {"product_name": "Minyak Goreng 2L", "quantity": 1, "unit": "pcs", "amount": 20000.0, "discount": 0},
+        {"product_name": "Gula Pasir 1kg", "quantity": 1, "unit": "pcs", "amount": 5000.0, "discount": 0}
+    ]
+}
+
+class StubExtractor(ExtractionBackend):
+    """Returns self.result (a dict, or a function of the image bytes) after self.delay seconds, counting calls"""
+
+    def __init__(self):
+        self.result = VALID_INVOICE
+        self.delay = 0.0
+        self.calls = 0
+
+    async def extract_invoice_data_async(self, image_bytes: bytes, mime_type: str, prompt: str = None) -> dict:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        result = self.result(image_bytes) if callable(self.result) else self.result
+        if isinstance(result, Exception):
+            raise result
+        return dict(result)
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def extractor(client, monkeypatch) -> StubExtractor:
+    """Empty database and a fresh InvoiceService, extracting with a StubExtractor"""
+    from app.database import Base, engine
+    from app.routers import invoice, job
+    from app.services.invoice_service import InvoiceService
+
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+
+    stub = StubExtractor()
+    service = InvoiceService(stub)
+    monkeypatch.setattr(invoice, "invoice_service", service)
+    monkeypatch.setattr(job.job_queue, "invoice_service", service)
+    return stub
+
+@pytest.fixture
+def service(extractor):
+    from app.routers import invoice
+
+    return invoice.invoice_service
+
+def make_image(seed: int) -> bytes:
+    """A PNG unique to seed, so every test uploads files nobody has stored yet"""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    small = Image.new("L", (8, 8))
+    small.putdata([rng.randrange(256) for _ in range(64)])
+    output = io.BytesIO()
+    small.resize((400, 560), Image.NEAREST).save(output, format="PNG")
+    return output.getvalue()
+
+@pytest.fixture
+def image():
+    """Factory for fresh PNG uploads"""
+    seeds = iter(range(random.randrange(1 << 30), 1 << 31))
+    return lambda: make_image(next(seeds))
+
+def upload(client, content: bytes, **params):
+    return client.post("/invoices/upload", params=params, files={"file": ("invoice.png", content, "image/png")})
+
+async def spool(content: bytes, filename: str = "invoice.png"):
+    """Spool content the way the upload routes do, for calling InvoiceService directly"""
+    from starlette.datastructures import Headers, UploadFile
+    from app.config import settings
+    from app.utils.file_handler import spool_upload
+
+    file = UploadFile(io.BytesIO(content), filename=filename, headers=Headers({"content-type": "image/png"}))
+    return await spool_upload(file, settings.upload_dir, settings.max_upload_bytes)
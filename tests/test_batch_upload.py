@@ -0,0 +1,44 @@
+import json
+
+from conftest import VALID_INVOICE, upload
+
+def upload_batch(client, files: list[tuple[str, bytes, str]], **params) -> list[dict]:
+    response = client.post(
+        "/invoices/upload/batch",
+        params=params,
+        files=[("files", file) for file in files]
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return sorted((json.loads(line) for line in response.text.splitlines()), key=lambda result: result["index"])
+
+def test_batch_streams_one_result_per_file(client, extractor, image):
+    stored, new = image(), image()
+    upload(client, stored)
+    extractor.calls = 0
+
+    results = upload_batch(client, [
+        ("stored.png", stored, "image/png"),
+        ("new.png", new, "image/png"),
+        ("copy.png", new, "image/png"),
+        ("notes.txt", b"not an invoice", "text/plain"),
+    ])
+
+    assert [result["index"] for result in results] == [0, 1, 2, 3]
+    assert [result["filename"] for result in results] == ["stored.png", "new.png", "copy.png", "notes.txt"]
+    assert [result["status_code"] for result in results] == [200, 200, 200, 400]
+    assert results[0]["invoice"]["is_cached"]
+    # Identical files in one batch are extracted once and share the invoice
+    assert extractor.calls == 1
+    assert results[1]["invoice"]["id"] == results[2]["invoice"]["id"]
+    assert [results[1]["invoice"]["is_cached"], results[2]["invoice"]["is_cached"]] == [False, True]
+    assert results[3]["status"] == "error" and results[3]["invoice"] is None
+
+def test_failing_file_does_not_fail_the_batch(client, extractor, image):
+    bad, good = image(), image()
+    results = iter([{**VALID_INVOICE, "total": None}, VALID_INVOICE])
+    extractor.result = lambda content: next(results)
+
+    results = upload_batch(client, [("bad.png", bad, "image/png"), ("good.png", good, "image/png")])
+    assert sorted(result["status_code"] for result in results) == [200, 422]
+    assert len(client.get("/invoices/").json()) == 1
@@ -0,0 +1,76 @@
+from datetime import date
+import uuid
+
+from app.utils.bloom_filter import MAX_COUNT, CountingBloomFilter
+
+def test_no_false_negatives_and_false_positives_near_target():
+    bloom = CountingBloomFilter(10000, error_rate=0.01)
+    keys = [uuid.uuid4().hex for _ in range(10000)]
+    for key in keys:
+        bloom.add(key)
+    assert len(bloom) == 10000
+    assert all(key in bloom for key in keys)
+
+    false_positives = sum(uuid.uuid4().hex in bloom for _ in range(20000))
+    assert false_positives / 20000 < 0.02
+
+def test_remove_keeps_the_other_keys():
+    bloom = CountingBloomFilter(100)
+    keys = [uuid.uuid4().hex for _ in range(100)]
+    for key in keys:
+        bloom.add(key)
+    for key in keys[:50]:
+        bloom.remove(key)
+    assert len(bloom) == 50
+    assert all(key in bloom for key in keys[50:])
+    assert sum(key in bloom for key in keys[:50]) < 10
+
+def test_saturated_counters_are_never_decremented():
+    bloom = CountingBloomFilter(10)
+    for _ in range(MAX_COUNT + 10):
+        bloom.add("popular")
+    for _ in range(MAX_COUNT + 10):
+        bloom.remove("popular")
+    assert "popular" in bloom
+
+def test_lookups_see_invoices_stored_elsewhere_and_forget_deleted_ones(client, extractor, service, image, monkeypatch):
+    from app.config import settings
+    from app.database import SessionLocal
+    from app.models.invoice import Invoice
+    from conftest import upload
+
+    monkeypatch.setattr(settings, "hash_filter_refresh_seconds", 0)
+    file_hash = uuid.uuid4().hex * 2
+    with SessionLocal() as db:
+        assert service.find_by_hash(db, file_hash) is None
+
+        # Stored by another worker process: picked up by the next refresh
+        invoice = Invoice(
+            file_hash=file_hash, file_path="uploads/elsewhere.png", store_name="Alfamart",
+            invoice_date=date(2025, 1, 1), total=1.0, details=[]
+        )
+        db.add(invoice)
+        db.commit()
+        assert service.find_by_hash(db, file_hash).id == invoice.id
+        assert file_hash in service.known_hashes
+
+    stored = upload(client, image()).json()
+    assert stored["file_hash"] in service.known_hashes
+    client.delete(f"/invoices/{stored['id']}")
+    with SessionLocal() as db:
+        assert service.find_by_hash(db, stored["file_hash"]) is None
+
+def test_filter_is_rebuilt_larger_past_capacity(client, extractor, service, image, monkeypatch):
+    from app.config import settings
+    from app.database import SessionLocal
+    from app.services.invoice_service import InvoiceService
+    from conftest import upload
+
+    monkeypatch.setattr(settings, "hash_filter_capacity", 2)
+    small = InvoiceService(extractor)
+    hashes = [upload(client, image()).json()["file_hash"] for _ in range(5)]
+
+    with SessionLocal() as db:
+        small._refresh_indexes(db)
+    assert small.known_hashes.capacity >= 5
+    assert all(file_hash in small.known_hashes for file_hash in hashes)
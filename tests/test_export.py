@@ -0,0 +1,64 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+from conftest import VALID_INVOICE, upload
+
+@pytest.fixture
+def stored(client, extractor, image, monkeypatch):
+    """Three invoices of two items each, exported one row per batch to cross batch boundaries"""
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "export_batch_size", 1)
+    invoices = []
+    for day, store in [("2025-03-02", "Alfamart"), ("2025-03-01", "Indomaret"), ("2025-03-03", "Indomaret")]:
+        extractor.result = {**VALID_INVOICE, "invoice_date": day, "store_name": store}
+        invoices.append(upload(client, image()).json())
+    return sorted(invoices, key=lambda invoice: invoice["invoice_date"])
+
+def export(client, **params):
+    response = client.get("/invoices/export", params=params)
+    assert response.status_code == 200
+    return response
+
+def test_csv_items_layout(client, stored):
+    response = export(client)
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 6
+    assert [row["invoice_id"] for row in rows[::2]] == [str(invoice["id"]) for invoice in stored]
+    assert [row["product_name"] for row in rows[:2]] == [item["product_name"] for item in VALID_INVOICE["details"]]
+
+def test_ndjson_invoices_layout_with_filters(client, stored):
+    response = export(client, format="ndjson", layout="invoices", store="Indomaret", start_date="2025-03-02")
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [record["invoice_id"] for record in records] == [stored[2]["id"]]
+    assert [item["product_name"] for item in records[0]["items"]] == [
+        item["product_name"] for item in VALID_INVOICE["details"]
+    ]
+
+def test_gzip_export(client, stored):
+    response = export(client, format="ndjson", gzip="true")
+    assert response.headers["content-type"] == "application/gzip"
+    assert response.headers["content-disposition"].endswith(".ndjson.gz")
+    # httpx leaves the body compressed: it is the file, not a Content-Encoding
+    lines = gzip.decompress(response.content).decode().splitlines()
+    assert len(lines) == 6
+
+def test_parquet_export(client, stored):
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    items = pq.read_table(io.BytesIO(export(client, format="parquet").content))
+    assert items.num_rows == 6
+    assert items.column("invoice_id").to_pylist()[::2] == [invoice["id"] for invoice in stored]
+
+    invoices = pq.read_table(io.BytesIO(export(client, format="parquet", layout="invoices").content)).to_pylist()
+    assert [len(invoice["items"]) for invoice in invoices] == [2, 2, 2]
+
+def test_invalid_export_requests(client, extractor):
+    assert client.get("/invoices/export", params={"format": "xml"}).status_code == 400
+    assert client.get("/invoices/export", params={"layout": "pages"}).status_code == 400
+    assert client.get("/invoices/export", params={"format": "parquet", "gzip": "true"}).status_code == 400
@@ -0,0 +1,89 @@
+import asyncio
+import os
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+os.environ.setdefault("GEMINI_FLASH_3", "test")
+
+import pytest
+
+from app.services.gemini_client import GeminiCaller, GeminiUnavailableError
+
+def make_caller(**overrides) -> GeminiCaller:
+    options = dict(
+        requests_per_minute=0,
+        tokens_per_minute=0,
+        max_concurrency=4,
+        timeout=5,
+        max_retries=0,
+        retry_base_delay=0.01,
+        retry_max_delay=0.01,
+        breaker_failures=1,
+        breaker_reset_seconds=0.05
+    )
+    options.update(overrides)
+    return GeminiCaller(**options)
+
+async def fail():
+    raise asyncio.TimeoutError()
+
+async def succeed():
+    return "ok"
+
+async def hang():
+    await asyncio.sleep(60)
+
+def test_cancelled_probe_lets_the_next_call_probe():
+    async def scenario():
+        caller = make_caller()
+        with pytest.raises(GeminiUnavailableError):
+            await caller.call(fail, 1)
+        assert caller.breaker.state == "open"
+
+        await asyncio.sleep(0.1)
+        probe = asyncio.ensure_future(caller.call(hang, 1))
+        await asyncio.sleep(0.01)
+        assert caller.breaker.state == "half_open"
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert await caller.call(succeed, 1) == "ok"
+        assert caller.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+def test_cancelled_call_does_not_release_another_calls_probe():
+    async def scenario():
+        caller = make_caller()
+        # Started while the circuit is closed, cancelled while another call holds the probe
+        bystander = asyncio.ensure_future(caller.call(hang, 1))
+        await asyncio.sleep(0.01)
+        with pytest.raises(GeminiUnavailableError):
+            await caller.call(fail, 1)
+
+        await asyncio.sleep(0.1)
+        probe = asyncio.ensure_future(caller.call(hang, 1))
+        await asyncio.sleep(0.01)
+        bystander.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await bystander
+
+        with pytest.raises(GeminiUnavailableError):
+            await caller.call(succeed, 1)
+        probe.cancel()
+
+    asyncio.run(scenario())
+
+def test_hedge_without_token_quota_gives_back_its_request():
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    async def scenario():
+        # Room for ten requests but only one call's worth of tokens
+        caller = make_caller(requests_per_minute=600, tokens_per_minute=60, hedge_after=0.01)
+        assert await caller.call(slow, 1) == "ok"
+        # The attempt took one request; the hedge that couldn't get tokens took none
+        assert caller.requests._tokens > 8.5
+
+    asyncio.run(scenario())
@@ -0,0 +1,76 @@
+import random
+
+from app.utils.hamming_index import HammingIndex
+
+def brute_force(values: dict, query: int, max_distance: int):
+    best = None
+    for key, value in values.items():
+        distance = (value ^ query).bit_count()
+        if distance <= max_distance and (best is None or distance < best[1]):
+            best = (key, distance)
+    return best
+
+def flip(value: int, bits: list[int]) -> int:
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+def test_nearest_matches_a_linear_scan():
+    rng = random.Random(1)
+    index = HammingIndex(max_distance=6)
+    values = {key: rng.getrandbits(64) for key in range(2000)}
+    for key, value in values.items():
+        index.add(key, value)
+
+    for _ in range(300):
+        base = values[rng.randrange(len(values))]
+        query = flip(base, rng.sample(range(64), rng.randrange(9)))
+        for radius in (0, 3, 6):
+            expected = brute_force(values, query, radius)
+            found = index.nearest(query, radius)
+            # Ties may resolve to a different key, but never to a different distance
+            assert (found and found[1]) == (expected and expected[1])
+
+def test_radius_is_capped_at_the_built_radius():
+    index = HammingIndex(max_distance=2)
+    index.add("a", 0)
+    assert index.nearest(flip(0, [1, 2]), 10) == ("a", 2)
+    assert index.nearest(flip(0, [1, 2, 3])) is None
+
+def test_add_replaces_and_remove_forgets():
+    index = HammingIndex(max_distance=4)
+    index.add("a", 0)
+    index.add("a", (1 << 64) - 1)
+    assert len(index) == 1
+    assert index.nearest(0) is None
+    assert index.nearest((1 << 64) - 1) == ("a", 0)
+
+    index.remove("a")
+    index.remove("a")
+    assert "a" not in index and len(index) == 0
+    assert index.nearest((1 << 64) - 1) is None
+    assert all(not table for table in index._tables)
+
+def test_near_duplicate_upload_is_served_from_the_stored_invoice(client, extractor, image, monkeypatch):
+    import io
+    from PIL import Image
+    from app.config import settings
+    from conftest import upload
+
+    from PIL import PngImagePlugin
+
+    monkeypatch.setattr(settings, "near_duplicate_threshold", 6)
+    original = image()
+    # Same pixels, different metadata: a new file hash, the same perceptual hash
+    info = PngImagePlugin.PngInfo()
+    info.add_text("Software", "scanner")
+    copy = io.BytesIO()
+    Image.open(io.BytesIO(original)).save(copy, format="PNG", pnginfo=info)
+
+    first = upload(client, original).json()
+    response = upload(client, copy.getvalue())
+    assert response.status_code == 200
+    second = response.json()
+    assert second["id"] == first["id"]
+    assert second["is_cached"] and second["similarity"] == 1.0
+    assert extractor.calls == 1
@@ -0,0 +1,158 @@
+import asyncio
+import os
+import time
+
+from conftest import VALID_INVOICE
+
+def submit(client, content: bytes, **params) -> dict:
+    response = client.post("/jobs/upload", params=params, files={"file": ("invoice.png", content, "image/png")})
+    assert response.status_code == 202
+    return response.json()
+
+def run_next_job():
+    """Claim and run one job the way a worker does"""
+    from app.routers.job import job_queue
+    from app.services.job_service import _claim_next_job
+
+    job_id = _claim_next_job()
+    assert job_id is not None
+    asyncio.run(job_queue._run(job_id))
+    return job_id
+
+def stored_path(job: dict) -> str:
+    from app.database import SessionLocal
+    from app.models.job import ExtractionJob
+
+    with SessionLocal() as db:
+        return db.get(ExtractionJob, job["id"]).file_path
+
+def test_job_runs_to_an_invoice(client, extractor, image):
+    content = image()
+    job = submit(client, content)
+    assert job["status"] == "queued"
+
+    run_next_job()
+    done = client.get(f"/jobs/{job['id']}").json()
+    assert done["status"] == "done" and done["attempts"] == 1
+    assert done["queue_seconds"] >= 0 and done["run_seconds"] >= 0
+    assert client.get(f"/invoices/{done['invoice_id']}").json()["file_hash"] == job["file_hash"]
+
+    # The same file again is served from the stored invoice
+    again = submit(client, content)
+    run_next_job()
+    again = client.get(f"/jobs/{again['id']}").json()
+    assert again["is_cached"] and again["invoice_id"] == done["invoice_id"]
+    assert extractor.calls == 1
+
+def test_a_job_is_claimed_once(client, extractor, image):
+    from app.services.job_service import _claim_next_job
+
+    job = submit(client, image())
+    assert _claim_next_job() == job["id"]
+    assert _claim_next_job() is None
+    assert client.get(f"/jobs/{job['id']}").json()["status"] == "running"
+
+def test_unavailable_gemini_requeues_until_out_of_attempts(client, extractor, image, monkeypatch):
+    from app.config import settings
+    from app.services.gemini_client import GeminiUnavailableError
+
+    monkeypatch.setattr(settings, "job_max_attempts", 2)
+    extractor.result = GeminiUnavailableError("Gemini is over quota", retry_after=0)
+    job = submit(client, image())
+    path = stored_path(job)
+
+    run_next_job()
+    requeued = client.get(f"/jobs/{job['id']}").json()
+    assert requeued["status"] == "queued" and requeued["attempts"] == 1
+    assert os.path.exists(path)
+
+    run_next_job()
+    failed = client.get(f"/jobs/{job['id']}").json()
+    assert failed["status"] == "failed" and failed["attempts"] == 2
+    assert "over quota" in failed["error"]
+    assert not os.path.exists(path)
+
+def test_workers_drain_the_queue(client, extractor, image, monkeypatch):
+    from app.config import settings
+    from app.database import SessionLocal
+    from app.routers.job import job_queue
+    from conftest import spool
+
+    monkeypatch.setattr(settings, "job_workers", 2)
+    monkeypatch.setattr(settings, "job_poll_interval", 0.05)
+
+    async def drain():
+        job_queue.start()
+        try:
+            with SessionLocal() as db:
+                jobs = [await job_queue.enqueue(db, await spool(image())) for _ in range(3)]
+                ids = [job.id for job in jobs]
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                statuses = [client.get(f"/jobs/{job_id}").json()["status"] for job_id in ids]
+                if statuses == ["done"] * 3:
+                    return
+                await asyncio.sleep(0.05)
+            raise AssertionError(f"Jobs not drained: {statuses}")
+        finally:
+            await job_queue.stop()
+
+    asyncio.run(drain())
+    assert extractor.calls == 3
+
+def test_failed_job_removes_its_upload(client, extractor, image):
+    extractor.result = {**VALID_INVOICE, "invoice_date": None}
+    job = submit(client, image())
+    path = stored_path(job)
+    assert os.path.exists(path)
+
+    run_next_job()
+    finished = client.get(f"/jobs/{job['id']}").json()
+    assert finished["status"] == "failed"
+    assert not os.path.exists(path)
+
+def test_failed_reprocess_keeps_the_invoice_file(client, extractor, image):
+    content = image()
+    submit(client, content)
+    run_next_job()
+
+    extractor.result = ValueError("Unreadable invoice")
+    job = submit(client, content, force_reprocess="true")
+    run_next_job()
+    assert client.get(f"/jobs/{job['id']}").json()["status"] == "failed"
+    assert os.path.exists(stored_path(job))
+
+def test_stale_jobs_are_requeued_or_failed(client, extractor, image, monkeypatch):
+    from app.config import settings
+    from app.database import SessionLocal
+    from app.models.job import ExtractionJob
+    from app.services.job_service import _claim_next_job, _requeue_stale_jobs
+
+    retried, exhausted = submit(client, image()), submit(client, image())
+    for _ in range(2):
+        _claim_next_job()
+    with SessionLocal() as db:
+        db.get(ExtractionJob, exhausted["id"]).attempts = settings.job_max_attempts
+        db.commit()
+
+    monkeypatch.setattr(settings, "job_timeout_seconds", -1)
+    _requeue_stale_jobs()
+
+    assert client.get(f"/jobs/{retried['id']}").json()["status"] == "queued"
+    failed = client.get(f"/jobs/{exhausted['id']}").json()
+    assert failed["status"] == "failed"
+    assert failed["error"] == "Job timed out"
+    assert not os.path.exists(stored_path(exhausted))
+
+def test_deleting_an_invoice_keeps_a_file_a_job_needs(client, extractor, image):
+    content = image()
+    submit(client, content)
+    run_next_job()
+    invoice_id = client.get("/invoices/").json()[0]["id"]
+
+    job = submit(client, content, force_reprocess="true")
+    assert client.delete(f"/invoices/{invoice_id}").status_code == 200
+    assert os.path.exists(stored_path(job))
+
+    run_next_job()
+    assert client.get(f"/jobs/{job['id']}").json()["status"] == "done"
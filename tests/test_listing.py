@@ -0,0 +1,92 @@
+from datetime import date, timedelta
+import uuid
+
+def add_invoices(dates: list) -> list[int]:
+    """Insert invoices directly, one per date (None for an undated one); returns their ids"""
+    from app.database import SessionLocal
+    from app.models.invoice import Invoice
+
+    with SessionLocal() as db:
+        invoices = [
+            Invoice(
+                file_hash=uuid.uuid4().hex * 2,
+                file_path=f"uploads/{uuid.uuid4().hex}.png",
+                store_name="Alfamart" if n % 2 else "Indomaret",
+                invoice_date=invoice_date,
+                total=1000.0 * (n + 1),
+                details=[]
+            )
+            for n, invoice_date in enumerate(dates)
+        ]
+        db.add_all(invoices)
+        db.commit()
+        return [invoice.id for invoice in invoices]
+
+def list_all(client, **params) -> list[dict]:
+    """Follow X-Next-Cursor through every page"""
+    rows, cursor = [], None
+    while True:
+        response = client.get("/invoices/", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        rows += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return rows
+
+def test_undated_invoices_do_not_break_the_cursor(client, extractor):
+    start = date(2025, 1, 1)
+    add_invoices([None, start, None, start + timedelta(days=1), start, None])
+
+    for params in ({"limit": 1}, {"limit": 4}, {"limit": 4, "fields": "id,invoice_date"}):
+        rows = list_all(client, **params)
+        assert [row["invoice_date"] for row in rows] == ["2025-01-02", "2025-01-01", "2025-01-01"]
+        assert rows[1]["id"] > rows[2]["id"]
+
+def test_cursor_pages_cover_every_invoice_in_order(client, extractor):
+    start = date(2025, 1, 1)
+    ids = add_invoices([start + timedelta(days=n % 7) for n in range(25)])
+
+    rows = list_all(client, limit=4)
+    assert sorted(row["id"] for row in rows) == sorted(ids)
+    keys = [(row["invoice_date"], row["id"]) for row in rows]
+    assert keys == sorted(keys, reverse=True)
+    assert rows == client.get("/invoices/", params={"limit": 1000}).json()
+
+def test_filters_fields_and_next_link(client, extractor):
+    start = date(2025, 1, 1)
+    add_invoices([start + timedelta(days=n) for n in range(10)])
+
+    response = client.get("/invoices/", params={
+        "store": "Alfamart", "start_date": "2025-01-03", "end_date": "2025-01-08",
+        "fields": "id,store_name,invoice_date", "limit": 2
+    })
+    assert response.status_code == 200
+    rows = response.json()
+    assert [set(row) for row in rows] == [{"id", "store_name", "invoice_date"}] * 2
+    assert [row["invoice_date"] for row in rows] == ["2025-01-08", "2025-01-06"]
+
+    next_url = response.headers["Link"].split(">")[0].lstrip("<")
+    rows = client.get(next_url).json()
+    assert [row["invoice_date"] for row in rows] == ["2025-01-04"]
+
+    assert client.get("/invoices/", params={"fields": "id,secret"}).status_code == 400
+    assert client.get("/invoices/", params={"cursor": "not-a-cursor"}).status_code == 400
+
+def test_unchanged_page_is_not_modified(client, extractor):
+    add_invoices([date(2025, 1, 1), date(2025, 1, 2)])
+
+    first = client.get("/invoices/")
+    tag = first.headers["ETag"]
+    cached = client.get("/invoices/", headers={"If-None-Match": f'W/{tag}, "other"'})
+    assert cached.status_code == 304 and cached.content == b""
+    assert cached.headers["ETag"] == tag
+
+    add_invoices([date(2025, 1, 3)])
+    changed = client.get("/invoices/", headers={"If-None-Match": tag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != tag and len(changed.json()) == 3
+
+def test_cursor_round_trip():
+    from app.utils.pagination import decode_cursor, encode_cursor
+
+    assert decode_cursor(encode_cursor(date(2025, 3, 14), 42)) == (date(2025, 3, 14), 42)
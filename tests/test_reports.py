@@ -0,0 +1,48 @@
+import os
+import time
+
+from conftest import upload
+
+REQUEST = {"start_date": "2025-03-01", "end_date": "2025-03-31", "report_type": "monthly"}
+
+def wait_for_job(client, job_id: str) -> dict:
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        job = client.get(f"/reports/jobs/{job_id}").json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f"Report job {job_id} did not finish")
+
+def test_cached_report_is_served_from_disk(client, extractor, image):
+    upload(client, image())
+
+    first = client.post("/reports/generate", json=REQUEST)
+    second = client.post("/reports/generate", json=REQUEST)
+    assert first.status_code == second.status_code == 200
+    assert first.headers["X-Report-Cache"] == "miss"
+    assert second.headers["X-Report-Cache"] == "hit"
+    assert first.content.startswith(b"%PDF") and first.content == second.content
+
+def test_disabled_cache_leaves_other_reports_alone(client, extractor, image, monkeypatch):
+    from app.routers.report import report_cache
+
+    monkeypatch.setattr(report_cache, "max_bytes", 0)
+    upload(client, image())
+    os.makedirs(report_cache.cache_dir, exist_ok=True)
+    cached = set(os.listdir(report_cache.cache_dir))
+
+    job = client.post("/reports/jobs", json=REQUEST).json()
+    assert wait_for_job(client, job["id"])["status"] == "done"
+
+    # Rendering another report neither evicts the job's PDF nor leaves a file behind
+    response = client.post("/reports/generate", json={**REQUEST, "report_type": "yearly"})
+    assert response.status_code == 200
+    assert response.content.startswith(b"%PDF")
+    assert set(os.listdir(report_cache.cache_dir)) == cached
+    assert not [name for name in os.listdir(os.path.dirname(report_cache.cache_dir)) if name.endswith(".tmp")]
+
+    download = client.get(f"/reports/jobs/{job['id']}/download")
+    assert download.status_code == 200
+    assert download.content.startswith(b"%PDF")
+    assert client.get(f"/reports/jobs/{job['id']}/download").status_code == 410
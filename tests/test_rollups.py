@@ -0,0 +1,56 @@
+from conftest import VALID_INVOICE, upload
+
+def verify():
+    from app.database import SessionLocal
+    from app.services.rollup_service import RollupService
+
+    with SessionLocal() as db:
+        return RollupService.verify(db)
+
+def summary(client, **params) -> dict:
+    response = client.get("/reports/summary", params={"start_date": "2025-01-01", "end_date": "2025-12-31", **params})
+    assert response.status_code == 200
+    return response.json()
+
+def test_rollups_follow_uploads_reprocessing_and_deletes(client, extractor, image):
+    extractor.result = {**VALID_INVOICE, "store_name": "Alfamart", "invoice_date": "2025-02-10"}
+    alfamart = upload(client, image()).json()
+    extractor.result = VALID_INVOICE
+    content = image()
+    indomaret = upload(client, content).json()
+    assert verify() == []
+
+    totals = summary(client)["totals"]
+    assert totals["invoices"] == 2 and totals["stores"] == 2 and totals["items"] == 4
+    assert totals["total"] == 2 * VALID_INVOICE["total"]
+    assert [row["period"] for row in summary(client)["periods"]] == ["2025-02", "2025-03"]
+
+    # Reprocessing moves the invoice to its new date and store
+    extractor.result = {**VALID_INVOICE, "store_name": "Alfamart", "invoice_date": "2025-02-11", "total": 1000.0}
+    upload(client, content, force_reprocess="true")
+    assert verify() == []
+    stores = summary(client)["stores"]
+    assert [(row["store_name"], row["invoices"]) for row in stores] == [("Alfamart", 2)]
+    assert summary(client, group_by="day")["totals"]["total"] == VALID_INVOICE["total"] + 1000.0
+
+    client.delete(f"/invoices/{indomaret['id']}")
+    client.delete(f"/invoices/{alfamart['id']}")
+    assert verify() == []
+    assert summary(client)["totals"]["invoices"] == 0
+
+def test_rebuild_repairs_drifted_rollups(client, extractor, image):
+    from app.database import SessionLocal
+    from app.models.rollup import StoreDailyRollup
+    from app.services.rollup_service import RollupService
+
+    upload(client, image())
+    with SessionLocal() as db:
+        db.query(StoreDailyRollup).update({"total": StoreDailyRollup.total + 1})
+        db.commit()
+    problems = verify()
+    assert len(problems) == 1 and "store_daily" in problems[0]
+
+    with SessionLocal() as db:
+        assert RollupService.rebuild(db) == (1, 2)
+    assert verify() == []
+    assert summary(client)["totals"]["total"] == VALID_INVOICE["total"]
@@ -0,0 +1,70 @@
+from datetime import date
+
+from app.utils.trigram_index import TrigramIndex, normalize, trigrams
+from app.services.search_service import InvoiceSearchIndex
+from conftest import VALID_INVOICE, upload
+
+def test_trigrams_are_padded_per_word():
+    assert normalize("  Minyak-Goreng, 2L ") == "minyak goreng 2l"
+    assert trigrams("ab") == {"  a", " ab", "ab "}
+    assert trigrams("!!") == set()
+
+def test_typos_and_partial_names_match():
+    index = TrigramIndex()
+    index.add(1, ["Indomaret"])
+    index.add(2, ["Alfamart"])
+    index.add(3, ["Minyak Goreng 2L", "Gula Pasir 1kg"])
+
+    assert set(index.search("indomart", 0.6)) == {1}
+    assert index.search("minyak", 0.6) == {3: 1.0}
+    assert index.search("GULA", 0.6) == {3: 1.0}
+    assert index.search("xyz", 0.1) == {}
+    assert index.search("", 0.0) == {}
+
+def test_each_key_keeps_its_best_score_and_can_be_removed():
+    index = TrigramIndex()
+    index.add("a", ["Indomaret", "Indomaret Point"])
+    index.add("b", ["Indomaret"])
+    assert index.term_count == 2
+    assert index.search("indomaret point", 0.5) == {"a": 1.0, "b": 10 / 16}
+
+    index.remove("a")
+    assert set(index.search("indomaret", 0.6)) == {"b"}
+
+def test_invoice_index_ranks_and_filters_by_date():
+    index = InvoiceSearchIndex()
+    index.add(1, date(2025, 1, 5), "Indomaret", ["Minyak Goreng 2L"])
+    index.add(2, date(2025, 2, 5), "Indomaret", ["Minyak Goreng 1L"])
+    index.add(3, date(2025, 3, 5), "Alfamart", ["Minyak Goreng 2L"])
+    index.add(4, None, "Indomaret", ["Beras 5kg"])
+
+    page, total = index.search(store="indomaret", product="minyak")
+    assert total == 2
+    # Equal scores: newest first
+    assert [invoice_id for invoice_id, _ in page] == [2, 1]
+
+    page, total = index.search(product="minyak goreng", start_date=date(2025, 2, 1))
+    assert {invoice_id for invoice_id, _ in page} == {2, 3} and total == 2
+    page, total = index.search(store="indomaret", limit=1, skip=1)
+    assert len(page) == 1 and total == 3
+
+    index.remove(2)
+    assert 2 not in index and len(index) == 3
+
+def test_search_endpoint(client, extractor, image):
+    extractor.result = {**VALID_INVOICE, "store_name": "Alfamart"}
+    alfamart = upload(client, image()).json()
+    extractor.result = VALID_INVOICE
+    indomaret = upload(client, image()).json()
+
+    response = client.get("/invoices/search", params={"store": "indomart"})
+    assert response.status_code == 200
+    assert response.json()["total"] == 1
+    assert response.json()["results"][0]["id"] == indomaret["id"]
+
+    results = client.get("/invoices/search", params={"product": "gula pasir"}).json()["results"]
+    assert {result["id"] for result in results} == {alfamart["id"], indomaret["id"]}
+
+    client.delete(f"/invoices/{alfamart['id']}")
+    assert client.get("/invoices/search", params={"store": "alfamart"}).json()["total"] == 0
+    assert client.get("/invoices/search").status_code == 400
@@ -0,0 +1,135 @@
+import asyncio
+
+from conftest import VALID_INVOICE, spool, upload
+
+def test_bad_extraction_stores_nothing(client, extractor, image):
+    extractor.result = {**VALID_INVOICE, "invoice_date": "14/03/2025"}
+    content = image()
+
+    response = upload(client, content)
+    assert response.status_code == 422
+
+    listing = client.get("/invoices/")
+    assert listing.status_code == 200
+    assert listing.json() == []
+
+    # The failed write left nothing behind, not even the lease
+    extractor.result = VALID_INVOICE
+    response = upload(client, content)
+    assert response.status_code == 200
+    assert response.json()["invoice_date"] == "2025-03-14"
+    assert len(client.get("/invoices/").json()) == 1
+
+def test_concurrent_uploads_are_coalesced(client, extractor, service, image):
+    from app.database import SessionLocal
+
+    content = image()
+    extractor.delay = 0.2
+
+    async def upload_all():
+        async def one():
+            spooled = await spool(content)
+            with SessionLocal() as db:
+                return await service.process(db, spooled)
+        return await asyncio.gather(*(one() for _ in range(5)))
+
+    responses = asyncio.run(upload_all())
+    assert extractor.calls == 1
+    assert len({response.id for response in responses}) == 1
+    assert sum(not response.is_cached for response in responses) == 1
+
+def test_repeat_upload_is_cached(client, extractor, image):
+    content = image()
+    first = upload(client, content)
+    second = upload(client, content)
+    assert first.status_code == second.status_code == 200
+    assert not first.json()["is_cached"]
+    assert second.json()["is_cached"]
+    assert first.json()["id"] == second.json()["id"]
+    assert extractor.calls == 1
+
+def test_forced_reprocess_extracts_again(client, extractor, image):
+    content = image()
+    first = upload(client, content)
+    extractor.result = {**VALID_INVOICE, "total": 30000.0}
+    second = upload(client, content, force_reprocess="true")
+    assert second.status_code == 200
+    assert second.json()["id"] == first.json()["id"]
+    assert second.json()["total"] == 30000.0
+    assert extractor.calls == 2
+
+def test_failed_reprocess_keeps_the_stored_invoice(client, extractor, image):
+    from app.database import SessionLocal
+    from app.services.rollup_service import RollupService
+
+    content = image()
+    first = upload(client, content).json()
+
+    extractor.result = {**VALID_INVOICE, "total": "twenty"}
+    response = upload(client, content, force_reprocess="true")
+    assert response.status_code == 422
+
+    assert client.get(f"/invoices/{first['id']}").json()["total"] == VALID_INVOICE["total"]
+    with SessionLocal() as db:
+        assert RollupService.verify(db) == []
+
+def test_claims_are_exclusive_until_released_or_expired(client, extractor):
+    from app.database import SessionLocal
+    from app.services.claim_service import ClaimService
+
+    file_hash = "c" * 64
+    with SessionLocal() as db:
+        assert ClaimService.claim(db, file_hash, "first", 60) == (True, False)
+        assert ClaimService.claim(db, file_hash, "second", 60) == (False, False)
+        # Only the holder can release it
+        ClaimService.release(db, file_hash, "second")
+        assert ClaimService.claim(db, file_hash, "second", 60) == (False, False)
+        ClaimService.release(db, file_hash, "first")
+        assert ClaimService.claim(db, file_hash, "second", -1) == (True, False)
+        # The holder died: its lease ran out, so the next worker takes it over
+        assert ClaimService.claim(db, file_hash, "third", 60) == (True, True)
+        ClaimService.release(db, file_hash, "third")
+
+def test_upload_waits_for_another_process_holding_the_lease(client, extractor, service, image, monkeypatch):
+    from app.config import settings
+    from app.database import SessionLocal
+    from app.services.claim_service import ClaimService
+    from app.services.invoice_service import InvoiceService
+
+    monkeypatch.setattr(settings, "upload_claim_poll_seconds", 0.02)
+    content = image()
+    other_process = InvoiceService(extractor)
+    other_process.claim_owner = "other-process"
+
+    async def race():
+        spooled = await spool(content)
+        with SessionLocal() as db:
+            ClaimService.claim(db, spooled.file_hash, other_process.claim_owner, 60)
+        waiting = asyncio.ensure_future(process(service, spooled))
+        await asyncio.sleep(0.1)
+        assert not waiting.done()
+
+        # The other process stores the invoice and releases its lease
+        stored = await store_under_lease(other_process, await spool(content))
+        return stored, await waiting
+
+    stored, coalesced = asyncio.run(race())
+    assert extractor.calls == 1
+    assert coalesced.id == stored.id and coalesced.is_cached
+
+async def process(service, spooled):
+    from app.database import SessionLocal
+
+    with SessionLocal() as db:
+        return await service.process(db, spooled)
+
+async def store_under_lease(service, spooled):
+    """Extract and store as the holder of the lease does, then release it"""
+    from app.database import SessionLocal
+    from app.services.invoice_service import _release_claim
+
+    try:
+        with SessionLocal() as db:
+            return await service._extract_and_store(db, spooled, use_caches=True)
+    finally:
+        _release_claim(spooled.file_hash, service.claim_owner)